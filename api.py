@@ -1,3 +1,4 @@
+import time
 import tracemalloc
 import quart
 from core import app, response, route, setup_logger, FunctionError
@@ -14,8 +15,12 @@ import core
 import json5
 from state import load_state
 import typing as t
-from redis.asyncio import Redis
+from utils.redis_topology import create_redis
 from utils.database import AutoConnection, create_pool
+from utils.pool_budget import pool_budget
+from utils.replicas import replicas
+from utils.query_budget import query_budgets
+from utils import db_metrics
 
 
 debug = os.getenv('DEBUG') == 'True'
@@ -24,6 +29,7 @@ logger = setup_logger()
 with open("config/endpoints.json5", 'r') as f:
     endpoints_data: dict = json5.load(f)
     endpoints_data = flatten_dict(endpoints_data)
+    query_budgets.configure(endpoints_data)
 
 
 async def log_error_to_file(message: str, file: str):
@@ -270,12 +276,16 @@ async def startup():
     redis_host = os.environ["REDIS_HOST"]
     redis_port = os.environ["REDIS_PORT"]
     url = f"redis://{redis_host}:{redis_port}"
-    redis = Redis(host=redis_host, port=int(redis_port))
+    redis = create_redis()
 
     load_state(pool, redis)
     load()
+    asyncio.create_task(pool_budget.balance(redis))
+    asyncio.create_task(replicas.monitor())
+    asyncio.create_task(db_metrics.publish(redis))
 
     await cache.Cache(url).init()
+    await warm_up_cache()
     start_scheduler()
 
     logger.info("Worker started!")
@@ -283,10 +293,33 @@ async def startup():
         logger.info("__debug__ is True")
 
 
+async def warm_up_cache() -> None:
+    if cache.warmup_budget <= 0:
+        return
+
+    started = time.perf_counter()
+    try:
+        async with AutoConnection(pool) as conn:
+            await asyncio.wait_for(
+                cache.warm_up(conn), cache.warmup_budget
+            )
+    except TimeoutError:
+        logger.warning("Cache warm-up ran out of its time budget")
+        return
+    except Exception:
+        # Best-effort, the worker serves from a cold cache instead
+        logger.exception("Cache warm-up failed")
+        return
+
+    took = (time.perf_counter() - started) * 1000
+    logger.info(f"Cache warmed up in {took:.0f}ms")
+
+
 @app.after_serving
 async def shutdown():
     global pool
     await pool.close()
+    await replicas.close()
 
     worker_id = get_proc_identity()
     if worker_id != 0:
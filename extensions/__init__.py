@@ -7,6 +7,7 @@ from extensions.users import load as load_users
 from extensions.reports import load as load_reports
 from extensions.moderation import load as load_moderation
 from extensions.chat import load as load_chat
+from extensions.admin import load as load_admin
 import typing as t
 from logging import getLogger
 
@@ -18,7 +19,8 @@ __all__ = [
     "load_notifs", "load_posts",
     "load_storage",
     "load_users", "load_reports",
-    "load_moderation", "load_chat"
+    "load_moderation", "load_chat",
+    "load_admin"
 ]
 
 
@@ -0,0 +1,53 @@
+from quart import Blueprint, Quart, Response
+from core import response, route, FunctionError
+from quart import g
+from utils.database import AutoConnection
+from utils.users import Permission, check_permission
+from utils.rate_limiting import rate_limit
+import utils.cache as cache
+from utils import db_metrics
+from state import pool, redis
+
+bp = Blueprint('admin', __name__)
+
+
+async def require_admin(conn: AutoConnection) -> None:
+    if not await check_permission(g.user_id, Permission.ADMIN_PANEL, conn):
+        raise FunctionError("FORBIDDEN", 403, None)
+
+
+@route(bp, "/admin/cache/stats", methods=["GET"])
+@rate_limit(30, 60)
+async def cache_stats() -> tuple[Response, int]:
+    async with AutoConnection(pool) as conn:
+        await require_admin(conn)
+
+    workers = await cache.get_stats()
+
+    return response(data={"workers": workers}), 200
+
+
+@route(bp, "/admin/cache/hot-keys", methods=["GET"])
+@rate_limit(30, 60)
+async def cache_hot_keys() -> tuple[Response, int]:
+    async with AutoConnection(pool) as conn:
+        await require_admin(conn)
+
+    keys = await cache.get_hot_keys()
+
+    return response(data={"keys": keys}), 200
+
+
+@route(bp, "/admin/db/stats", methods=["GET"])
+@rate_limit(30, 60)
+async def db_stats() -> tuple[Response, int]:
+    async with AutoConnection(pool) as conn:
+        await require_admin(conn)
+
+    workers = await db_metrics.get_stats(redis)
+
+    return response(data={"workers": workers}), 200
+
+
+def load(app: Quart):
+    app.register_blueprint(bp)
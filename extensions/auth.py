@@ -4,6 +4,7 @@ from core import response, route, FunctionError
 from quart import g, request
 import utils.auth as auth
 from utils.cache import auth as auth_cache
+from utils.cache import users as cache_users
 from utils.database import AutoConnection
 from utils.rate_limiting import ip_rate_limit, rate_limit
 from utils.email import create_token, new_code, verify_token
@@ -46,6 +47,8 @@ async def register() -> tuple[Response, int]:
         result2 = await auth.create_user(username, email, password, conn)
         result3 = await auth.create_token(result2, conn)
 
+    await cache_users.delete_user_cache(result2)
+
     return response(data=result3), 201
 
 
@@ -113,9 +116,7 @@ async def logout() -> tuple[Response, int]:
 @rate_limit(45, 60)
 async def get_auth_me() -> tuple[Response, int]:
     async with AutoConnection(pool) as conn:
-        user = await auth.get_user(g.user_id, conn)
-        user_dict = user.dict
-        del user_dict["password_hash"]
+        user_dict = await auth_cache.get_auth_me(g.user_id, conn)
 
     return response(data=user_dict, cache=True), 200
 
@@ -164,6 +165,8 @@ async def check_verification() -> tuple[Response, int]:
             raise FunctionError("EMAIL_HAS_CHANGED", 400, None)
         await auth.set_email_verified(g.user_id, True, conn)
 
+    await cache_users.delete_user_cache(g.user_id)
+
     return response(is_empty=True), 204
 
 
@@ -190,6 +193,7 @@ async def change_password() -> tuple[Response, int]:
     )
 
     await auth_cache.clear_all_tokens(g.user_id)
+    await cache_users.delete_user_cache(g.user_id)
 
     return response(is_empty=True), 204
 
@@ -267,6 +271,8 @@ async def change_email_check() -> tuple[Response, int]:
             await auth.set_email(g.user_id, email, conn)
             await auth.set_email_verified(g.user_id, True, conn)
 
+    await cache_users.delete_user_cache(g.user_id)
+
     return response(data={
         "pending_until": pending_until
     }), 200
@@ -283,6 +289,8 @@ async def change_email_cancel() -> tuple[Response, int]:
             conn
         )
 
+    await cache_users.delete_user_cache(g.user_id)
+
     return response(is_empty=True), 204
 
 
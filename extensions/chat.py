@@ -27,18 +27,24 @@ POST /user/<id>/messages     -> Create channel and message
 async def get_user_channels() -> tuple[Response, int]:
     async with AutoConnection(pool) as conn:
         result = await chat.get_user_channels(g.user_id, conn)
-        for channel in result:
-            if channel["type"] == "direct":
-                member_ids = channel["members"]
-                channel["members"] = []
-                for member_id in member_ids:
-                    if member_id == g.user_id:
-                        continue
-                    user = await cache_users.get_user(
-                        member_id, conn,
-                        minimize_info=True
-                    )
-                    channel["members"].append(user.dict)  # type: ignore
+        direct = [
+            channel for channel in result if channel["type"] == "direct"
+        ]
+        member_ids = {
+            member_id
+            for channel in direct
+            for member_id in channel["members"]
+            if member_id != g.user_id
+        }
+        users = await cache_users.get_users(
+            list(member_ids), conn, minimize_info=True
+        )
+        for channel in direct:
+            channel["members"] = [
+                users[member_id].dict  # type: ignore
+                for member_id in channel["members"]
+                if member_id in users
+            ]
 
     return response(data={
         "channels": result
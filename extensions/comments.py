@@ -5,6 +5,7 @@ from realtime.notifs import publish_notification
 import utils.posts as posts
 import utils.comments as comments
 from utils.cache import posts as cache_posts
+from utils.cache import comments as cache_comments
 from utils.database import AutoConnection
 import utils.combined as combined
 from schemas import NotificationType
@@ -32,12 +33,13 @@ async def create_comment(id: str) -> tuple[Response, int]:
             raise FunctionError("FORBIDDEN", 403, None)
 
         if parent_id:
-            comment = await comments.get_comment(id, parent_id, conn)
+            comment = await cache_comments.get_comment(id, parent_id, conn)
             notif_to = comment.user_id
 
         result = await comments.create_comment(
             g.user_id, id, content, conn, type, parent_id
         )
+        await cache_comments.remove_comment_cache(id, result.comment_id)
         if notif_to:
             await publish_notification(
                 g.user_id, notif_to, NotificationType.NEW_COMMENT,
@@ -208,7 +210,7 @@ async def comment_add_reaction(id: str, cid: str) -> tuple[Response, int]:
 
     async with AutoConnection(pool) as conn:
         await cache_posts.get_post(id, conn)
-        await comments.get_comment(id, cid, conn)
+        await cache_comments.get_comment(id, cid, conn)
         await posts.add_reaction(g.user_id, is_like, id, cid, conn)
 
     return response(), 204
@@ -219,7 +221,7 @@ async def comment_add_reaction(id: str, cid: str) -> tuple[Response, int]:
 async def comment_rem_reaction(id: str, cid: str) -> tuple[Response, int]:
     async with AutoConnection(pool) as conn:
         await cache_posts.get_post(id, conn)
-        await comments.get_comment(id, cid, conn)
+        await cache_comments.get_comment(id, cid, conn)
         await posts.rem_reaction(g.user_id, id, cid, conn)
 
     return response(), 204
@@ -14,6 +14,7 @@ from utils.users import Permission, check_permission
 from utils.moderation import create_log, log_metadata
 from schemas import NotificationType
 from state import pool
+from queues.post_views import enqueue_views
 
 bp = Blueprint('posts', __name__)
 
@@ -70,11 +71,8 @@ async def new_posts() -> tuple[Response, int]:
 @rate_limit(6000, 60, 300, 60)
 async def view_posts() -> tuple[Response, int]:
     data = g.data
-    posts = data["posts"]
-    user_id = g.user_id
-
-    async with AutoConnection(pool) as conn:
-        await posts_list.mark_posts_as_viewed(user_id, posts, conn)
+    # Written to the database in batches by queues.post_views
+    await enqueue_views(g.user_id, data["posts"])
 
     return response(), 204
 
@@ -96,6 +94,9 @@ async def create_post() -> tuple[Response, int]:
             g.user_id, content, conn, tags, file_context_id, ctags
         )
 
+    if result:
+        await cache_posts.remove_post_cache(result["post_id"])
+
     return response(data=result or {}), 201
 
 
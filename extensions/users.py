@@ -3,8 +3,8 @@ from core import FunctionError, response, route
 from quart import g
 import utils.users as users
 import utils.posts as posts
-import utils.comments as comments
 from utils.cache import users as cache_users
+from utils.cache import comments as cache_comments
 from utils.database import AutoConnection
 import utils.combined as combined
 import typing as t
@@ -20,11 +20,7 @@ async def get_profile_me() -> tuple[Response, int]:
     user_id = g.user_id
 
     async with AutoConnection(pool) as conn:
-        user = await users.get_user(user_id, conn)
-        user_dict = user.dict
-        user_dict["permissions"] = users.permissions_to_list(
-            users.ROLES[user.role_id]
-        )
+        user_dict = await cache_users.get_user_me(user_id, conn)
 
     return response(data=user_dict, cache=True), 200
 
@@ -50,7 +46,7 @@ async def validate_post_or_comment(
     conn: AutoConnection
 ) -> None:
     if comment_id:
-        await comments.get_comment(post_id, comment_id, conn)
+        await cache_comments.get_comment(post_id, comment_id, conn)
     else:
         await posts.get_post(post_id, conn)
 
@@ -193,6 +189,9 @@ async def follow_user(target_id: str) -> tuple[Response, int]:
     async with AutoConnection(pool) as conn:
         await cache_users.get_user(target_id, conn, True)
         await users.follow(g.user_id, target_id, conn)
+    # Cached profiles and /me views of both carry the follow counts
+    await cache_users.delete_user_cache(g.user_id)
+    await cache_users.delete_user_cache(target_id)
 
     return response(is_empty=True), 204
 
@@ -203,6 +202,9 @@ async def unfollow_user(target_id: str) -> tuple[Response, int]:
     async with AutoConnection(pool) as conn:
         await cache_users.get_user(target_id, conn, True)
         await users.unfollow(g.user_id, target_id, conn)
+    # Cached profiles and /me views of both carry the follow counts
+    await cache_users.delete_user_cache(g.user_id)
+    await cache_users.delete_user_cache(target_id)
 
     return response(is_empty=True), 204
 
@@ -1,5 +1,6 @@
-from utils.database import initialize_database
+from utils.migrations import migrate, MigrationError
 from core import setup_logger
+import argparse
 import asyncio
 import json
 import asyncpg
@@ -8,14 +9,29 @@ logger = setup_logger()
 
 
 async def main():
-    logger.info("Running PostgreSQL init scripts")
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--reapply-changed", action="store_true",
+        help="re-run applied migrations whose files were changed"
+    )
+    args = parser.parse_args()
+
+    logger.info("Running PostgreSQL migrations")
     with open("config/postgres.json") as f:
         config = json.load(f)
         config.pop("max_shared", None)
+        config.pop("replicas", None)
     conn = await asyncpg.connect(**config)
-    await initialize_database(conn, debug=True)
-    await conn.close()
-    logger.info("Done!")
+    try:
+        applied = await migrate(
+            conn, debug=True, reapply_changed=args.reapply_changed
+        )
+    except MigrationError as e:
+        logger.error(e)
+        raise SystemExit(1)
+    finally:
+        await conn.close()
+    logger.info(f"Done! Applied {applied} migrations")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,174 @@
+"""Online migration of snowflake TEXT keys to BIGINT columns
+
+Every step is idempotent and safe to run while the API is serving:
+
+    expand    adds the BIGINT columns and the dual-write triggers
+    backfill  fills existing rows in small batches
+    index     builds the unique indexes CONCURRENTLY
+    verify    checks that every row matches its TEXT key
+    finalize  sets NOT NULL without a full-table lock and drops the
+              old `key::bigint` expression indexes
+    all       everything above, in order
+
+    python migrate_keys.py all --batch 5000 --pause 0.05
+
+init_db.py backfills whatever is left and drops the old indexes as
+well (16_bigint_keys_backfill), since the queries page on the BIGINT
+columns. Running backfill ahead of a deploy, throttled, keeps that
+migration from holding up startup on large tables.
+"""
+from core import setup_logger
+import argparse
+import asyncio
+import json
+import asyncpg
+
+logger = setup_logger()
+
+# table, TEXT key, BIGINT column
+KEYS = [
+    ("users", "user_id", "user_id_num"),
+    ("posts", "post_id", "post_id_num"),
+    ("comments", "comment_id", "comment_id_num"),
+    ("user_notifications", "id", "id_num"),
+    ("tags", "tag_id", "tag_id_num"),
+    ("messages", "message_id", "message_id_num"),
+]
+OLD_INDEXES = [
+    "users_id_num_idx", "profiles_id_num_idx", "notifications_id_num_idx",
+    "posts_id_num_idx", "comments_id_num_idx", "tag_id_num_idx",
+    "message_id_num_idx"
+]
+
+
+async def expand(db: asyncpg.Connection, args: argparse.Namespace) -> None:
+    with open("sql/06_bigint_keys.pgsql") as f:
+        await db.execute(f.read())
+    logger.info("Columns and triggers are in place")
+
+
+async def backfill(db: asyncpg.Connection, args: argparse.Namespace) -> None:
+    for table, key, num in KEYS:
+        # Keyset over the primary key, one short transaction per batch
+        query = f"""
+            WITH batch AS (
+                SELECT {key} FROM {table}
+                WHERE {key} > $1
+                ORDER BY {key}
+                LIMIT $2
+            ), updated AS (
+                UPDATE {table} t SET {num} = t.{key}::bigint
+                FROM batch b
+                WHERE t.{key} = b.{key} AND t.{num} IS NULL
+                RETURNING 1
+            )
+            SELECT max({key}), (SELECT count(*) FROM updated) FROM batch
+        """
+        last, total = "", 0
+        while True:
+            last, updated = await db.fetchrow(query, last, args.batch)
+            if last is None:
+                break
+            total += updated
+            await asyncio.sleep(args.pause)
+        logger.info(f"{table}: backfilled {total} rows")
+
+
+async def index(db: asyncpg.Connection, args: argparse.Namespace) -> None:
+    for table, key, num in KEYS:
+        name = f"{table}_{num}_key"
+        valid = await db.fetchval(
+            """
+            SELECT i.indisvalid FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = $1
+            """, name
+        )
+        if valid:
+            continue
+        if valid is False:
+            # Leftover of an interrupted concurrent build
+            await db.execute(f"DROP INDEX CONCURRENTLY {name}")
+        await db.execute(
+            f"CREATE UNIQUE INDEX CONCURRENTLY {name} ON {table} ({num})"
+        )
+        logger.info(f"{table}: built {name}")
+
+
+async def verify(db: asyncpg.Connection, args: argparse.Namespace) -> None:
+    failed = False
+    for table, key, num in KEYS:
+        mismatched = await db.fetchval(
+            f"SELECT count(*) FROM {table} "
+            f"WHERE {num} IS DISTINCT FROM {key}::bigint"
+        )
+        if mismatched:
+            failed = True
+            logger.error(f"{table}: {mismatched} rows don't match")
+        else:
+            logger.info(f"{table}: OK")
+    if failed:
+        raise SystemExit(1)
+
+
+async def finalize(db: asyncpg.Connection, args: argparse.Namespace) -> None:
+    await verify(db, args)
+    for table, key, num in KEYS:
+        check = f"{table}_{num}_not_null"
+        # A validated CHECK lets SET NOT NULL skip the table scan,
+        # VALIDATE itself doesn't block writes
+        await db.execute(
+            f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {check}"
+        )
+        await db.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {check} "
+            f"CHECK ({num} IS NOT NULL) NOT VALID"
+        )
+        await db.execute(
+            f"ALTER TABLE {table} VALIDATE CONSTRAINT {check}"
+        )
+        await db.execute(
+            f"ALTER TABLE {table} ALTER COLUMN {num} SET NOT NULL"
+        )
+        await db.execute(f"ALTER TABLE {table} DROP CONSTRAINT {check}")
+    for name in OLD_INDEXES:
+        await db.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    logger.info("Finalized")
+
+
+STEPS = {
+    "expand": expand,
+    "backfill": backfill,
+    "index": index,
+    "verify": verify,
+    "finalize": finalize
+}
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("step", choices=[*STEPS, "all"])
+    parser.add_argument("--batch", type=int, default=5000)
+    parser.add_argument("--pause", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with open("config/postgres.json") as f:
+        config = json.load(f)
+        config.pop("max_shared", None)
+        config.pop("replicas", None)
+    db = await asyncpg.connect(**config)
+    # Backfill batches are many small writes, don't wait for fsync
+    await db.execute("SET synchronous_commit = off")
+    # Lock waits must not queue up application queries behind DDL
+    await db.execute("SET lock_timeout = '5s'")
+    try:
+        steps = STEPS if args.step == "all" else [args.step]
+        for step in steps:
+            logger.info(f"Running {step}...")
+            await STEPS[step](db, args)
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
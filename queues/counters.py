@@ -0,0 +1,18 @@
+import os
+from utils.database import AutoConnection
+from state import pool
+
+# Deltas are folded into the stored counts this often (seconds),
+# right away again while a full batch was folded
+fold_interval = int(os.getenv("COUNTERS_FOLD_INTERVAL", "5"))
+FOLD_BATCH = 10_000
+
+
+async def fold_counters() -> bool:
+    async with AutoConnection(pool, primary=True) as conn:
+        db = await conn.create_conn()
+        async with db.transaction():
+            folded = await db.fetchval(
+                "SELECT fold_counter_deltas($1)", FOLD_BATCH
+            )
+    return folded >= FOLD_BATCH
@@ -1,4 +1,5 @@
 from utils.database import AutoConnection
+from utils.cache import users as cache_users
 from state import pool
 
 
@@ -25,4 +26,7 @@ async def confirm_pending_emails(batch_size: int = 1000) -> bool:
                 """,
                 batch_size,
             )
-            return len(updated_rows) != 0
+
+    for row in updated_rows:
+        await cache_users.delete_user_cache(row["user_id"])
+    return len(updated_rows) != 0
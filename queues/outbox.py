@@ -0,0 +1,255 @@
+import asyncio
+import os
+import time
+import typing as t
+from logging import getLogger
+import asyncpg
+import orjson
+from redis.exceptions import RedisError
+from core import get_proc_identity, server_id
+from utils import cache
+from utils.database import AutoConnection, connect_direct, pgbouncer_mode
+from queues.web_push import enqueue_push
+from realtime.broker import publish_event
+from state import pool, redis
+
+logger = getLogger("linkverse.outbox")
+
+STREAM_PREFIX = "outbox:"
+STREAM_MAXLEN = 100_000
+CONSUMER_NAME = f"worker_{get_proc_identity()}_{server_id}"
+CHANNEL = "outbox"
+LEADER_LOCK = "hashtext('outbox_relay_leader')"
+# Streams without a consumer any more (17_outbox_drop_posts_stream)
+RETIRED_STREAMS = ("posts",)
+
+# Without a NOTIFY the outbox is still checked this often (seconds),
+# behind PgBouncer there is no LISTEN and this is the only check
+relay_interval = float(os.getenv("OUTBOX_RELAY_INTERVAL", "5"))
+RELAY_BATCH = 1000
+CONSUMER_BATCH = 500
+# Workers that aren't relaying retry to take over this often (seconds)
+STANDBY_INTERVAL = 10
+# Entries left pending this long (ms) by a consumer that stopped, e.g.
+# a worker of a scaled down server, are taken over. Checked every
+# CLAIM_INTERVAL seconds.
+CLAIM_IDLE = 60_000
+CLAIM_INTERVAL = 30
+
+RELAY_QUERY = """
+DELETE FROM outbox
+WHERE id IN (
+    SELECT id FROM outbox
+    ORDER BY id
+    LIMIT $1
+)
+RETURNING id, stream, payload::text AS payload
+"""
+
+
+async def write_outbox(
+    stream: str, payload: dict[str, t.Any], conn: AutoConnection
+) -> None:
+    """Queues a change, delivered only if the transaction commits"""
+    db = await conn.create_conn()
+    await conn.start_transaction()
+    await db.execute(
+        "SELECT outbox_emit($1, $2)", stream, payload
+    )
+
+
+async def relay_batch(db: asyncpg.Connection) -> int:
+    async with db.transaction():
+        if not await db.fetchval(
+            "SELECT pg_try_advisory_xact_lock(hashtext('outbox_relay'))"
+        ):
+            return 0
+        rows = await db.fetch(RELAY_QUERY, RELAY_BATCH)
+        if rows:
+            # Added before the commit, a failure keeps the rows for the
+            # next batch. Ids follow insertion, not commit order.
+            pipe = redis.pipeline(transaction=False)
+            for row in sorted(rows, key=lambda row: row["id"]):
+                pipe.xadd(
+                    f"{STREAM_PREFIX}{row["stream"]}",
+                    {"id": row["id"], "payload": row["payload"]},
+                    maxlen=STREAM_MAXLEN, approximate=True
+                )
+            await pipe.execute()
+    return len(rows)
+
+
+async def relay_all(db: asyncpg.Connection) -> None:
+    while await relay_batch(db) >= RELAY_BATCH:
+        pass
+
+
+async def relay_vacant() -> bool:
+    """Whether no worker is relaying, checked on a pooled connection"""
+    async with AutoConnection(pool, primary=True) as conn:
+        db = await conn.create_conn()
+        return await db.fetchval(
+            f"SELECT CASE WHEN pg_try_advisory_lock({LEADER_LOCK}) "
+            f"THEN pg_advisory_unlock({LEADER_LOCK}) ELSE false END"
+        )
+
+
+async def relay_listening() -> None:
+    """Relays on every NOTIFY while this worker holds the relay lock"""
+    wake = asyncio.Event()
+
+    def notified(*_: t.Any) -> None:
+        wake.set()
+
+    # Standby workers only check, the leader's connection is held for
+    # its lifetime and kept out of the request budget
+    if not await relay_vacant():
+        return
+    db = await connect_direct()
+    try:
+        # Session lock, freed with the connection, one relay at a time
+        if not await db.fetchval(
+            f"SELECT pg_try_advisory_lock({LEADER_LOCK})"
+        ):
+            return
+        await db.add_listener(CHANNEL, notified)
+        while True:
+            wake.clear()
+            await relay_all(db)
+            try:
+                await asyncio.wait_for(wake.wait(), relay_interval)
+            except TimeoutError:
+                pass
+    finally:
+        await db.close()
+
+
+async def relay_worker() -> None:
+    try:
+        await redis.delete(
+            *(f"{STREAM_PREFIX}{stream}" for stream in RETIRED_STREAMS)
+        )
+    except RedisError as e:
+        logger.warning(f"Dropping retired outbox streams failed: {e}")
+
+    while True:
+        try:
+            if pgbouncer_mode:
+                async with AutoConnection(pool, primary=True) as conn:
+                    await relay_all(await conn.create_conn())
+                await asyncio.sleep(relay_interval)
+            else:
+                await relay_listening()
+                await asyncio.sleep(STANDBY_INTERVAL)
+        except asyncio.CancelledError:
+            break
+        except Exception as e:
+            if isinstance(e, (RedisError, OSError)):
+                logger.warning(f"Outbox relay failed: {e}")
+            else:
+                logger.exception(e)
+            await asyncio.sleep(5)
+
+
+# Handlers still invalidate directly for the request that made the
+# change, this is what makes sure it happens when they don't get to it
+# (crash, Redis error) and for changes made outside of handlers
+async def apply_cache(payloads: list[dict[str, t.Any]]) -> None:
+    tags = {payload["tag"] for payload in payloads if "tag" in payload}
+    keys = {payload["key"] for payload in payloads if "key" in payload}
+    for tag in tags:
+        await cache.cache_instance.invalidate_tag(tag)
+    for key in keys:
+        await cache.cache_instance.delete(key)
+
+
+async def apply_realtime(payloads: list[dict[str, t.Any]]) -> None:
+    for payload in payloads:
+        if payload.get("channel"):
+            await publish_event(payload["channel"], payload["data"])
+        if push := payload.get("push"):
+            await enqueue_push(push["user_id"], push["payload"])
+
+
+consumers: dict[
+    str, t.Callable[[list[dict[str, t.Any]]], t.Awaitable[None]]
+] = {
+    "cache": apply_cache,
+    "realtime": apply_realtime
+}
+
+
+async def claim_idle(stream_name: str, group_name: str) -> list[t.Any]:
+    _, entries, *_ = await redis.xautoclaim(
+        stream_name, group_name, CONSUMER_NAME,
+        min_idle_time=CLAIM_IDLE, count=CONSUMER_BATCH
+    )
+    # Entries trimmed from the stream come back empty, Redis 7 also
+    # drops them from the pending list
+    return [entry for entry in entries if entry[1] is not None]
+
+
+async def consume(
+    stream: str,
+    handler: t.Callable[[list[dict[str, t.Any]]], t.Awaitable[None]]
+) -> None:
+    stream_name = f"{STREAM_PREFIX}{stream}"
+    group_name = f"outbox_{stream}_group"
+    try:
+        await redis.xgroup_create(
+            stream_name,
+            group_name,
+            id='0',
+            mkstream=True
+        )
+    except Exception:
+        pass
+
+    # Entries this consumer read before a restart but never acked
+    last_id = "0"
+    claim_at = time.monotonic() + CLAIM_INTERVAL
+    while True:
+        try:
+            if time.monotonic() >= claim_at:
+                claim_at = time.monotonic() + CLAIM_INTERVAL
+                entries = await claim_idle(stream_name, group_name)
+            else:
+                msgs = await redis.xreadgroup(
+                    group_name,
+                    CONSUMER_NAME,
+                    {stream_name: last_id},
+                    count=CONSUMER_BATCH,
+                    block=int(relay_interval * 1000)
+                )
+                entries = [
+                    entry for _, batch in msgs or () for entry in batch
+                ]
+                if not entries:
+                    last_id = ">"
+                    continue
+                if last_id != ">":
+                    last_id = entries[-1][0].decode()
+            if not entries:
+                continue
+            await handler([
+                orjson.loads(data[b"payload"]) for _, data in entries
+            ])
+            await redis.xack(
+                stream_name, group_name, *(msg_id for msg_id, _ in entries)
+            )
+        except asyncio.CancelledError:
+            break
+        except Exception as e:
+            if isinstance(e, (RedisError, OSError)):
+                logger.warning(f"Outbox {stream} consumer failed: {e}")
+            else:
+                logger.exception(e)
+            # Unacked entries are retried from the pending list
+            last_id = "0"
+            await asyncio.sleep(5)
+
+
+def start_outbox() -> None:
+    asyncio.create_task(relay_worker())
+    for stream, handler in consumers.items():
+        asyncio.create_task(consume(stream, handler))
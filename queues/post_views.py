@@ -0,0 +1,153 @@
+import asyncio
+import os
+import time
+import typing as t
+from datetime import timedelta
+from logging import getLogger
+import orjson
+from redis.exceptions import RedisError
+from core import get_proc_identity, server_id
+from utils.database import AutoConnection
+from utils.posts_list import insert_post_views, views_retention_days
+from state import pool, redis
+
+logger = getLogger("linkverse.post_views")
+
+STREAM_NAME = "post_views_stream"
+GROUP_NAME = "post_views_group"
+CONSUMER_NAME = f"worker_{get_proc_identity()}_{server_id}"
+STREAM_MAXLEN = 1_000_000
+
+# Views are written at most this often (seconds), or as soon as a
+# batch of VIEWS_BATCH stream entries is waiting
+flush_interval = float(os.getenv("VIEWS_FLUSH_INTERVAL", "1"))
+VIEWS_BATCH = 2000
+# Weekly user_post_views partitions created in advance
+PARTITIONS_AHEAD = 4
+# Entries left pending this long (ms) by a consumer that stopped are
+# taken over, checked every CLAIM_INTERVAL seconds
+CLAIM_IDLE = 60_000
+CLAIM_INTERVAL = 30
+
+
+async def enqueue_views(user_id: str, post_ids: list[t.Any]) -> None:
+    entry: t.Any = {
+        "user_id": user_id,
+        "posts": orjson.dumps([str(post_id) for post_id in post_ids])
+    }
+    await redis.xadd(
+        STREAM_NAME, entry,
+        maxlen=STREAM_MAXLEN, approximate=True
+    )
+
+
+async def flush_views(entries: list[tuple[bytes, dict]]) -> int:
+    views: set[tuple[str, str]] = set()
+    for _, data in entries:
+        user_id = data[b"user_id"].decode()
+        for post_id in orjson.loads(data[b"posts"]):
+            views.add((user_id, post_id))
+
+    inserted = 0
+    if views:
+        user_ids, post_ids = map(list, zip(*views))
+        async with AutoConnection(pool) as conn:
+            inserted = await insert_post_views(user_ids, post_ids, conn)
+
+    # Acked only after the commit, replays are harmless because of
+    # ON CONFLICT DO NOTHING
+    await redis.xack(
+        STREAM_NAME, GROUP_NAME, *(msg_id for msg_id, _ in entries)
+    )
+    return inserted
+
+
+async def read_views(last_id: str) -> list[tuple[bytes, dict]]:
+    msgs = await redis.xreadgroup(
+        GROUP_NAME,
+        CONSUMER_NAME,
+        {STREAM_NAME: last_id},
+        count=VIEWS_BATCH,
+        block=int(flush_interval * 1000)
+    )
+    return [entry for _, entries in msgs or () for entry in entries]
+
+
+async def claim_views() -> list[tuple[bytes, dict]]:
+    _, entries, *_ = await redis.xautoclaim(
+        STREAM_NAME, GROUP_NAME, CONSUMER_NAME,
+        min_idle_time=CLAIM_IDLE, count=VIEWS_BATCH
+    )
+    # Entries trimmed from the stream come back empty
+    return [entry for entry in entries if entry[1] is not None]
+
+
+async def views_worker() -> None:
+    try:
+        await redis.xgroup_create(
+            STREAM_NAME,
+            GROUP_NAME,
+            id='0',
+            mkstream=True
+        )
+    except Exception:
+        pass
+
+    # Entries this consumer read before a restart but never acked
+    last_id = "0"
+    claim_at = time.monotonic() + CLAIM_INTERVAL
+    while True:
+        try:
+            if time.monotonic() >= claim_at:
+                claim_at = time.monotonic() + CLAIM_INTERVAL
+                if entries := await claim_views():
+                    await flush_views(entries)
+                continue
+            entries = await read_views(last_id)
+            if not entries:
+                last_id = ">"
+                continue
+            await flush_views(entries)
+            if last_id != ">":
+                last_id = entries[-1][0].decode()
+            elif len(entries) < VIEWS_BATCH:
+                await asyncio.sleep(flush_interval)
+        except asyncio.CancelledError:
+            break
+        except Exception as e:
+            if isinstance(e, (RedisError, OSError)):
+                logger.warning(f"Post views flush failed: {e}")
+            else:
+                logger.exception(e)
+            # Unacked entries are retried from the pending list
+            last_id = "0"
+            await asyncio.sleep(5)
+
+
+async def maintain_view_partitions() -> None:
+    """Creates upcoming weekly partitions, drops expired ones"""
+    async with AutoConnection(pool, primary=True) as conn:
+        db = await conn.create_conn()
+        async with db.transaction():
+            # Every worker schedules this, concurrent runs would race
+            # to create the same partitions
+            if not await db.fetchval(
+                "SELECT pg_try_advisory_xact_lock("
+                "hashtext('post_views_partitions'))"
+            ):
+                return
+            # Both take a lock on user_post_views, rather retry next
+            # run than queue feed queries behind a long one
+            await db.execute("SET LOCAL lock_timeout = '5s'")
+            created = await db.fetchval(
+                "SELECT create_post_views_partitions($1)", PARTITIONS_AHEAD
+            )
+            dropped = await db.fetch(
+                "SELECT drop_post_views_partitions($1)",
+                timedelta(days=views_retention_days)
+            )
+    if created or dropped:
+        logger.info(
+            f"Post views partitions: {created} created, "
+            f"dropped {[row[0] for row in dropped]}"
+        )
@@ -4,7 +4,10 @@ import time
 from queues.file_deletion import cleanup_files
 from queues.post_deletion import cleanup_posts
 from queues.web_push import push_worker
+from queues.post_views import views_worker, maintain_view_partitions
 from queues.email_change import confirm_pending_emails
+from queues.counters import fold_counters, fold_interval
+from queues.outbox import start_outbox
 import typing as t
 from logging import getLogger
 
@@ -34,6 +37,16 @@ scheduled = (
         func=confirm_pending_emails,
         long_interval=3600,
         short_interval=600
+    ),
+    Scheduled(
+        func=maintain_view_partitions,
+        long_interval=3600,
+        short_interval=3600
+    ),
+    Scheduled(
+        func=fold_counters,
+        long_interval=fold_interval,
+        short_interval=0
     )
 )
 
@@ -74,3 +87,5 @@ async def scheduler() -> None:
 def start_scheduler() -> None:
     asyncio.create_task(scheduler())
     asyncio.create_task(push_worker())
+    asyncio.create_task(views_worker())
+    start_outbox()
@@ -104,7 +104,7 @@ async def send_pushes(
     for sub in subscriptions:
         try:
             await send_push(
-                orjson.loads(sub["raw"]),
+                sub["raw"],
                 payload, aiohttp_session,
                 sub["session_id"]
             )
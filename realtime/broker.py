@@ -34,8 +34,9 @@ class WebSocketBroker:
         await self.pubsub.punsubscribe(channel)
 
     async def init(self) -> None:
+        # Connects on the first subscribe, cluster pub/sub only picks
+        # its node then
         self.pubsub = redis.pubsub()
-        await self.pubsub.connect()
 
     async def start(self) -> None:
         if not hasattr(self, 'pubsub'):
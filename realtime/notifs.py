@@ -1,13 +1,12 @@
 
 
-import asyncio
 from core import remove_none_values
-from queues.web_push import enqueue_push, WebPushNotification
+from queues.outbox import write_outbox
+from queues.web_push import WebPushNotification
 from schemas import NotificationType, Notification
 from utils import combined, notifs
 from utils.database import AutoConnection
 from utils.cache import users as cache_users
-from realtime.broker import publish_event
 import typing as t
 
 
@@ -45,39 +44,35 @@ async def publish_notification(
 
     from_user = await cache_users.get_user(user_id, conn, True)
 
-    async def _task():
-        await publish_event(
-            f"user:{to}",
-            {
-                "type": "user",
-                "event": "notification",
-                "data": notification
-            }
-        )
-        loaded = notification.get("loaded")
-        content: str | None = None
+    loaded = notification.get("loaded")
+    content: str | None = None
 
-        if loaded:
-            content = loaded.get("content")
+    if loaded:
+        content = loaded.get("content")
 
-        if not content:
-            content = message
+    if not content:
+        content = message
 
-        payload = t.cast(WebPushNotification, {
-            "avatar_url": from_user.avatar_url,
-            "id": notification["id"],
-            "message": content,
-            "type": type,
-            "username": (
-                from_user.display_name
-                or from_user.username
-            )
-        })
-        if (
-            (loaded := notification.get("loaded"))
-            and loaded.get("parent_comment_id")
-        ):
-            payload["is_reply"] = True
+    payload = t.cast(WebPushNotification, {
+        "avatar_url": from_user.avatar_url,
+        "id": notification["id"],
+        "message": content,
+        "type": type,
+        "username": (
+            from_user.display_name
+            or from_user.username
+        )
+    })
+    if loaded and loaded.get("parent_comment_id"):
+        payload["is_reply"] = True
 
-        await enqueue_push(to, payload)
-    asyncio.create_task(_task())
+    # Sent by the outbox relay once the notification is committed
+    await write_outbox("realtime", {
+        "channel": f"user:{to}",
+        "data": {
+            "type": "user",
+            "event": "notification",
+            "data": notification
+        },
+        "push": {"user_id": to, "payload": payload}
+    }, conn)
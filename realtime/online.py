@@ -7,25 +7,29 @@ SESSION_TTL = 60
 ONLINE_THRESHOLD = 120
 
 
+# All presence keys of a user share the `{user_id}` hash tag,
+# so the MULTI pipelines below stay on one node
 async def send_online(user_id: str, session_id: str):
     now = time.time()
     pipe = redis.pipeline()
-    pipe.setex(f"session:{session_id}:last_active", SESSION_TTL, now)
-    pipe.sadd(f"user:{user_id}:sessions", session_id)
-    pipe.expire(f"user:{user_id}:sessions", 3600)
+    pipe.setex(
+        f"session:{{{user_id}}}:{session_id}:last_active", SESSION_TTL, now
+    )
+    pipe.sadd(f"user:{{{user_id}}}:sessions", session_id)
+    pipe.expire(f"user:{{{user_id}}}:sessions", 3600)
     await pipe.execute()
 
 
 async def send_offline(user_id: str, session_id: str):
     pipe = redis.pipeline()
-    pipe.delete(f"session:{session_id}:last_active")
-    pipe.srem(f"user:{user_id}:sessions", session_id)
+    pipe.delete(f"session:{{{user_id}}}:{session_id}:last_active")
+    pipe.srem(f"user:{{{user_id}}}:sessions", session_id)
     await pipe.execute()
 
 
 async def is_online(user_id: str) -> bool:
     v_or_cor = redis.smembers(
-        f"user:{user_id}:sessions"
+        f"user:{{{user_id}}}:sessions"
     )
     session_ids = t.cast(
         list[str],
@@ -42,12 +46,12 @@ async def is_online(user_id: str) -> bool:
     for sid in session_ids:
         sid = sid.decode() if isinstance(sid, bytes) else sid
         last_active = await redis.get(
-            f"session:{sid}:last_active"
+            f"session:{{{user_id}}}:{sid}:last_active"
         )
         if last_active and now - float(last_active) < ONLINE_THRESHOLD:
             return True
         elif not last_active:
-            cor = redis.srem(f"user:{user_id}:sessions", sid)
+            cor = redis.srem(f"user:{{{user_id}}}:sessions", sid)
             if asyncio.iscoroutine(cor):
                 await cor
 
@@ -0,0 +1,425 @@
+"""Synthetic data for load testing at production scale
+
+Bulk-loads users with profiles and avatars, follows, tags, posts with
+media contexts, comments with replies, reactions, favorites, views and
+comment notifications through COPY, with snowflake ids from
+utils_cy.snowflake. Scale 1 is about the current production size:
+
+    python init_db.py && python seed.py --scale 10
+
+Followers, post authors, tags, reactions and views follow power laws,
+so a few users and posts get most of the activity, like in production.
+Posts are spread over `--days`, in id order. Counters are computed
+while generating instead of by the triggers, which are turned off
+together with foreign key checks (session_replication_role), so it
+needs a superuser. Everything is one transaction, an interrupted run
+leaves nothing behind. Every seeded user can log in with
+`--password`.
+"""
+from core import setup_logger
+import argparse
+import asyncio
+import bisect
+import datetime
+import itertools
+import json
+import random
+import time
+import typing as t
+from array import array
+import asyncpg
+from utils.auth import store_password
+from utils_cy.snowflake import SnowflakeGeneration
+
+logger = setup_logger()
+
+# Sizes at scale 1, per-item counts are means of power law draws
+USERS = 20_000
+TAGS = 2_000
+POSTS_PER_USER = 5
+COMMENTS_PER_POST = 3
+REACTIONS_PER_POST = 8
+REACTIONS_PER_COMMENT = 1
+FOLLOWS_PER_USER = 25
+FAVORITES_PER_USER = 4
+VIEWS_PER_USER = 60
+
+REPLY_SHARE = 0.4
+LIKE_SHARE = 0.85
+MEDIA_SHARE = 0.2
+AVATAR_SHARE = 0.3
+DELETED_SHARE = 0.01
+UNREAD_SHARE = 0.3
+ZIPF_EXPONENT = 1.1
+PARETO_ALPHA = 1.5
+
+# Server and process ids of the generated snowflakes, the same bits
+# as utils.generation, kept apart from the API workers
+SEED_SERVER_ID = 31
+SEED_PID = 31
+CHUNK = 5_000
+
+WORDS = (
+    "the link verse post today new just like really good time people "
+    "think know see look make first last long great little own other "
+    "old right big high different small large next early young few "
+    "public bad same able photo music game code art city night world"
+).split()
+
+Row = tuple[t.Any, ...]
+
+
+class Zipf:
+    """Picks indexes of [0, n), the k-th most popular ~ 1 / k ** s"""
+
+    def __init__(self, n: int, rng: random.Random) -> None:
+        self.rng = rng
+        # Popularity isn't tied to age
+        self.order = array("l", range(n))
+        rng.shuffle(self.order)
+        self.cum = array("d", itertools.accumulate(
+            1 / (rank + 1) ** ZIPF_EXPONENT for rank in range(n)
+        ))
+
+    def one(self) -> int:
+        rank = bisect.bisect(self.cum, self.rng.random() * self.cum[-1])
+        return self.order[min(rank, len(self.order) - 1)]
+
+    def distinct(self, k: int, exclude: int = -1) -> set[int]:
+        picked: set[int] = set()
+        # Popular items repeat, give up on the rest after a few misses
+        for _ in range(k * 3):
+            if len(picked) >= k:
+                break
+            item = self.one()
+            if item != exclude:
+                picked.add(item)
+        return picked
+
+
+class Seeder:
+    def __init__(
+        self, db: asyncpg.Connection, args: argparse.Namespace
+    ) -> None:
+        self.db = db
+        self.rng = random.Random(args.seed)
+        self.snowflake = SnowflakeGeneration(SEED_SERVER_ID, SEED_PID)
+        self.now = datetime.datetime.now(datetime.UTC)
+        self.span = datetime.timedelta(days=args.days)
+        self.start = self.now - self.span
+        self.password_hash = ""
+        self.rows: dict[str, int] = {}
+
+        self.n_users = max(2, int(USERS * args.scale))
+        self.n_posts = self.n_users * POSTS_PER_USER
+        self.n_tags = max(1, int(TAGS * args.scale ** 0.5))
+
+        # Rows are written parents last, once their counters are known
+        self.user_ids = self.generate(self.n_users)
+        self.tag_ids = self.generate(self.n_tags)
+        self.post_ids = array("q")
+        self.followers = array("l", bytes(8 * self.n_users))
+        self.following = array("l", bytes(8 * self.n_users))
+        self.tag_posts = array("l", bytes(8 * self.n_tags))
+
+        self.users = Zipf(self.n_users, self.rng)
+        self.tags = Zipf(self.n_tags, self.rng)
+
+    def generate(self, n: int) -> array:
+        return array("q", (self.snowflake.generate() for _ in range(n)))
+
+    def draw(self, mean: float, cap: int) -> int:
+        """Power law count with about the given mean"""
+        value = self.rng.paretovariate(PARETO_ALPHA)
+        return min(cap, int(value * mean * (PARETO_ALPHA - 1) / PARETO_ALPHA))
+
+    def text(self, words: int) -> str:
+        return " ".join(self.rng.choices(WORDS, k=max(1, words)))
+
+    def post_time(self, index: int) -> datetime.datetime:
+        return self.start + self.span * (index + 0.5) / self.n_posts
+
+    def after(self, moment: datetime.datetime) -> datetime.datetime:
+        return moment + (self.now - moment) * self.rng.random()
+
+    async def copy(
+        self, table: str, columns: list[str], records: list[Row]
+    ) -> None:
+        if records:
+            await self.db.copy_records_to_table(
+                table, records=records, columns=columns
+            )
+            self.rows[table] = self.rows.get(table, 0) + len(records)
+
+    async def seed_posts(self) -> None:
+        for lo in range(0, self.n_posts, CHUNK):
+            await self.seed_posts_chunk(
+                range(lo, min(lo + CHUNK, self.n_posts))
+            )
+            logger.info(f"posts: {len(self.post_ids)}/{self.n_posts}")
+
+    async def seed_posts_chunk(self, indexes: range) -> None:
+        posts: list[Row] = []
+        files: list[Row] = []
+        post_tags: list[Row] = []
+        comments: list[Row] = []
+        reactions: list[Row] = []
+        notifications: list[Row] = []
+
+        for index in indexes:
+            post_num = self.snowflake.generate()
+            post_id = str(post_num)
+            self.post_ids.append(post_num)
+            author = self.users.one()
+            created_at = self.post_time(index)
+
+            tag_names = []
+            for tag in self.tags.distinct(self.rng.randint(0, 3)):
+                self.tag_posts[tag] += 1
+                tag_names.append(f"tag_{tag}")
+                post_tags.append((post_id, str(self.tag_ids[tag])))
+
+            context_id = None
+            if self.rng.random() < MEDIA_SHARE:
+                context_id = str(self.snowflake.generate())
+                objects = [
+                    f"seed/{context_id}/{i}.webp"
+                    for i in range(self.rng.randint(1, 4))
+                ]
+                files.append((
+                    context_id, str(self.user_ids[author]), objects,
+                    1, 0, created_at, "post_image"
+                ))
+
+            # Replies go to top level comments, their authors get the
+            # notification instead of the post author
+            thread: list[list[t.Any]] = []
+            for _ in range(self.draw(COMMENTS_PER_POST, 1000)):
+                comment_num = self.snowflake.generate()
+                user = self.rng.randrange(self.n_users)
+                parent = None
+                if thread and self.rng.random() < REPLY_SHARE:
+                    parent = self.rng.choice(
+                        [c for c in thread if c[1] is None]
+                    )
+                    parent[5] += 1
+                likes = dislikes = 0
+                for liker in self.rng.sample(
+                    range(self.n_users),
+                    self.draw(REACTIONS_PER_COMMENT, self.n_users)
+                ):
+                    is_like = self.rng.random() < LIKE_SHARE
+                    likes += is_like
+                    dislikes += not is_like
+                    reactions.append((
+                        post_id, str(comment_num), str(self.user_ids[liker]),
+                        is_like, self.after(created_at)
+                    ))
+                thread.append([
+                    comment_num, parent[0] if parent else None,
+                    user, likes, dislikes, 0
+                ])
+
+                to = parent[2] if parent else author
+                if to != user:
+                    notification_num = self.snowflake.generate()
+                    notifications.append((
+                        str(notification_num), notification_num,
+                        str(self.user_ids[to]), "new_comment",
+                        str(self.user_ids[user]), "comment",
+                        str(comment_num), post_id,
+                        self.rng.random() < UNREAD_SHARE
+                    ))
+
+            for num, parent_num, user, likes, dislikes, replies in thread:
+                comments.append((
+                    str(num), num, parent_num and str(parent_num), post_id,
+                    str(self.user_ids[user]), self.text(self.draw(12, 200)),
+                    likes, dislikes, replies, "comment"
+                ))
+
+            likes = dislikes = 0
+            for liker in self.rng.sample(
+                range(self.n_users),
+                self.draw(REACTIONS_PER_POST, self.n_users)
+            ):
+                is_like = self.rng.random() < LIKE_SHARE
+                likes += is_like
+                dislikes += not is_like
+                reactions.append((
+                    post_id, None, str(self.user_ids[liker]),
+                    is_like, self.after(created_at)
+                ))
+
+            deleted = self.rng.random() < DELETED_SHARE
+            posts.append((
+                post_id, post_num, str(self.user_ids[author]),
+                self.text(self.draw(30, 2000)), created_at, created_at,
+                self.now if deleted else None, likes, dislikes,
+                len(thread), tag_names or None, context_id, "active", deleted
+            ))
+
+        await self.copy("files", [
+            "context_id", "user_id", "objects", "reference_count",
+            "allowed_count", "created_at", "type"
+        ], files)
+        await self.copy("posts", [
+            "post_id", "post_id_num", "user_id", "content", "created_at",
+            "updated_at", "deleted_at", "likes_count", "dislikes_count",
+            "comments_count", "tags", "file_context_id", "status",
+            "is_deleted"
+        ], posts)
+        await self.copy("post_tags", ["post_id", "tag_id"], post_tags)
+        await self.copy("comments", [
+            "comment_id", "comment_id_num", "parent_comment_id", "post_id",
+            "user_id", "content", "likes_count", "dislikes_count",
+            "replies_count", "type"
+        ], comments)
+        await self.copy("reactions", [
+            "post_id", "comment_id", "user_id", "is_like", "created_at"
+        ], reactions)
+        await self.copy("user_notifications", [
+            "id", "id_num", "user_id", "type", "from_id", "linked_type",
+            "linked_id", "second_linked_id", "unread"
+        ], notifications)
+
+    async def seed_activity(self) -> None:
+        posts = Zipf(self.n_posts, self.rng)
+        for lo in range(0, self.n_users, CHUNK):
+            followed: list[Row] = []
+            favorites: list[Row] = []
+            views: list[Row] = []
+
+            for user in range(lo, min(lo + CHUNK, self.n_users)):
+                user_id = str(self.user_ids[user])
+                for target in self.users.distinct(
+                    self.draw(FOLLOWS_PER_USER, 5000), exclude=user
+                ):
+                    self.followers[target] += 1
+                    self.following[user] += 1
+                    followed.append((
+                        user_id, str(self.user_ids[target]),
+                        self.after(self.start)
+                    ))
+                for post in posts.distinct(
+                    self.draw(FAVORITES_PER_USER, 1000)
+                ):
+                    favorites.append((
+                        user_id, str(self.post_ids[post]),
+                        self.after(self.post_time(post))
+                    ))
+                # Views are stamped now(), inside the current partition
+                for post in posts.distinct(self.draw(VIEWS_PER_USER, 5000)):
+                    views.append((user_id, str(self.post_ids[post])))
+
+            await self.copy(
+                "followed", ["user_id", "followed_to", "created_at"],
+                followed
+            )
+            await self.copy(
+                "favorites", ["user_id", "post_id", "created_at"], favorites
+            )
+            await self.copy("user_post_views", ["user_id", "post_id"], views)
+            logger.info(f"activity: {min(lo + CHUNK, self.n_users)}/"
+                        f"{self.n_users} users")
+
+    async def seed_users(self) -> None:
+        for lo in range(0, self.n_users, CHUNK):
+            users: list[Row] = []
+            profiles: list[Row] = []
+            files: list[Row] = []
+
+            for user in range(lo, min(lo + CHUNK, self.n_users)):
+                user_num = self.user_ids[user]
+                user_id = str(user_num)
+                users.append((
+                    user_id, user_num, f"seed.{user_id}",
+                    f"seed.{user_id}@example.com", self.password_hash,
+                    True, self.followers[user], self.following[user]
+                ))
+                avatar = None
+                if self.rng.random() < AVATAR_SHARE:
+                    avatar = str(self.snowflake.generate())
+                    files.append((
+                        avatar, user_id, [f"seed/{avatar}/avatar.webp"],
+                        1, 0, self.start, "avatar"
+                    ))
+                profiles.append((
+                    user_id, self.text(2).title(), avatar,
+                    self.text(self.draw(10, 100)), ["en"]
+                ))
+
+            await self.copy("users", [
+                "user_id", "user_id_num", "username", "email",
+                "password_hash", "email_verified", "followers_count",
+                "following_count"
+            ], users)
+            await self.copy("files", [
+                "context_id", "user_id", "objects", "reference_count",
+                "allowed_count", "created_at", "type"
+            ], files)
+            await self.copy("user_profiles", [
+                "user_id", "display_name", "avatar_context_id", "bio",
+                "languages"
+            ], profiles)
+
+    async def seed_tags(self) -> None:
+        await self.copy("tags", [
+            "tag_id", "tag_id_num", "name", "created_at", "posts_count"
+        ], [
+            (str(tag_num), tag_num, f"tag_{tag}", self.start,
+             self.tag_posts[tag])
+            for tag, tag_num in enumerate(self.tag_ids)
+        ])
+
+    async def run(self, password: str) -> None:
+        self.password_hash = await store_password(password)
+        await self.seed_posts()
+        await self.seed_activity()
+        await self.seed_users()
+        await self.seed_tags()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--scale", type=float, default=1,
+        help="multiple of the current production size"
+    )
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--password", default="seed-password")
+    args = parser.parse_args()
+
+    with open("config/postgres.json") as f:
+        config = json.load(f)
+        config.pop("max_shared", None)
+        config.pop("replicas", None)
+    db = await asyncpg.connect(**config)
+    # One long write, don't wait for fsync on the way
+    await db.execute("SET synchronous_commit = off")
+
+    seeder = Seeder(db, args)
+    started = time.monotonic()
+    try:
+        async with db.transaction():
+            # Triggers and foreign key checks off, counters are written
+            # directly and parents after their children
+            await db.execute("SET LOCAL session_replication_role = replica")
+            await seeder.run(args.password)
+        logger.info("Analyzing...")
+        await db.execute(
+            "ANALYZE users, user_profiles, files, posts, post_tags, tags, "
+            "comments, reactions, favorites, followed, user_post_views, "
+            "user_notifications"
+        )
+    finally:
+        await db.close()
+
+    for table, count in seeder.rows.items():
+        logger.info(f"{table}: {count} rows")
+    logger.info(f"Done in {time.monotonic() - started:.0f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
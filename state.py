@@ -1,7 +1,7 @@
 import asyncpg
-from redis.asyncio import Redis
+from utils.redis_topology import RedisClient
 
 
-def load_state(_pool: asyncpg.Pool, _redis: Redis):
+def load_state(_pool: asyncpg.Pool, _redis: RedisClient):
     global pool, redis
     pool, redis = _pool, _redis
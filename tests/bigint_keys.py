@@ -0,0 +1,106 @@
+"""Index size and keyset pagination, `key::bigint` vs BIGINT columns
+
+Run between `migrate_keys.py verify` and `finalize`, while both the
+old expression indexes and the new BIGINT indexes exist. That is
+before init_db.py applies 16_bigint_keys_backfill, which drops the old
+ones:
+
+    python -m tests.bigint_keys
+"""
+import asyncio
+import json
+import logging
+import statistics
+import time
+import asyncpg
+
+logging.basicConfig(level=logging.INFO, format='[%(levelname)s]: %(message)s')
+
+PAGES = 50
+PAGE_SIZE = 20
+RUNS = 5
+
+INDEXES = [
+    ("posts", "posts_id_num_idx", "posts_post_id_num_key"),
+    ("comments", "comments_id_num_idx", "comments_comment_id_num_key"),
+    ("user_notifications", "notifications_id_num_idx",
+     "user_notifications_id_num_key"),
+    ("messages", "message_id_num_idx", "messages_message_id_num_key"),
+]
+
+# Both walk the feed of new posts page by page
+PAGINATION = {
+    "key::bigint": """
+        SELECT post_id, post_id::bigint AS cursor FROM posts
+        WHERE is_deleted = FALSE AND post_id::bigint < $1
+        ORDER BY post_id::bigint DESC LIMIT $2
+    """,
+    "BIGINT": """
+        SELECT post_id, post_id_num AS cursor FROM posts
+        WHERE is_deleted = FALSE AND post_id_num < $1
+        ORDER BY post_id_num DESC LIMIT $2
+    """
+}
+
+
+def size(value: int | None) -> str:
+    return "-" if value is None else f"{value / 1024 / 1024:.1f} MiB"
+
+
+async def index_sizes(db: asyncpg.Connection) -> None:
+    for table, old, new in INDEXES:
+        old_size, new_size, pkey_size = await db.fetchrow(
+            """
+            SELECT pg_relation_size(to_regclass($1)),
+                   pg_relation_size(to_regclass($2)),
+                   pg_relation_size(to_regclass($3))
+            """, old, new, f"{table}_pkey"
+        )
+        logging.info(
+            f"{table}: {old} {size(old_size)}, {new} {size(new_size)}"
+            f" (TEXT pkey {size(pkey_size)})"
+        )
+
+
+async def pagination(db: asyncpg.Connection) -> None:
+    for name, query in PAGINATION.items():
+        statement = await db.prepare(query)
+        timings = []
+        for _ in range(RUNS):
+            cursor = 2 ** 63 - 1
+            started = time.perf_counter()
+            for _ in range(PAGES):
+                rows = await statement.fetch(cursor, PAGE_SIZE)
+                if not rows:
+                    break
+                cursor = rows[-1]["cursor"]
+            timings.append((time.perf_counter() - started) * 1000)
+        plan = await db.fetchval(
+            f"EXPLAIN (FORMAT JSON) {query}", 2 ** 63 - 1, PAGE_SIZE
+        )
+        node = json.loads(plan)[0]["Plan"]
+        while node.get("Plans") and "Index Name" not in node:
+            node = node["Plans"][0]
+        logging.info(
+            f"{name}: {PAGES} pages in {statistics.median(timings):.1f}ms"
+            f" (median of {RUNS}), {node['Node Type']}"
+            f" {node.get('Index Name', '')}"
+        )
+
+
+async def main() -> None:
+    with open("config/postgres.json") as f:
+        config = json.load(f)
+        config.pop("max_shared", None)
+        config.pop("replicas", None)
+    db = await asyncpg.connect(**config)
+    try:
+        await db.execute("ANALYZE posts")
+        await index_sizes(db)
+        await pagination(db)
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
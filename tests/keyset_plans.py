@@ -0,0 +1,227 @@
+"""Asserts that every keyset-paginated query is an index range scan
+
+Seeds users, posts, comments, notifications, favorites, reactions and
+follows inside a transaction that is rolled back at the end, runs the
+real query builders for the first and a later page, and checks the
+EXPLAIN plan of each statement they send. Needs a migrated database:
+
+    python init_db.py && python -m tests.keyset_plans
+"""
+import asyncio
+import json
+import logging
+import sys
+import typing as t
+from collections import defaultdict
+import asyncpg
+import core  # noqa: F401 (loads .env)
+from core import FunctionError
+from utils.queries import catalog
+import utils.comments as comments
+import utils.notifs as notifs
+import utils.posts as posts
+import utils.posts_list as posts_list
+import utils.users as users
+
+logging.basicConfig(level=logging.INFO, format='[%(levelname)s]: %(message)s')
+
+USER = 900_000_000_000_000_000
+POST = 910_000_000_000_000_000
+COMMENT = 920_000_000_000_000_000
+NOTIFICATION = 930_000_000_000_000_000
+
+SEED = f"""
+INSERT INTO users (user_id, username, email, password_hash)
+SELECT ({USER} + g)::text, 'plan_' || g, 'plan_' || g || '@test', 'x'
+FROM generate_series(0, 999) g;
+
+INSERT INTO posts (post_id, user_id, content, likes_count, is_deleted)
+SELECT ({POST} + g)::text, ({USER} + g % 1000)::text, 'x',
+       g % 97, g % 20 = 0
+FROM generate_series(0, 99999) g;
+
+INSERT INTO comments (comment_id, post_id, user_id, content,
+                      parent_comment_id, likes_count)
+SELECT ({COMMENT} + g)::text, ({POST} + g % 50)::text,
+       ({USER} + g % 1000)::text, 'x',
+       CASE WHEN g >= 25000 THEN ({COMMENT} + g % 50)::text END, g % 31
+FROM generate_series(0, 49999) g;
+
+INSERT INTO user_notifications (id, user_id, type, from_id, linked_type,
+                                linked_id, second_linked_id)
+SELECT ({NOTIFICATION} + g)::text, ({USER} + g % 100)::text, 'new_comment',
+       ({USER} + (g + 1) % 1000)::text, 'comment',
+       ({COMMENT} + g)::text, ({POST} + g % 50)::text
+FROM generate_series(0, 49999) g;
+
+INSERT INTO favorites (user_id, post_id, created_at)
+SELECT ({USER} + g % 100)::text, ({POST} + g)::text,
+       now() - g * interval '1 second'
+FROM generate_series(0, 49999) g;
+
+INSERT INTO reactions (user_id, post_id, is_like, created_at)
+SELECT ({USER} + g % 100)::text, ({POST} + g)::text, g % 2 = 0,
+       now() - g * interval '1 second'
+FROM generate_series(0, 49999) g;
+
+INSERT INTO followed (user_id, followed_to, created_at)
+SELECT ({USER} + g % 50)::text, ({USER} + g / 50)::text,
+       now() - g * interval '1 second'
+FROM generate_series(0, 49999) g;
+
+ANALYZE users, posts, comments, user_notifications,
+        favorites, reactions, followed;
+"""
+
+
+class PlanCapture:
+    """Stands in for AutoConnection and records every statement"""
+
+    def __init__(self, db: asyncpg.Connection) -> None:
+        self.db = db
+        self.temp_cache: defaultdict[str, t.Any] = defaultdict(lambda: None)
+        self.statements: list[tuple[str, tuple]] = []
+
+    async def create_conn(self) -> "PlanCapture":
+        return self
+
+    async def start_transaction(self) -> None:
+        pass
+
+    async def run(self, query: str, call: t.Callable) -> t.Any:
+        return await call(self)
+
+    async def fetch(self, query: str, *args: t.Any) -> list:
+        self.statements.append((query, args))
+        return await self.db.fetch(query, *args)
+
+    async def fetchrow(self, query: str, *args: t.Any) -> t.Any:
+        self.statements.append((query, args))
+        return await self.db.fetchrow(query, *args)
+
+    async def fetchval(self, query: str, *args: t.Any) -> t.Any:
+        self.statements.append((query, args))
+        return await self.db.fetchval(query, *args)
+
+
+user = str(USER + 1)
+post = str(POST + 1)
+comment = str(COMMENT + 1)
+date = "2020-01-01T00:00:00+00:00"
+
+# name, table, expected index, query builder
+CASES: list[tuple[str, str, str, t.Callable[[t.Any], t.Awaitable]]] = [
+    ("user posts new", "posts", "idx_posts_user_new",
+     lambda c: posts.get_user_posts(user, None, c, "new")),
+    ("user posts new, page 2", "posts", "idx_posts_user_new",
+     lambda c: posts.get_user_posts(user, f"0,{POST + 90000}", c, "new")),
+    ("user posts old", "posts", "idx_posts_user_new",
+     lambda c: posts.get_user_posts(user, f"0,{POST + 1000}", c, "old")),
+    ("user posts popular", "posts", "idx_posts_user_popular",
+     lambda c: posts.get_user_posts(user, f"50,{POST}", c, "popular")),
+    ("popular feed", "posts", "idx_posts_feed_popular",
+     lambda c: posts_list.get_popular_posts(user, c, 50, None, False)),
+    ("popular feed, page 2", "posts", "idx_posts_feed_popular",
+     lambda c: posts_list.get_popular_posts(
+         user, c, 50, f"50,{POST + 50000}", False)),
+    ("new feed, page 2", "posts", "posts_post_id_num_key",
+     lambda c: posts_list.get_new_posts(
+         user, c, 50, str(POST + 50000), False)),
+    ("notifications", "user_notifications", "idx_notifications_user_id_num",
+     lambda c: notifs.get_notifications(user, c)),
+    ("notifications, page 2", "user_notifications",
+     "idx_notifications_user_id_num",
+     lambda c: notifs.get_notifications(user, c, str(NOTIFICATION + 20000))),
+    ("comments", "comments", "idx_comments_top_level",
+     lambda c: comments.get_comments(post, None, user, c)),
+    ("comments, page 2", "comments", "idx_comments_top_level",
+     lambda c: comments.get_comments(
+         post, f"0,20,{COMMENT + 10001}", user, c)),
+    ("comments, page 2 of own", "comments", "idx_comments_top_level",
+     lambda c: comments.get_comments(
+         post, f"1,20,{COMMENT + 10001}", user, c)),
+    ("replies", "comments", "idx_comments_thread",
+     lambda c: comments.get_comments(post, None, user, c,
+                                     parent_id=comment)),
+    ("replies, page 2", "comments", "idx_comments_thread",
+     lambda c: comments.get_comments(post, f"0,20,{COMMENT + 40001}",
+                                     user, c, parent_id=comment)),
+    ("favorites", "favorites", "idx_favorites_user_created",
+     lambda c: users.get_favorites(user, c)),
+    ("favorites, page 2", "favorites", "idx_favorites_user_created",
+     lambda c: users.get_favorites(user, c, f"{POST}_{date}")),
+    ("reactions", "reactions", "idx_reactions_user_created",
+     lambda c: users.get_reactions(user, c)),
+    ("reactions, page 2", "reactions", "idx_reactions_user_created",
+     lambda c: users.get_reactions(user, c, f"{POST}_{date}")),
+    ("followed", "followed", "idx_followed_user_created",
+     lambda c: users.get_followed(user, c)),
+    ("followed, page 2", "followed", "idx_followed_user_created",
+     lambda c: users.get_followed(user, c, f"{USER}_{date}")),
+]
+
+
+def scans(node: dict, table: str) -> t.Iterator[dict]:
+    if node.get("Relation Name") == table:
+        yield node
+    for child in node.get("Plans", ()):
+        yield from scans(child, table)
+
+
+async def check(
+    db: asyncpg.Connection, name: str, table: str, index: str,
+    build: t.Callable[[t.Any], t.Awaitable]
+) -> bool:
+    capture = PlanCapture(db)
+    try:
+        await build(capture)
+    except FunctionError:
+        pass  # Empty pages are fine, the statement was still sent
+
+    for query, args in capture.statements:
+        plan = await db.fetchval(f"EXPLAIN (FORMAT JSON) {query}", *args)
+        nodes = list(scans(json.loads(plan)[0]["Plan"], table))
+        if not nodes:
+            continue
+
+        # Comments scan the table twice, the user's own ones are a few
+        # rows that may come from any index but never a Seq Scan
+        used = [f"{node['Node Type']} {node.get('Index Name', '')}"
+                for node in nodes]
+        if any(
+            node["Node Type"] in ("Index Scan", "Index Only Scan")
+            and node.get("Index Name") == index
+            for node in nodes
+        ) and all(node["Node Type"] != "Seq Scan" for node in nodes):
+            logging.info(f"{name}: {', '.join(used)}")
+            return True
+        logging.error(f"{name}: {', '.join(used)}, expected {index}")
+        return False
+    logging.error(f"{name}: no statement on {table}")
+    return False
+
+
+async def main() -> None:
+    with open("config/postgres.json") as f:
+        config = json.load(f)
+        config.pop("max_shared", None)
+        config.pop("replicas", None)
+    db = await asyncpg.connect(**config)
+    catalog.prepare_statements = False
+
+    transaction = db.transaction()
+    await transaction.start()
+    try:
+        await db.execute(SEED)
+        results = [await check(db, *case) for case in CASES]
+    finally:
+        await transaction.rollback()
+        await db.close()
+
+    logging.info(f"{sum(results)}/{len(results)} queries use their index")
+    if not all(results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
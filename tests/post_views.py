@@ -0,0 +1,110 @@
+"""Sustained post view ingestion through the Redis stream
+
+Needs Redis and a Postgres database with some posts. Views are
+written by users the script seeds and through a stream of its own,
+both are deleted afterwards.
+
+    python -m tests.post_views
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+import typing as t
+import uuid
+import core  # noqa: F401 (loads .env)
+from state import load_state
+from utils.database import create_pool
+from utils.redis_topology import create_redis
+
+logging.basicConfig(level=logging.INFO, format='[%(levelname)s]: %(message)s')
+
+REQUESTS = 20_000
+# The views worker holds one of the 100 connections redis-py allows
+CONCURRENCY = 90
+POSTS_PER_REQUEST = 10
+USERS = 200
+USER = 940_000_000_000_000_000
+
+
+async def main() -> None:
+    with open("config/postgres.json") as f:
+        config = json.load(f)
+    config["password"] = os.environ["POSTGRES_PASSWORD"]
+    pool = await create_pool(**config)
+    redis = create_redis()
+    load_state(pool, redis)
+
+    from queues import post_views
+
+    # Module globals, read on every call
+    post_views.STREAM_NAME = f"post_views_bench:{uuid.uuid4().hex}"
+    user_ids = [str(USER + i) for i in range(USERS)]
+    await pool.execute(
+        """
+        INSERT INTO users (user_id, username, email, password_hash)
+        SELECT id, 'views_' || id, 'views_' || id || '@test', 'x'
+        FROM unnest($1::text[]) AS id
+        """, user_ids
+    )
+    post_ids = [r[0] for r in await pool.fetch(
+        "SELECT post_id FROM posts WHERE is_deleted = FALSE LIMIT 5000"
+    )]
+    try:
+        await ingest(redis, post_views, user_ids, post_ids)
+    finally:
+        # Their views go with them (ON DELETE CASCADE)
+        await pool.execute(
+            "DELETE FROM users WHERE user_id = ANY($1::text[])", user_ids
+        )
+        await redis.delete(post_views.STREAM_NAME)
+        await pool.close()
+
+
+async def ingest(
+    redis: t.Any, post_views: t.Any,
+    user_ids: list[str], post_ids: list[str]
+) -> None:
+    worker = asyncio.create_task(post_views.views_worker())
+
+    queue: asyncio.Queue[int] = asyncio.Queue()
+    for i in range(REQUESTS):
+        queue.put_nowait(i)
+
+    async def client() -> None:
+        while not queue.empty():
+            queue.get_nowait()
+            await post_views.enqueue_views(
+                random.choice(user_ids),
+                random.sample(post_ids, POSTS_PER_REQUEST)
+            )
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(CONCURRENCY)))
+    enqueued = time.perf_counter() - started
+    logging.info(
+        f"Enqueued {REQUESTS} requests in {enqueued:.2f}s "
+        f"({REQUESTS / enqueued:.0f} req/s)"
+    )
+
+    while True:
+        stream = await redis.xinfo_stream(post_views.STREAM_NAME)
+        group, = await redis.xinfo_groups(post_views.STREAM_NAME)
+        if (not group["pending"] and group["last-delivered-id"]
+                == stream["last-generated-id"]):
+            break
+        await asyncio.sleep(0.1)
+    ingested = time.perf_counter() - started
+    worker.cancel()
+
+    views = REQUESTS * POSTS_PER_REQUEST
+    logging.info(
+        f"Ingested {views} views in {ingested:.2f}s "
+        f"({views / ingested:.0f} views/s)"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
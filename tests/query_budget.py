@@ -0,0 +1,91 @@
+"""Query budgets on real pool connections
+
+Acquires connections the way the API does, through AutoConnection on
+a pool from create_pool, and checks the budget of an endpoint inside a
+request and the lack of one outside. Needs a migrated database:
+
+    python init_db.py && python -m tests.query_budget
+"""
+import asyncio
+import json
+import logging
+import asyncpg
+from quart import Quart
+import core  # noqa: F401 (loads .env)
+from core import FunctionError
+from utils.database import AutoConnection, create_pool
+from utils.query_budget import query_budgets
+
+logging.basicConfig(level=logging.INFO, format='[%(levelname)s]: %(message)s')
+
+app = Quart(__name__)
+
+
+@app.route("/budgeted")
+async def budgeted() -> str:
+    return ""
+
+
+async def expect_error(query: str, code: int, pool: asyncpg.Pool) -> None:
+    async with AutoConnection(pool, primary=True) as conn:
+        db = await conn.create_conn()
+        try:
+            await db.execute(query)
+        except FunctionError as e:
+            assert e.code == code, e.code
+        else:
+            raise AssertionError(f"{query} wasn't limited")
+
+
+async def main() -> None:
+    with open("config/postgres.json") as f:
+        config = json.load(f)
+    config.pop("replicas", None)
+    pool = await create_pool(**config)
+    query_budgets.configure({
+        "budgeted": {"statement_timeout": 200, "max_queries": 3}
+    })
+
+    # The flag is set on the connection behind the pool's proxy
+    async with AutoConnection(pool) as conn:
+        db = await conn.create_conn()
+        assert await db.fetchval("SELECT 1") == 1
+        raw = conn._conn._con  # type: ignore
+        assert raw.budgeted
+    assert not raw.budgeted
+    logging.info("Pool connections take and drop the budget")
+
+    # Outside of a request nothing is limited or translated
+    async with AutoConnection(pool, primary=True) as conn:
+        db = await conn.create_conn()
+        await db.execute("SELECT pg_sleep(0.3)")
+        await db.execute("SET statement_timeout = 100")
+        try:
+            await db.execute("SELECT pg_sleep(0.3)")
+        except asyncpg.QueryCanceledError:
+            pass
+        else:
+            raise AssertionError("statement_timeout didn't cancel")
+        await db.execute("RESET statement_timeout")
+    logging.info("Background queries keep the driver's errors")
+
+    async with app.test_request_context("/budgeted"):
+        await expect_error("SELECT pg_sleep(0.5)", 504, pool)
+    async with app.test_request_context("/budgeted"):
+        async with AutoConnection(pool) as conn:
+            db = await conn.create_conn()
+            for _ in range(3):
+                await db.fetchval("SELECT 1")
+            try:
+                await db.fetchval("SELECT 1")
+            except FunctionError as e:
+                assert e.code == 503
+            else:
+                raise AssertionError("max_queries wasn't enforced")
+    logging.info("Requests get 504 on timeouts and 503 over max_queries")
+
+    await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+import datetime
+import gc
+import itertools
+import logging
+import timeit
+import tracemalloc
+import typing as t
+from utils.auth import AuthUser
+from utils.comments import Comment
+from utils.posts import Post
+from utils.users import User
+
+logging.basicConfig(level=logging.INFO, format='[%(levelname)s]: %(message)s')
+
+COUNT = 10000
+REPEAT = 5
+
+# generate_id() is limited to 4096 ids per second
+ids = itertools.count(1 << 60)
+
+
+def generate_id() -> int:
+    return next(ids)
+
+
+def make_user() -> User:
+    return User(
+        user_id=str(generate_id()), username="username",
+        role_id=0, following_count=10, followers_count=20,
+        display_name="Display name", avatar_url="https://cdn/avatar",
+        bio="Bio", badges=["early"], languages=["en", "uk"]
+    )
+
+
+def make_post() -> Post:
+    now = datetime.datetime.now(datetime.UTC)
+    return Post(
+        post_id=str(generate_id()), user_id=str(generate_id()),
+        content="Content " * 20, created_at=now, updated_at=now,
+        likes_count=10, dislikes_count=1, comments_count=3,
+        tags=["tag"], media=["https://cdn/image"], ctags=["ctag"]
+    )
+
+
+def make_comment() -> Comment:
+    return Comment(
+        comment_id=str(generate_id()), post_id=str(generate_id()),
+        user_id=str(generate_id()), content="Comment",
+        parent_comment_id=None, replies_count=0, likes_count=1,
+        dislikes_count=0, type="comment"
+    )
+
+
+def make_auth_user() -> AuthUser:
+    return AuthUser(
+        username="username", user_id=str(generate_id()),
+        email="user@example.com", password_hash="hash",
+        email_verified=True, pending_email=None,
+        pending_email_until=datetime.datetime.now(datetime.UTC)
+    )
+
+
+def measure(name: str, factory: t.Callable[[], t.Any]) -> None:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [factory() for _ in range(COUNT)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # Field values are counted too, so compare the numbers between runs
+    per_object = (after - before) / COUNT
+
+    obj = objects[0]
+    first = min(timeit.repeat(
+        lambda: factory().dict, number=COUNT, repeat=REPEAT
+    )) - min(timeit.repeat(factory, number=COUNT, repeat=REPEAT))
+    repeated = min(timeit.repeat(
+        lambda: obj.dict, number=COUNT, repeat=REPEAT
+    ))
+
+    logging.info(
+        f"{name}: {per_object:.0f} B/object, "
+        f"dict {first / COUNT * 1e6:.2f} us first, "
+        f"{repeated / COUNT * 1e6:.2f} us repeated"
+    )
+
+
+if __name__ == "__main__":
+    measure("User", make_user)
+    measure("Post", make_post)
+    measure("Comment", make_comment)
+    measure("AuthUser", make_auth_user)
@@ -0,0 +1,164 @@
+"""Checks the configured Redis topology against real redis-server nodes
+
+    redis-server --port 7001 --daemonize yes
+    redis-server --port 7002 --daemonize yes
+    REDIS_TOPOLOGY=sharded REDIS_NODES=127.0.0.1:7001,127.0.0.1:7002 \\
+        python -m tests.redis_topology
+
+For the cluster path start the nodes with `--cluster-enabled yes`,
+join them with `redis-cli --cluster create 127.0.0.1:7001 ...
+--cluster-replicas 0` and use REDIS_TOPOLOGY=cluster.
+"""
+import asyncio
+import logging
+import typing as t
+import uuid
+from redis.exceptions import RedisClusterException, RedisError
+import core  # noqa: F401 (loads .env)
+from state import load_state
+from utils.redis_topology import (
+    RedisClient, ShardedRedis, create_redis, topology
+)
+
+logging.basicConfig(level=logging.INFO, format='[%(levelname)s]: %(message)s')
+
+USERS = 200
+
+
+def spread_keys() -> list[str]:
+    """Untagged keys, spread over all nodes and slots"""
+    return [f"test:{uuid.uuid4()}" for _ in range(20)]
+
+
+async def expect_rejected(call: t.Callable[[], t.Awaitable[t.Any]]) -> None:
+    try:
+        await call()
+    except (RedisError, RedisClusterException):
+        return
+    raise AssertionError("keys of different nodes weren't rejected")
+
+
+async def check_multi_key(redis: RedisClient) -> None:
+    keys = spread_keys()
+    if isinstance(redis, ShardedRedis):
+        await redis.mset({key: key for key in keys})
+        assert await redis.mget(keys) == [key.encode() for key in keys]
+    else:
+        for key in keys:
+            await redis.set(key, key)
+    assert await redis.exists(*keys) == len(keys)
+    assert await redis.touch(*keys) == len(keys)
+    assert await redis.delete(*keys[:10]) == 10
+    assert await redis.unlink(*keys) == 10
+    logging.info("Multi-key commands over all nodes OK")
+
+    if topology == "single":
+        return
+    await expect_rejected(lambda: redis.sunionstore(keys[0], keys[1:]))
+    await expect_rejected(lambda: redis.rename(keys[0], keys[1]))
+    logging.info("Multi-key commands over several nodes are rejected")
+
+
+async def check_pipelines(redis: RedisClient) -> None:
+    user_id = str(uuid.uuid4())
+    tagged = [f"test:{{{user_id}}}:{i}" for i in range(10)]
+    pipe = redis.pipeline(transaction=True)
+    for key in tagged:
+        pipe.set(key, 1, ex=60)
+    pipe.sadd(f"test:{{{user_id}}}:set", *tagged)
+    assert all(await pipe.execute())
+
+    pipe = redis.pipeline(transaction=False)
+    for key in spread_keys():
+        pipe.set(key, 1, ex=60)
+    assert all(await pipe.execute())
+    await redis.delete(*tagged, f"test:{{{user_id}}}:set")
+    logging.info("Pipelines OK")
+
+    if topology == "single":
+        return
+
+    async def spread_transaction() -> None:
+        pipe = redis.pipeline(transaction=True)
+        for key in spread_keys():
+            pipe.set(key, 1, ex=60)
+        await pipe.execute()
+    await expect_rejected(spread_transaction)
+    logging.info("Transactions over several nodes are rejected")
+
+
+async def check_pubsub(redis: RedisClient) -> None:
+    from realtime.broker import WebSocketBroker
+
+    received: asyncio.Queue[dict] = asyncio.Queue()
+
+    async def callback(data: dict) -> None:
+        received.put_nowait(data)
+
+    broker = WebSocketBroker()
+    await broker.init()
+    await broker.subscribe("test:pubsub", callback)
+    listener = asyncio.create_task(broker.start())
+    await asyncio.sleep(0.5)
+    await redis.publish("test:pubsub", b'{"ok": true}')
+    assert await asyncio.wait_for(received.get(), 5) == {"ok": True}
+    listener.cancel()
+    await broker.cleanup()
+    logging.info("Pub/sub OK")
+
+
+async def main() -> None:
+    redis = create_redis()
+    load_state(None, redis)  # type: ignore
+
+    import realtime.online as online
+    import utils.cache as cache
+    from utils.rate_limiting import _LUA_SCRIPT
+
+    instance = cache.Cache()
+    user_ids = [str(uuid.uuid4()) for _ in range(USERS)]
+
+    for user_id in user_ids:
+        key = cache.user_key(user_id, True)
+        await instance.set(key, {"user_id": user_id}, 60,
+                           tags=(f"user:{{{user_id}}}",))
+        await instance.ttl_cache.clear()
+        assert await instance.get(key) == {"user_id": user_id}
+
+        await instance.invalidate_tag(f"user:{{{user_id}}}")
+        await instance.ttl_cache.clear()
+        assert await instance.get(key) is None
+
+        await online.send_online(user_id, "session")
+        assert await online.is_online(user_id)
+        await online.send_offline(user_id, "session")
+        assert not await online.is_online(user_id)
+    logging.info(f"Cache and presence OK for {USERS} users")
+
+    sha = await redis.script_load(_LUA_SCRIPT)
+    for user_id in user_ids:
+        keys = [
+            f"user:{{{user_id}}}:test:60",
+            f"session:{{{user_id}}}:session:test:60"
+        ]
+        await redis.evalsha(
+            sha, 2, *keys, "0", "5", "60", "a", "5", "60", "b"
+        )
+        await redis.delete(*keys)
+    logging.info("Rate limit script OK")
+
+    await check_multi_key(redis)
+    await check_pipelines(redis)
+    await check_pubsub(redis)
+
+    if isinstance(redis, ShardedRedis):
+        counts = [0] * len(redis.nodes)
+        for user_id in user_ids:
+            counts[redis.node_index(f"user:{{{user_id}}}")] += 1
+        logging.info(f"Users per node: {counts}")
+
+    logging.info(f"Topology '{topology}' works")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
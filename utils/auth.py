@@ -1,6 +1,6 @@
 import asyncio
 import base64
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 import os
 import re
 from utils.generation import parse_id, generate_id
@@ -10,6 +10,9 @@ import typing as t
 from core import FunctionError
 from concurrent.futures import ThreadPoolExecutor
 from utils.database import AutoConnection
+from utils.codecs import unix_time
+from utils.queries import catalog
+from utils.records import Record
 import datetime
 
 executor = ThreadPoolExecutor()
@@ -17,8 +20,8 @@ secret_key = os.environ["SECRET_KEY"]
 secret_refresh_key = os.environ["SECRET_REFRESH_KEY"]
 
 
-@dataclass
-class AuthUser:
+@dataclass(slots=True, frozen=True)
+class AuthUser(Record):
     username: str
     user_id: str
     email: str
@@ -28,19 +31,16 @@ class AuthUser:
     pending_email_until: datetime.datetime
 
     @property
-    def created_at(self):
-        try:
-            return self._created_at
-        except AttributeError:
-            self._created_at = int(parse_id(self.user_id)[0])
-            return self._created_at
+    def created_at(self) -> int:
+        return int(parse_id(self.user_id)[0])
 
-    @property
-    def dict(self) -> dict:
-        _dict = asdict(self)
+    def _build_dict(self) -> dict:
+        _dict = self.to_dict()
         _dict["created_at"] = self.created_at
         if self.pending_email_until:
-            _dict["pending_email_until"] = self.pending_email_until.timestamp()
+            _dict["pending_email_until"] = unix_time(
+                self.pending_email_until
+            )
         return _dict
 
     def __dict__(self):
@@ -181,6 +181,20 @@ async def close_sessions_except(
     )
 
 
+async def get_recent_sessions(
+    limit: int, conn: AutoConnection
+) -> list[tuple[str, str]]:
+    db = await conn.create_conn()
+    rows = await db.fetch(
+        """
+        SELECT user_id, token_secret FROM auth_keys
+        ORDER BY created_at DESC
+        LIMIT $1
+        """, limit
+    )
+    return [(row["user_id"], row["token_secret"]) for row in rows]
+
+
 async def check_email(
     email: str, conn: AutoConnection
 ) -> None:
@@ -334,6 +348,14 @@ async def refresh(
     }
 
 
+SESSION_BY_TOKEN = catalog.add("auth.session_by_token", """
+    SELECT user_id FROM auth_keys
+    WHERE user_id = $1
+    AND token_secret = $2
+    AND session_id = $3
+""", hot=True)
+
+
 async def check_token(
     token: str, conn: AutoConnection,
     decoded: dict | None = None
@@ -345,14 +367,12 @@ async def check_token(
     elif decoded["is_expired"]:
         raise FunctionError("EXPIRED_TOKEN", 401, None)
 
-    result = await db.fetchrow(
-        """
-        SELECT user_id FROM auth_keys
-        WHERE user_id = $1
-        AND token_secret = $2
-        AND session_id = $3
-        """, decoded["user_id"], decoded["secret"], decoded["session_id"]
-    )
+    # Sessions are read right after login, a replica may not have them
+    async with conn.primary_reads():
+        result = await catalog.fetchrow(
+            db, SESSION_BY_TOKEN,
+            decoded["user_id"], decoded["secret"], decoded["session_id"]
+        )
 
     if result is None:
         raise FunctionError("INVALID_TOKEN", 401, None)
@@ -1,18 +1,27 @@
 import asyncio
-from dataclasses import asdict
+from dataclasses import dataclass, field
+import os
 import time
 from typing import Any, TypeVar
 from aiocache import Cache as AioCache  # type: ignore
 from aiocache import RedisCache
 from redis import ConnectionError
+from redis.exceptions import RedisError
 from aiocache.serializers import PickleSerializer  # type: ignore
 import utils.users
 import utils.posts
+import utils.comments
 from utils.users import User
 from utils.posts import Post
-from core import FunctionError
+import orjson
+from core import FunctionError, await_if_cor
+from core import get_proc_identity, server_id, _logger
 from utils.database import AutoConnection
+from utils.redis_topology import hash_tag
+from utils.shared_cache import SharedCache
+from utils.hot_keys import HotKeys
 from utils.generation import decode_token
+import utils.auth
 from utils.auth import secret_key, check_token
 from collections import OrderedDict
 import heapq
@@ -21,21 +30,105 @@ from state import redis
 
 R = TypeVar('R')
 
+# Tombstone stored in place of entities that do not exist
+MISSING = "\0missing"
+MISSING_TTL = 30
+
+# Redis sets with keys of every entry registered under a tag. An
+# entry's own tag shares its hash tag (`posts:{id}`, `post:{id}`) and
+# is written with it atomically. Other tags (a post's `user:{author}`)
+# may live on another node with sharded or clustered Redis, see
+# Cache.set.
+TAG_PREFIX = "cache_tag:"
+TAG_TTL = 3600
+
+# Pub/sub channel with keys every worker has to drop from its L2
+INVALIDATE_CHANNEL = "cache_invalidate"
+
+# Hot keys stay longer in L2 and are re-read from Redis in background
+# once their L2 copy is older than HOT_REFRESH_AFTER seconds
+HOT_L2_TTL = 30
+HOT_REFRESH_AFTER = 5
+
+# Redis hash with the latest stats snapshot of every worker
+STATS_KEY = "cache_stats"
+STATS_TTL = 120
+
+# Optional L2 shared by all workers of the host
+shared_cache_enabled = os.getenv("SHARED_CACHE") == "True"
+shared_cache_path = os.getenv("SHARED_CACHE_PATH", "/dev/shm/linkverse-cache")
+shared_cache_slots = int(os.getenv("SHARED_CACHE_SLOTS", "16384"))
+
+# Startup warm-up, the budget is in seconds
+warmup_budget = float(os.getenv("WARMUP_BUDGET", "2"))
+warmup_posts = int(os.getenv("WARMUP_POSTS", "200"))
+warmup_sessions = int(os.getenv("WARMUP_SESSIONS", "500"))
+
+
+@dataclass
+class TierStats:
+    hits: int = 0
+    misses: int = 0
+    time: float = 0.0
+
+    @property
+    def dict(self) -> dict[str, t.Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "avg_latency_ms": self.time / lookups * 1000 if lookups else 0.0
+        }
+
+
+@dataclass
+class CacheStats:
+    namespaces: dict[str, dict[str, TierStats]] = field(default_factory=dict)
+
+    def record(
+        self, key: str, tier: t.Literal["l1", "l2", "shm", "l3"],
+        hit: bool, started: float
+    ) -> None:
+        namespace = key.split(":", 1)[0]
+        tiers = self.namespaces.setdefault(namespace, {})
+        stats = tiers.setdefault(tier, TierStats())
+        if hit:
+            stats.hits += 1
+        else:
+            stats.misses += 1
+        stats.time += time.perf_counter() - started
+
+    @property
+    def dict(self) -> dict[str, t.Any]:
+        return {
+            namespace: {tier: stats.dict for tier, stats in tiers.items()}
+            for namespace, tiers in self.namespaces.items()
+        }
+
 
 class TTLCache:
     def __init__(self, max_size: int = 5000) -> None:
         self.cache: OrderedDict[str, tuple[Any, float]] = OrderedDict()
+        self.tags: dict[str, set[str]] = {}
         self.read_lock = asyncio.Lock()
         self.write_lock = asyncio.Lock()
         self.max_size = max_size
+        self.expired = 0
+        self.evicted = 0
 
-    async def set(self, key: str, value: Any, timeout: float) -> None:
+    async def set(
+        self, key: str, value: Any, timeout: float,
+        tags: t.Iterable[str] = ()
+    ) -> None:
         async with self.write_lock:
             expire_time = time.time() + timeout
             if key in self.cache:
                 self.cache.pop(key)
             self.cache[key] = (value, expire_time)
             self.cache.move_to_end(key)
+            for tag in tags:
+                self.tags.setdefault(tag, set()).add(key)
 
     async def get(self, key: str) -> Any | None:
         item = self.cache.get(key)
@@ -47,10 +140,23 @@ class TTLCache:
         else:
             return None
 
+    def ttl(self, key: str) -> float | None:
+        item = self.cache.get(key)
+        if item is None:
+            return None
+        return item[1] - time.time()
+
     async def delete(self, key: str) -> None:
         async with self.write_lock:
             self.cache.pop(key, None)
 
+    async def delete_tag(self, tag: str) -> t.Set[str]:
+        async with self.write_lock:
+            keys = self.tags.pop(tag, set())
+            for key in keys:
+                self.cache.pop(key, None)
+            return keys
+
     async def cleanup(self) -> None:
         async with self.write_lock:
             current_time = time.time()
@@ -61,6 +167,7 @@ class TTLCache:
             ]
             for key in expired_keys:
                 self.cache.pop(key, None)
+            self.expired += len(expired_keys)
 
             if len(self.cache) > self.max_size:
                 expiring_keys = [
@@ -74,10 +181,18 @@ class TTLCache:
                 ]
                 for key in keys_to_delete:
                     self.cache.pop(key, None)
+                self.evicted += len(keys_to_delete)
+
+            for tag in list(self.tags.keys()):
+                keys = self.tags[tag]
+                keys.intersection_update(self.cache.keys())
+                if not keys:
+                    del self.tags[tag]
 
     async def clear(self) -> None:
         async with self.write_lock:
             self.cache.clear()
+            self.tags.clear()
 
 
 class Cache:
@@ -90,54 +205,246 @@ class Cache:
             raise ValueError("Only Redis cache is supported!")
 
         self.cache.serializer = PickleSerializer()
+        # Commands go through the configured Redis topology
+        self.cache.client = redis
         self.ttl_cache = TTLCache()
+        self.shared_cache = (
+            SharedCache(shared_cache_path, shared_cache_slots)
+            if shared_cache_enabled else None
+        )
+        self.stats = CacheStats()
+        self.hot_keys = HotKeys()
+        self.refreshing: set[str] = set()
         cache_instance = self
 
     async def init(self) -> None:
         asyncio.create_task(self.clear_ttl_timer())
+        asyncio.create_task(self.invalidation_listener())
+
+    async def invalidation_listener(self) -> None:
+        while True:
+            pubsub = redis.pubsub()
+            try:
+                await pubsub.subscribe(INVALIDATE_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    for key in orjson.loads(message["data"]):
+                        await self.ttl_cache.delete(key)
+                        if self.shared_cache:
+                            self.shared_cache.delete(key)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                if isinstance(e, (RedisError, OSError)):
+                    _logger.warning(f"Cache invalidation listener failed: {e}")
+                else:
+                    _logger.exception(e)
+            finally:
+                await pubsub.aclose()
+            await asyncio.sleep(5)
+
+    async def publish_invalidation(self, keys: t.Iterable[str]) -> None:
+        await redis.publish(INVALIDATE_CHANNEL, orjson.dumps(list(keys)))
 
     async def clear_ttl_timer(self):
         while True:
             await asyncio.sleep(15)
             await self.ttl_cache.cleanup()
+            # Demoted keys drop their long L2 copy right away
+            for key in self.hot_keys.decay():
+                await self.ttl_cache.delete(key)
+            try:
+                await self.publish_stats()
+            except ConnectionError:
+                pass
+
+    def stats_snapshot(self) -> dict[str, t.Any]:
+        return {
+            "updated_at": time.time(),
+            "l2": {
+                "size": len(self.ttl_cache.cache),
+                "max_size": self.ttl_cache.max_size,
+                "expired": self.ttl_cache.expired,
+                "evicted": self.ttl_cache.evicted
+            },
+            "shm": (
+                self.shared_cache.usage()
+                if self.shared_cache else None
+            ),
+            "namespaces": self.stats.dict,
+            "hot_keys": self.hot_keys.top()
+        }
+
+    async def publish_stats(self) -> None:
+        pipe = redis.pipeline(transaction=False)
+        pipe.hset(
+            STATS_KEY, f"{server_id}:{get_proc_identity()}",
+            orjson.dumps(self.stats_snapshot())
+        )
+        pipe.expire(STATS_KEY, STATS_TTL)
+        await pipe.execute()
 
     async def get(self, key: str, conn: AutoConnection | None = None) -> Any:
         # Check L1 (connection cache)
-        if conn and (cached_l1 := conn.temp_cache.get(key)) is not None:
-            return cached_l1
+        if conn:
+            started = time.perf_counter()
+            cached_l1 = conn.temp_cache.get(key)
+            self.stats.record(key, "l1", cached_l1 is not None, started)
+            if cached_l1 is not None:
+                return cached_l1
+
+        self.hot_keys.record(key)
 
         # Check L2 (local worker cache)
-        if (cached_l2 := await self.ttl_cache.get(key)) is not None:
+        started = time.perf_counter()
+        cached_l2 = await self.ttl_cache.get(key)
+        self.stats.record(key, "l2", cached_l2 is not None, started)
+        if cached_l2 is not None:
             if conn:
                 conn.temp_cache[key] = cached_l2
+            if self.hot_keys.is_hot(key):
+                self.refresh_ahead(key)
             return cached_l2
 
-        # Check L3 (Redis cache)
-        try:
-            if (cached_l3 := await self.cache.get(key)) is not None:
-                # Store in L1 for future requests
+        # Check shared L2 (host cache)
+        if self.shared_cache:
+            started = time.perf_counter()
+            cached_shm = self.shared_cache.get(key)
+            self.stats.record(key, "shm", cached_shm is not None, started)
+            if cached_shm is not None:
                 if conn:
-                    conn.temp_cache[key] = cached_l3
+                    conn.temp_cache[key] = cached_shm
+                await self.ttl_cache.set(
+                    key, cached_shm, self.l2_timeout(key, 5)
+                )
+                return cached_shm
 
-                # Store in L2 with TTL = 5 seconds
-                await self.ttl_cache.set(key, cached_l3, 5)
-                return cached_l3
+        # Check L3 (Redis cache)
+        started = time.perf_counter()
+        try:
+            cached_l3 = await self.cache.get(key)
         except ConnectionError:
-            pass  # Redis connection error, return None
+            cached_l3 = None  # Redis connection error, return None
+        self.stats.record(key, "l3", cached_l3 is not None, started)
+
+        if cached_l3 is not None:
+            # Store in L1 for future requests
+            if conn:
+                conn.temp_cache[key] = cached_l3
+
+            # Store in L2 with TTL = 5 seconds, longer for hot keys
+            await self.ttl_cache.set(
+                key, cached_l3, self.l2_timeout(key, 5)
+            )
+            if self.shared_cache:
+                self.shared_cache.set(key, cached_l3, 5)
+            return cached_l3
 
         return None
 
     async def set(
         self, key: str, value: Any, ttl: int | None = None,
-        conn: AutoConnection | None = None
+        conn: AutoConnection | None = None,
+        tags: t.Iterable[str] = ()
     ) -> None:
         if conn:
             conn.temp_cache[key] = value
 
-        await self.ttl_cache.set(key, value, 10)
+        await self.ttl_cache.set(key, value, self.l2_timeout(key, 10), tags)
+        if self.shared_cache:
+            self.shared_cache.set(key, value, 10)
+
+        try:
+            if not tags:
+                await self.cache.set(key, value, ttl or 10)
+                return
+
+            # A MULTI can't span nodes or slots, tags hashed elsewhere
+            # are added first in a pipeline of their own. Membership and
+            # value aren't atomic for them: an invalidation of such a tag
+            # between the two writes can leave the entry until its TTL.
+            local = [
+                tag for tag in tags
+                if hash_tag(f"{TAG_PREFIX}{tag}") == hash_tag(key)
+            ]
+            if foreign := [tag for tag in tags if tag not in local]:
+                pipe = redis.pipeline(transaction=False)
+                for tag in foreign:
+                    pipe.sadd(f"{TAG_PREFIX}{tag}", key)
+                    pipe.expire(f"{TAG_PREFIX}{tag}", TAG_TTL)
+                await pipe.execute()
+
+            pipe = redis.pipeline(transaction=True)
+            pipe.set(key, self.cache.serializer.dumps(value), ex=ttl or 10)
+            for tag in local:
+                pipe.sadd(f"{TAG_PREFIX}{tag}", key)
+                pipe.expire(f"{TAG_PREFIX}{tag}", TAG_TTL)
+            await pipe.execute()
+        except ConnectionError:
+            pass
+
+    def l2_timeout(self, key: str, default: float) -> float:
+        return HOT_L2_TTL if self.hot_keys.is_hot(key) else default
+
+    def refresh_ahead(self, key: str) -> None:
+        remaining = self.ttl_cache.ttl(key)
+        if (
+            remaining is None
+            or remaining > HOT_L2_TTL - HOT_REFRESH_AFTER
+            or key in self.refreshing
+        ):
+            return
+        self.refreshing.add(key)
+        asyncio.create_task(self.refresh(key))
+
+    async def refresh(self, key: str) -> None:
+        try:
+            value = await self.cache.get(key)
+        except ConnectionError:
+            return
+        finally:
+            self.refreshing.discard(key)
+
+        if key not in self.ttl_cache.cache:
+            # Invalidated while reading, the value may be stale already
+            return
+        elif value is None:
+            # Gone from Redis, the next read loads it from the source
+            await self.ttl_cache.delete(key)
+        else:
+            await self.ttl_cache.set(key, value, HOT_L2_TTL)
+
+    async def set_missing(
+        self, key: str,
+        conn: AutoConnection | None = None,
+        tags: t.Iterable[str] = ()
+    ) -> None:
+        await self.set(key, MISSING, MISSING_TTL, conn, tags)
+
+    async def set_many(
+        self, entries: dict[str, tuple[Any, t.Iterable[str]]],
+        ttl: int
+    ) -> None:
+        """Same as `set` for many keys, but in one Redis round trip"""
+        if not entries:
+            return
+
+        # Entries live on different nodes, so this can't be one MULTI,
+        # tags are added before their entry as in `set`
+        pipe = redis.pipeline(transaction=False)
+        for key, (value, tags) in entries.items():
+            await self.ttl_cache.set(key, value, 10, tags)
+            if self.shared_cache:
+                self.shared_cache.set(key, value, 10)
+
+            for tag in tags:
+                pipe.sadd(f"{TAG_PREFIX}{tag}", key)
+                pipe.expire(f"{TAG_PREFIX}{tag}", TAG_TTL)
+            pipe.set(key, self.cache.serializer.dumps(value), ex=ttl)
 
         try:
-            await self.cache.set(key, value, ttl or 10)
+            await pipe.execute()
         except ConnectionError:
             pass
 
@@ -149,11 +456,43 @@ class Cache:
             conn.temp_cache.pop(key, None)
 
         await self.ttl_cache.delete(key)
+        if self.shared_cache:
+            self.shared_cache.delete(key)
         try:
             await self.cache.delete(key)
+            await self.publish_invalidation((key,))
         except ConnectionError:
             pass
 
+    async def invalidate_tag(
+        self, tag: str,
+        conn: AutoConnection | None = None
+    ) -> None:
+        keys = await self.ttl_cache.delete_tag(tag)
+
+        try:
+            pipe = redis.pipeline()
+            pipe.smembers(f"{TAG_PREFIX}{tag}")
+            pipe.delete(f"{TAG_PREFIX}{tag}")
+            members, _ = await pipe.execute()
+            keys.update(
+                key.decode() if isinstance(key, bytes) else key
+                for key in members
+            )
+            if keys:
+                await redis.delete(*keys)
+                await self.publish_invalidation(keys)
+        except ConnectionError:
+            pass
+
+        if self.shared_cache:
+            for key in keys:
+                self.shared_cache.delete(key)
+
+        if conn:
+            for key in keys:
+                conn.temp_cache.pop(key, None)
+
 
 class UninitializedCache(Cache):
     def __init__(self, url: ... = ...) -> None:
@@ -168,10 +507,56 @@ class UninitializedCache(Cache):
     async def delete(self, *args: Any, **kwargs: Any) -> Any:
         raise RuntimeError("Cache was not initialized")
 
+    async def invalidate_tag(self, *args: Any, **kwargs: Any) -> Any:
+        raise RuntimeError("Cache was not initialized")
+
+
+async def get_hot_keys() -> list[dict[str, t.Any]]:
+    """Hot keys of all workers, reads are summed per key"""
+    totals: dict[str, int] = {}
+    workers: dict[str, int] = {}
+    for snapshot in (await get_stats()).values():
+        for key, reads in snapshot.get("hot_keys", ()):
+            totals[key] = totals.get(key, 0) + reads
+            workers[key] = workers.get(key, 0) + 1
+
+    return [
+        {"key": key, "reads": reads, "workers": workers[key]}
+        for key, reads in sorted(
+            totals.items(), key=lambda item: item[1], reverse=True
+        )
+    ]
+
+
+async def get_stats() -> dict[str, t.Any]:
+    """Stats snapshots of all workers that reported recently"""
+    raw = await await_if_cor(redis.hgetall(STATS_KEY))
+    now = time.time()
+
+    workers = {}
+    for worker, value in raw.items():
+        snapshot = orjson.loads(value)
+        if now - snapshot["updated_at"] > STATS_TTL:
+            continue
+        name = worker.decode() if isinstance(worker, bytes) else worker
+        workers[name] = snapshot
+
+    return workers
+
 
 cache_instance: Cache = UninitializedCache()
 
 
+# Keys of pickled records carry their class version
+def user_key(user_id: str, minimize_info: bool = False) -> str:
+    suffix = ":min" if minimize_info else ""
+    return f"user_profile:{{{user_id}}}{suffix}:{User.version}"
+
+
+def post_key(post_id: str) -> str:
+    return f"posts:{{{post_id}}}:{Post.version}"
+
+
 class users:
     @staticmethod
     async def get_user(
@@ -180,33 +565,100 @@ class users:
         _cache_instance: Cache | None = None
     ) -> User:
         cache = _cache_instance or cache_instance
-        key = f"user_profile:{user_id}{":min" if minimize_info else ""}"
+        key = user_key(user_id, minimize_info)
+        tags = (f"user:{{{user_id}}}",)
 
         value = await cache.get(key, conn)
 
-        if value is None:
-            result = await utils.users.get_user(user_id, conn, minimize_info)
-            data = asdict(result)
-
-            await cache.set(key, data, 600, conn)
+        if value == MISSING:
+            raise FunctionError("USER_DOES_NOT_EXIST", 404, None)
+        elif value is None:
+            # A lagging replica could fill the entry with the row from
+            # before the write that invalidated it
+            try:
+                async with conn.primary_reads():
+                    result = await utils.users.get_user(
+                        user_id, conn, minimize_info
+                    )
+            except FunctionError as e:
+                if e.code == 404:
+                    await cache.set_missing(key, conn, tags)
+                raise e
+            # Records are immutable, so every tier keeps the object itself
+            await cache.set(key, result, 600, conn, tags)
 
             return result
-        else:
+        elif isinstance(value, dict):
             return User.from_dict(value)
+        else:
+            return value
+
+    @staticmethod
+    async def get_users(
+        user_ids: list[str], conn: AutoConnection,
+        minimize_info: bool = False,
+        _cache_instance: Cache | None = None
+    ) -> dict[str, User]:
+        """Same as `get_user` for many users, misses in one query
+
+        Users that don't exist are left out.
+        """
+        cache = _cache_instance or cache_instance
+        keys = {
+            user_id: user_key(user_id, minimize_info) for user_id in user_ids
+        }
+        values = await asyncio.gather(*(
+            cache.get(key, conn) for key in keys.values()
+        ))
+
+        result: dict[str, User] = {}
+        missed = []
+        for user_id, value in zip(keys, values):
+            if value is None:
+                missed.append(user_id)
+            elif isinstance(value, dict):
+                result[user_id] = User.from_dict(value)
+            elif value != MISSING:
+                result[user_id] = value
+
+        if missed:
+            async with conn.primary_reads():
+                fetched = await utils.users.get_users(
+                    missed, conn, minimize_info
+                )
+            await cache.set_many({
+                keys[user.user_id]: (user, (f"user:{{{user.user_id}}}",))
+                for user in fetched
+            }, 600)
+            result.update((user.user_id, user) for user in fetched)
+
+        return result
+
+    @staticmethod
+    async def get_user_me(
+        user_id: str, conn: AutoConnection,
+        _cache_instance: Cache | None = None
+    ) -> dict[str, t.Any]:
+        cache = _cache_instance or cache_instance
+        key = f"user_me:{{{user_id}}}"
+
+        value = await cache.get(key, conn)
+
+        if value is None:
+            user = await users.get_user(user_id, conn, _cache_instance=cache)
+            value = user.dict
+            value["permissions"] = utils.users.ROLE_PERMISSIONS[user.role_id]
+            await cache.set(key, value, 600, conn, (f"user:{{{user_id}}}",))
+
+        return value
 
     @staticmethod
     async def delete_user_cache(
         user_id: str, _cache_instance: Cache | None = None
     ) -> None:
+        """Drops everything cached about the user, incl. /me views"""
         cache = _cache_instance or cache_instance
-        key = f"user_profile:{user_id}"
-        key2 = f"user_profile:{user_id}:min"
-        value = await cache.get(key)
-        value2 = await cache.get(key2)
-        if value is not None:
-            await cache.delete(key)
-        if value2 is not None:
-            await cache.delete(key2)
+        await cache.invalidate_tag(f"user:{{{user_id}}}")
 
 
 class posts:
@@ -216,29 +668,80 @@ class posts:
         _cache_instance: Cache | None = None
     ) -> Post:
         cache = _cache_instance or cache_instance
-        key = f"posts:{post_id}"
+        key = post_key(post_id)
+        tags = (f"post:{{{post_id}}}",)
 
         value = await cache.get(key, conn)
 
-        if value is None:
-            result = await utils.posts.get_post(post_id, conn)
-            data = asdict(result)
-
-            await cache.set(key, data, 15, conn)
+        if value == MISSING:
+            raise FunctionError("POST_DOES_NOT_EXIST", 404, None)
+        elif value is None:
+            try:
+                async with conn.primary_reads():
+                    result = await utils.posts.get_post(post_id, conn)
+            except FunctionError as e:
+                if e.code == 404:
+                    await cache.set_missing(key, conn, tags)
+                raise e
+            # Also dropped with everything cached about the author, e.g.
+            # when the account (and with it the post) is deleted
+            await cache.set(
+                key, result, 15, conn, (*tags, f"user:{{{result.user_id}}}")
+            )
 
             return result
-        else:
+        elif isinstance(value, dict):
             return Post.from_dict(value)
+        else:
+            return value
 
     @staticmethod
     async def remove_post_cache(
         post_id: str, _cache_instance: Cache | None = None
     ) -> None:
         cache = _cache_instance or cache_instance
-        key = f"posts:{post_id}"
-        value = await cache.get(key)
-        if value is not None:
-            await cache.delete(key)
+        await cache.invalidate_tag(f"post:{{{post_id}}}")
+
+
+class comments:
+    @staticmethod
+    async def get_comment(
+        post_id: str, comment_id: str,
+        conn: AutoConnection,
+        _cache_instance: Cache | None = None
+    ) -> utils.comments.Comment:
+        # Only misses are cached, counters change too often
+        cache = _cache_instance or cache_instance
+        key = f"comments:{{{post_id}}}:{comment_id}"
+
+        if await cache.get(key, conn) == MISSING:
+            raise FunctionError("COMMENT_DOES_NOT_EXIST", 404, None)
+
+        try:
+            return await utils.comments.get_comment(post_id, comment_id, conn)
+        except FunctionError as e:
+            if e.code != 404:
+                raise e
+
+        # Replicas may not have a new comment yet, only a miss of the
+        # primary is cached
+        try:
+            async with conn.primary_reads():
+                return await utils.comments.get_comment(
+                    post_id, comment_id, conn
+                )
+        except FunctionError as e:
+            if e.code == 404:
+                await cache.set_missing(key, conn, (f"post:{{{post_id}}}",))
+            raise e
+
+    @staticmethod
+    async def remove_comment_cache(
+        post_id: str, comment_id: str,
+        _cache_instance: Cache | None = None
+    ) -> None:
+        cache = _cache_instance or cache_instance
+        await cache.delete(f"comments:{{{post_id}}}:{comment_id}")
 
 
 class auth:
@@ -255,24 +758,46 @@ class auth:
         elif decoded["is_expired"]:
             raise FunctionError("EXPIRED_TOKEN", 401, None)
 
-        key = f"auth:{decoded["user_id"]}:{decoded["secret"]}"
+        key = f"auth:{{{decoded["user_id"]}}}:{decoded["secret"]}"
         value = await cache.get(key, conn)
         if value is None:
             await check_token(token, conn, decoded)
             ttl = decoded["expiration_timestamp"] - int(time.time())
-            await cache.set(key, "1", min(max(0, ttl), 60), conn)
+            await cache.set(
+                key, "1", min(max(0, ttl), 60), conn,
+                tags=(f"auth:{{{decoded["user_id"]}}}",)
+            )
         return decoded
 
+    @staticmethod
+    async def get_auth_me(
+        user_id: str, conn: AutoConnection,
+        _cache_instance: Cache | None = None
+    ) -> dict[str, t.Any]:
+        cache = _cache_instance or cache_instance
+        key = f"auth_me:{{{user_id}}}"
+
+        value = await cache.get(key, conn)
+
+        if value is None:
+            async with conn.primary_reads():
+                user = await utils.auth.get_user(user_id, conn)
+            # The password hash never goes to the cache
+            value = user.dict
+            del value["password_hash"]
+            await cache.set(key, value, 600, conn, (f"user:{{{user_id}}}",))
+
+        return value
+
     @staticmethod
     async def clear_token_cache(
         decoded: dict,
         _cache_instance: Cache | None = None
     ) -> None:
         cache = _cache_instance or cache_instance
-        key = f"auth:{decoded["user_id"]}:{decoded["secret"]}"
-        value = await cache.get(key)
-        if value is not None:
-            await cache.delete(key)
+        await cache.delete(
+            f"auth:{{{decoded["user_id"]}}}:{decoded["secret"]}"
+        )
 
     @staticmethod
     async def clear_all_tokens(
@@ -280,14 +805,35 @@ class auth:
         _cache_instance: Cache | None = None
     ) -> None:
         cache = _cache_instance or cache_instance
-        pattern = f"auth:{user_id}:*"
-
-        cursor: t.Any = b"0"
-        while cursor:
-            cursor, keys = await redis.scan(
-                cursor=cursor, match=pattern, count=1000
+        await cache.invalidate_tag(f"auth:{{{user_id}}}")
+
+
+async def warm_up(
+    conn: AutoConnection,
+    _cache_instance: Cache | None = None
+) -> None:
+    """Preloads popular posts, their authors and recent sessions"""
+    cache = _cache_instance or cache_instance
+    async with conn.primary_reads():
+        popular = await utils.posts.get_popular_posts(warmup_posts, conn)
+        await cache.set_many({
+            post_key(post.post_id): (post, (
+                f"post:{{{post.post_id}}}", f"user:{{{post.user_id}}}"
+            ))
+            for post in popular
+        }, 15)
+
+        user_ids = list({post.user_id for post in popular})
+        authors = await utils.users.get_users(user_ids, conn, True)
+        await cache.set_many({
+            user_key(user.user_id, True): (
+                user, (f"user:{{{user.user_id}}}",)
             )
-            if keys:
-                await redis.delete(*keys)
-                for key in keys:
-                    await cache.ttl_cache.delete(key)
+            for user in authors
+        }, 600)
+
+        sessions = await utils.auth.get_recent_sessions(warmup_sessions, conn)
+        await cache.set_many({
+            f"auth:{{{user_id}}}:{secret}": ("1", (f"auth:{{{user_id}}}",))
+            for user_id, secret in sessions
+        }, 60)
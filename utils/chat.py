@@ -3,7 +3,6 @@
 import datetime
 import typing as t
 from utils.database import AutoConnection
-import orjson
 from utils.generation import generate_id
 from core import FunctionError
 from utils.storage import build_get_link
@@ -16,10 +15,14 @@ class UserChannel(t.TypedDict):
     last_read_message_id: str
     last_read_at: datetime.datetime
     joined_at: datetime.datetime
-    metadata: str | None  # JSONB
+    metadata: dict[str, t.Any] | None
     type: t.Literal['direct', 'group']
     created_at: datetime.datetime
     members: list[str]
+    last_message_id: str | None
+    last_message_user_id: str | None
+    last_message_preview: str | None
+    last_message_at: datetime.datetime | None
 
 
 class Message(t.TypedDict):
@@ -34,14 +37,24 @@ class Message(t.TypedDict):
     media: list[str]
 
 
+# Maintained by triggers, see sql/12_channel_summaries.pgsql
+CHANNEL_SUMMARY_COLUMNS = """
+    user_id, channel_id, membership_id, last_read_message_id,
+    last_read_at, joined_at, metadata, type, created_at, members,
+    last_message_id, last_message_user_id, last_message_preview,
+    last_message_at
+"""
+
+
 async def get_user_channels(
     user_id: str, conn: AutoConnection
 ) -> list[UserChannel]:
     db = await conn.create_conn()
-    query = """
-        SELECT *
-        FROM user_channel_view
+    query = f"""
+        SELECT {CHANNEL_SUMMARY_COLUMNS}
+        FROM user_channel_summaries
         WHERE user_id = $1
+        ORDER BY last_message_id_num DESC NULLS LAST
     """
     rows = await db.fetch(query, user_id)
     return [
@@ -56,9 +69,9 @@ async def get_user_channel(
     conn: AutoConnection
 ) -> UserChannel:
     db = await conn.create_conn()
-    query = """
-        SELECT *
-        FROM user_channel_view
+    query = f"""
+        SELECT {CHANNEL_SUMMARY_COLUMNS}
+        FROM user_channel_summaries
         WHERE user_id = $1 AND channel_id = $2
     """
     row: t.Any = await db.fetchrow(query, user_id, channel_id)
@@ -81,7 +94,7 @@ async def create_channel(
     """
     new_channel_id = str(generate_id())
     row: t.Any = await db.fetchrow(
-        query, type, orjson.dumps(metadata).decode(), new_channel_id
+        query, type, metadata, new_channel_id
     )
     channel_id = row['channel_id']
 
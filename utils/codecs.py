@@ -0,0 +1,60 @@
+import datetime
+import os
+import typing as t
+import asyncpg
+import orjson
+
+# timestamptz columns decode to unix seconds (int) instead of datetime,
+# datetimes and numbers are both accepted as parameters
+epoch_timestamps = os.getenv("DB_EPOCH_TIMESTAMPS") == "True"
+
+# Postgres counts timestamps in microseconds from 2000-01-01 UTC
+PG_EPOCH = datetime.datetime(2000, 1, 1, tzinfo=datetime.UTC)
+PG_EPOCH_UNIX = int(PG_EPOCH.timestamp())
+JSONB_VERSION = b"\x01"
+
+
+def encode_jsonb(value: t.Any) -> bytes:
+    return JSONB_VERSION + orjson.dumps(value)
+
+
+def decode_jsonb(data: bytes) -> t.Any:
+    return orjson.loads(data[1:])
+
+
+def encode_epoch(value: datetime.datetime | int | float) -> tuple[int]:
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.UTC)
+        delta = value - PG_EPOCH
+        return ((delta.days * 86400 + delta.seconds) * 1_000_000
+                + delta.microseconds,)
+    return (round((value - PG_EPOCH_UNIX) * 1_000_000),)
+
+
+def decode_epoch(value: tuple[int]) -> int:
+    return value[0] // 1_000_000 + PG_EPOCH_UNIX
+
+
+def unix_time(value: datetime.datetime | int) -> int:
+    """Unix seconds of a timestamptz value, whichever codec decoded it"""
+    if isinstance(value, datetime.datetime):
+        return int(value.timestamp())
+    return value
+
+
+async def register_codecs(conn: asyncpg.Connection) -> None:
+    """JSON in and out with orjson, already parsed in rows"""
+    await conn.set_type_codec(
+        "jsonb", schema="pg_catalog", format="binary",
+        encoder=encode_jsonb, decoder=decode_jsonb
+    )
+    await conn.set_type_codec(
+        "json", schema="pg_catalog", format="binary",
+        encoder=orjson.dumps, decoder=orjson.loads
+    )
+    if epoch_timestamps:
+        await conn.set_type_codec(
+            "timestamptz", schema="pg_catalog", format="tuple",
+            encoder=encode_epoch, decoder=decode_epoch
+        )
@@ -2,6 +2,7 @@ from utils.database import AutoConnection
 from utils.moderation import get_audit_data
 from utils.cache import posts as cache_posts
 from utils.cache import users as cache_users
+from utils.cache import comments as cache_comments
 import utils.posts as posts
 import utils.comments as comments
 from core import FunctionError
@@ -21,7 +22,7 @@ async def get_entity(
     if loaded_entity is None:
         fetch_func = (
             cache_posts.get_post if entity_type == "post"
-            else comments.get_comment if post_id is not None
+            else cache_comments.get_comment if post_id is not None
             else comments.get_comment_directly
         )
         entity = (
@@ -1,13 +1,15 @@
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 from core import FunctionError
 from utils.generation import generate_id, parse_id
 import typing as t
-from utils.database import AutoConnection, condition
+from utils.database import AutoConnection, pending_count
+from utils.queries import catalog
 from schemas import ListsDefault
+from utils.records import Record
 
 
-@dataclass
-class Comment:
+@dataclass(slots=True, frozen=True)
+class Comment(Record):
     comment_id: str
     post_id: str
     user_id: str
@@ -22,9 +24,8 @@ class Comment:
     def created_at(self) -> float:
         return parse_id(self.comment_id)[0]
 
-    @property
-    def dict(self) -> dict:
-        dict = asdict(self)
+    def _build_dict(self) -> dict:
+        dict = self.to_dict()
         dict['created_at'] = int(self.created_at)
         return dict
 
@@ -79,10 +80,11 @@ async def get_comment(
     conn: AutoConnection
 ) -> Comment:
     db = await conn.create_conn()
-    query = """
+    query = f"""
         SELECT c.comment_id, c.parent_comment_id, c.post_id, c.user_id,
-               c.content, c.likes_count, c.dislikes_count, c.type,
-               c.replies_count
+               c.content, c.type, c.replies_count,
+               {pending_count("c.likes_count", "comment", "c.comment_id")},
+               {pending_count("c.dislikes_count", "comment", "c.comment_id")}
         FROM comments c
         JOIN posts p ON c.post_id = p.post_id
         WHERE c.post_id = $1
@@ -102,10 +104,11 @@ async def get_comment_directly(
     conn: AutoConnection
 ) -> Comment:
     db = await conn.create_conn()
-    query = """
+    query = f"""
         SELECT comment_id, parent_comment_id, post_id, user_id,
-               content, likes_count, dislikes_count, type,
-               replies_count
+               content, type, replies_count,
+               {pending_count("likes_count", "comment", "comment_id")},
+               {pending_count("dislikes_count", "comment", "comment_id")}
         FROM comments
         WHERE comment_id = $1
     """
@@ -146,6 +149,84 @@ async def soft_delete_comment(
     )
 
 
+COMMENT_COLUMNS = f"""
+    comment_id, parent_comment_id, post_id, user_id, content,
+    {pending_count("likes_count", "comment", "comment_id")},
+    {pending_count("dislikes_count", "comment", "comment_id")},
+    replies_count, popularity_score, type, comment_id_num
+"""
+
+
+def comments_query(
+    cursor: int | None, has_parent: bool, type: str | None
+) -> str:
+    """`cursor` is the is_user_comment of the last row of the previous page
+
+    The user's own comments come first. That order is not an index order,
+    so both groups are read from idx_comments_thread separately, each
+    limited to a page, and only those rows are sorted together.
+    """
+    params = 2
+    if cursor is not None:
+        params += 1 if type == "update" else 2
+    where = "WHERE post_id = $1 AND parent_comment_id"
+    if has_parent:
+        params += 1
+        where += f" = ${params}"
+    else:
+        where += " IS NULL"
+
+    if type:
+        params += 1
+        where += f" AND type = ${params}"
+    limit = f"LIMIT ${params + 1}"
+
+    if type == "update":
+        return f"""
+            SELECT {COMMENT_COLUMNS},
+                   CASE WHEN user_id = $2 THEN 1 ELSE 0 END AS is_user_comment
+            FROM comments
+            {where}{"" if cursor is None else " AND comment_id_num > $3"}
+            ORDER BY comment_id_num
+            {limit}
+        """
+
+    after = " AND (popularity_score, comment_id_num) < ($3, $4)"
+    own = f"""
+        (SELECT {COMMENT_COLUMNS}, 1 AS is_user_comment
+         FROM comments
+         {where} AND user_id = $2{after if cursor == 1 else ""}
+         ORDER BY popularity_score DESC, comment_id_num DESC
+         {limit})
+    """
+    other = f"""
+        (SELECT {COMMENT_COLUMNS}, 0 AS is_user_comment
+         FROM comments
+         {where} AND user_id IS DISTINCT FROM $2{after if cursor == 0 else ""}
+         ORDER BY popularity_score DESC, comment_id_num DESC
+         {limit})
+    """
+    return f"""
+        SELECT * FROM ({other if cursor == 0 else own + "UNION ALL" + other})
+            AS ranked_comments
+        ORDER BY is_user_comment DESC, popularity_score DESC,
+                 comment_id_num DESC
+        {limit}
+    """
+
+
+COMMENTS = {
+    (cursor, has_parent, type): catalog.add(
+        f"comments.list:{cursor}{int(has_parent)}:{type}",
+        comments_query(cursor, has_parent, type),
+        hot=cursor is None and not has_parent and type is None
+    )
+    for cursor in (None, 0, 1)
+    for has_parent in (False, True)
+    for type in (None, "comment", "update")
+}
+
+
 async def get_comments(
     post_id: str,
     cursor: str | None,
@@ -157,68 +238,34 @@ async def get_comments(
 ) -> CommentList:
     db = await conn.create_conn()
     params: list[t.Any] = [post_id, user_id]
-
-    cte_query = """
-        WITH ranked_comments AS (
-            SELECT comment_id, parent_comment_id, post_id, user_id, content,
-                   likes_count, dislikes_count, replies_count,
-                   popularity_score, type,
-                   CASE WHEN user_id = $2 THEN 1 ELSE 0 END AS is_user_comment
-            FROM comments
-            WHERE post_id = $1
-        )
-    """
-
-    main_query = """
-        SELECT * FROM ranked_comments
-    """
+    is_user_comment: int | None = None
 
     if cursor:
         try:
             _is_user, _popularity_score, comment_id = cursor.split(",")
-            is_user_comment = int(_is_user)
+            is_user_comment = 1 if int(_is_user) else 0
             popularity_score = int(_popularity_score)
+            comment_id_num = int(comment_id)
         except ValueError:
             raise FunctionError("INVALID_CURSOR", 400, None)
+        if type == "update":
+            params.append(comment_id_num)
+        else:
+            params.extend([popularity_score, comment_id_num])
 
-        main_query += """
-            WHERE (is_user_comment < $3 OR
-                   (is_user_comment = $3 AND popularity_score < $4) OR
-                   (is_user_comment = $3 AND popularity_score = $4
-                    AND comment_id < $5))
-        """
-        params.extend([is_user_comment, popularity_score, comment_id])
-
-        _condition, _params = condition(parent_id, 6)
-        main_query += f" AND parent_comment_id {_condition}"
-        params.extend(_params)
-
-    else:
-        _condition, _params = condition(parent_id, 3)
-        main_query += f"WHERE parent_comment_id {_condition}"
-        params.extend(_params)
+    query = COMMENTS.get(
+        (is_user_comment, parent_id is not None, type or None)
+    )
+    if query is None:
+        raise FunctionError("UNKNOWN_COMMENT_TYPE", 404, None)
 
+    if parent_id is not None:
+        params.append(parent_id)
     if type:
-        main_query += f" AND type = ${len(params) + 1}"
         params.append(type)
+    params.append(limit + 1)
 
-    if not type or type == "comment":
-        main_query += """
-            ORDER BY is_user_comment DESC, popularity_score DESC,
-                    comment_id::bigint DESC
-        """
-    elif type == "update":
-        main_query += """
-            ORDER BY comment_id::bigint
-        """
-    else:
-        raise FunctionError("UNKNOWN_COMMENT_TYPE", 404, None)
-
-    main_query += f"""
-        LIMIT {limit + 1}
-    """
-
-    rows = await db.fetch(cte_query + main_query, *params)
+    rows = await catalog.fetch(db, query, *params)
     if not rows:
         raise FunctionError("NO_MORE_COMMENTS", 200, None)
 
@@ -234,7 +281,8 @@ async def get_comments(
     comments = [
         Comment(
             **{k: v for k, v in row.items()
-               if k not in ['popularity_score', 'is_user_comment']}
+               if k not in ['popularity_score', 'is_user_comment',
+                            'comment_id_num']}
         )
         for row in rows
     ]
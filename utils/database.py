@@ -1,15 +1,35 @@
 import os
-import re
 import asyncpg
 import asyncpg.transaction
-from core import worker_count, _logger
+from core import worker_count
+from utils.queries import catalog
+from utils.pool_budget import pool_budget
+from utils.replicas import replicas, is_read_only, REPLICA_ERRORS
+from utils.slow_queries import slow_queries
+from utils.codecs import register_codecs
+from utils.query_budget import BudgetedConnection, set_budgeted
+from quart import g, has_app_context
 import typing as t
 from collections import defaultdict
+from contextlib import asynccontextmanager
+
+# Connections kept open by every worker, and how long idle connections
+# above that stay before the pool closes them
+pool_min_size = int(os.getenv("DB_POOL_MIN", "2"))
+pool_idle_lifetime = float(os.getenv("DB_POOL_IDLE_LIFETIME", "60"))
+# Transaction pooling (PgBouncer) doesn't keep session-level state,
+# so named prepared statements are not used
+pgbouncer_mode = os.getenv("PGBOUNCER") == "True"
+# Long-lived sessions opened with `connect_direct` (the outbox relay's
+# LISTEN connection), kept out of the request budget
+reserved_connections = 1
+# Connection settings of the primary pool, for `connect_direct`
+direct_config: dict[str, t.Any] = {}
 
 
 def calculate_max_connections(max_shared: int, worker_count: int) -> int:
     _worker_count = max(worker_count, 1)
-    _max_shared = max(max_shared - 5, 1)
+    _max_shared = max(max_shared - 5 - reserved_connections, 1)
 
     max_connections = _max_shared // _worker_count
 
@@ -17,43 +37,68 @@ def calculate_max_connections(max_shared: int, worker_count: int) -> int:
 
 
 async def create_pool(**config) -> asyncpg.pool.Pool:
+    """Primary pool; `replicas` DSNs get pools of their own
+
+    Replica DSNs only need the address, credentials and database
+    are taken from the primary's config.
+    """
     max_shared = int(config.pop("max_shared", 100))
+    replica_dsns: list[str] = config.pop("replicas", [])
     max_connections = calculate_max_connections(max_shared, worker_count)
+    # The pool itself may grow up to the whole budget, the worker's
+    # share of it is enforced by `pool_budget`
+    budget = max(max_shared - 5 - reserved_connections, 1)
+    pool_budget.configure(budget, pool_min_size, max_connections)
+
+    if pgbouncer_mode:
+        catalog.prepare_statements = False
+        config["statement_cache_size"] = 0
+    direct_config.update(config)
+    if not pgbouncer_mode:
+        config["setup"] = catalog.setup
+    config["init"] = init_connection
 
+    config["connection_class"] = BudgetedConnection
     pool = await asyncpg.create_pool(
         **config,
-        min_size=1,
-        max_size=max_connections
+        min_size=pool_budget.min_size,
+        max_size=budget,
+        max_inactive_connection_lifetime=pool_idle_lifetime
     )
     if pool is None:
         raise
-    return pool
-
+    pool_budget.pool = pool
 
-async def execute_sql_file(db: asyncpg.Connection, file_path: str):
-    with open(file_path, 'r') as file:
-        sql = file.read()
-        await db.execute(sql)
+    replica_config = {
+        k: v for k, v in config.items() if k not in ("host", "port")
+    }
+    for dsn in replica_dsns:
+        replicas.add(await asyncpg.create_pool(
+            dsn,
+            **replica_config,
+            min_size=pool_budget.min_size,
+            max_size=max_connections,
+            max_inactive_connection_lifetime=pool_idle_lifetime
+        ))
+    return pool
 
 
-async def initialize_database(
-    db: asyncpg.Connection, sql_dir: str = "./sql/",
-    debug: bool = False
-) -> None:
-    sql_files = [f for f in os.listdir(sql_dir) if f.endswith('.pgsql')]
+async def init_connection(conn: asyncpg.Connection) -> None:
+    """Pool `init` callback"""
+    await register_codecs(conn)
+    await slow_queries.attach(conn)
 
-    def extract_number(filename: str) -> int:
-        match = re.match(r'(\d+)', filename)
-        return int(match.group()) if match else int('inf')
 
-    sql_files.sort(key=extract_number)
+async def connect_direct() -> asyncpg.Connection:
+    """Primary connection outside the pool and `pool_budget`
 
-    async with db.transaction():
-        for sql_file in sql_files:
-            file_path = os.path.join(sql_dir, sql_file)
-            ((_logger.info if debug else _logger.debug)
-             (f"Running {file_path}..."))
-            await execute_sql_file(db, file_path)
+    For sessions held for the worker's lifetime. Only
+    `reserved_connections` are left out of the budget for them, so
+    they must be held by one worker at a time (the relay leader).
+    """
+    conn = await asyncpg.connect(**direct_config)
+    await init_connection(conn)
+    return conn
 
 
 def condition(
@@ -64,18 +109,127 @@ def condition(
     return f"= ${parameter}", [value]
 
 
+def pending_count(column: str, target: str, key: str) -> str:
+    """Select expression of a counter plus its deltas not folded yet
+
+    `pending_count("p.likes_count", "post", "p.post_id")` selects
+    `likes_count`, see sql/10_counter_deltas.pgsql.
+    """
+    name = column.rsplit(".", 1)[-1]
+    return (
+        f"{column} + pending_delta('{target}', {key}, '{name}') AS {name}"
+    )
+
+
+def request_user_id() -> str | None:
+    return g.get("user_id") if has_app_context() else None
+
+
+class RoutedConnection:
+    """Connection handed out while reads may go to a replica
+
+    Read-only statements run on a replica until the request writes
+    or starts a transaction, everything after that runs on the
+    primary. Reads that fail on a replica are retried on the primary.
+    """
+
+    def __init__(self, conn: "AutoConnection") -> None:
+        self.conn = conn
+
+    async def run(
+        self, query: str,
+        call: t.Callable[[t.Any], t.Awaitable[t.Any]]
+    ) -> t.Any:
+        read = is_read_only(query)
+        if read:
+            db = await self.conn.replica_conn()
+            if db is not None:
+                try:
+                    return await call(db)
+                except REPLICA_ERRORS:
+                    await self.conn.drop_replica(failed=True)
+        return await call(await self.conn.primary_conn(write=not read))
+
+    async def fetch(self, query: str, *args, **kwargs) -> list:
+        return await self.run(
+            query, lambda db: db.fetch(query, *args, **kwargs)
+        )
+
+    async def fetchrow(self, query: str, *args, **kwargs) -> t.Any:
+        return await self.run(
+            query, lambda db: db.fetchrow(query, *args, **kwargs)
+        )
+
+    async def fetchval(self, query: str, *args, **kwargs) -> t.Any:
+        return await self.run(
+            query, lambda db: db.fetchval(query, *args, **kwargs)
+        )
+
+    async def execute(self, query: str, *args, **kwargs) -> str:
+        return await self.run(
+            query, lambda db: db.execute(query, *args, **kwargs)
+        )
+
+    async def executemany(self, query: str, *args, **kwargs) -> None:
+        db = await self.conn.primary_conn()
+        return await db.executemany(query, *args, **kwargs)
+
+    def transaction(self, **kwargs) -> "RoutedTransaction":
+        return RoutedTransaction(self.conn, kwargs)
+
+    def __getattr__(self, name: str) -> t.Any:
+        raise AttributeError(
+            f"{name} is not routed, use `conn.primary_conn()`"
+        )
+
+
+class RoutedTransaction:
+    def __init__(self, conn: "AutoConnection", kwargs: dict) -> None:
+        self.conn = conn
+        self.kwargs = kwargs
+        self._transaction: asyncpg.transaction.Transaction | None = None
+
+    async def __aenter__(self) -> asyncpg.transaction.Transaction:
+        db = await self.conn.primary_conn()
+        self._transaction = db.transaction(**self.kwargs)
+        return await self._transaction.__aenter__()
+
+    async def __aexit__(self, *exc) -> t.Any:
+        assert self._transaction is not None
+        return await self._transaction.__aexit__(*exc)
+
+
 class AutoConnection:
-    def __init__(self, pool: asyncpg.Pool) -> None:
+    def __init__(self, pool: asyncpg.Pool, primary: bool = False) -> None:
         self.pool = pool
         self.temp_cache: defaultdict[str, t.Any] = defaultdict(lambda: None)
         self._conn = None
         self._transaction: asyncpg.transaction.Transaction | None = None
+        # Reads go to replicas until the first write or transaction
+        self._pinned = primary or not replicas.pools
+        self._primary_reads = 0
+        self._wrote = False
+        self._replica_pool: asyncpg.Pool | None = None
+        self._replica_conn = None
+
+    @asynccontextmanager
+    async def primary_reads(self) -> t.AsyncIterator[None]:
+        """Runs the reads of the block on the primary
+
+        For reads that must not see replication lag, e.g. the ones that
+        fill the cache. Reads after the block may use a replica again.
+        """
+        self._primary_reads += 1
+        try:
+            yield
+        finally:
+            self._primary_reads -= 1
 
     async def start_transaction(self) -> None:
         if self._transaction is not None:
             return
 
-        db = await self.create_conn()
+        db = await self.primary_conn()
         self._transaction = db.transaction()
         await self._transaction.start()
 
@@ -88,19 +242,84 @@ class AutoConnection:
         exc: BaseException | None,
         tb: BaseException | None
     ) -> bool:
-        if self._transaction is not None:
-            if exc_type is None:
-                await self._transaction.commit()
-            else:
-                await self._transaction.rollback()
+        try:
+            if self._transaction is not None:
+                if exc_type is None:
+                    await self._transaction.commit()
+                else:
+                    await self._transaction.rollback()
+        finally:
+            # A failed commit must not leak the worker's pool slot
+            await self.release_conn()
+            await self.drop_replica()
+        if self._wrote and exc_type is None and replicas.pools:
+            await replicas.stick(request_user_id())
+        return False
 
-        if self._conn is not None:
+    async def release_conn(self) -> None:
+        if self._conn is None:
+            return
+        set_budgeted(self._conn, False)
+        try:
             await self.pool.release(self._conn)
+        finally:
+            self._conn = None
+            await pool_budget.release()
 
-        return False
+    async def drop_replica(self, failed: bool = False) -> None:
+        if self._replica_conn is None:
+            return
+        conn, self._replica_conn = self._replica_conn, None
+        set_budgeted(conn, False)
+        assert self._replica_pool is not None
+        if failed:
+            replicas.mark_failed(self._replica_pool)
+            self._pinned = True
+        await self._replica_pool.release(conn)
 
-    async def create_conn(self, **kwargs):
+    async def replica_conn(self) -> t.Any:
+        """Replica connection for a read, None when it has to use primary"""
+        if self._pinned or self._primary_reads:
+            return None
+        if self._replica_conn is not None:
+            return self._replica_conn
+
+        pool = replicas.pick()
+        if pool is None or replicas.is_sticky(request_user_id()):
+            self._pinned = True
+            return None
+        try:
+            self._replica_conn = await pool.acquire(timeout=1)
+        except REPLICA_ERRORS:
+            replicas.mark_failed(pool)
+            self._pinned = True
+            return None
+        self._replica_pool = pool
+        set_budgeted(self._replica_conn, True)
+        return self._replica_conn
+
+    async def primary_conn(self, write: bool = True, **kwargs) -> t.Any:
+        if write:
+            # Later reads of this request have to see the write
+            self._pinned = True
+            self._wrote = True
+            await self.drop_replica()
         if self._conn is not None and not self._conn.is_closed():
             return self._conn
-        self._conn = await self.pool.acquire(**kwargs)
+        await self.release_conn()
+        await pool_budget.acquire()
+        try:
+            self._conn = await self.pool.acquire(**kwargs)
+        except BaseException:
+            await pool_budget.release()
+            raise
+        set_budgeted(self._conn, True)
+        if not pgbouncer_mode:
+            # Session settings would leak to other clients of PgBouncer
+            await self._conn.apply_lock_timeout()
         return self._conn
+
+    async def create_conn(self, **kwargs):
+        if self._pinned:
+            return await self.primary_conn(write=False, **kwargs)
+        return RoutedConnection(self)
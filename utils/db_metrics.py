@@ -0,0 +1,58 @@
+import asyncio
+import time
+import typing as t
+import orjson
+from redis.exceptions import RedisError
+from core import await_if_cor, get_proc_identity, server_id, _logger
+from utils.queries import catalog
+from utils.pool_budget import pool_budget
+from utils.replicas import replicas
+from utils.slow_queries import slow_queries
+from utils.query_budget import query_budgets
+
+# Redis hash with the latest database metrics of every worker
+STATS_KEY = "db_stats"
+STATS_TTL = 120
+PUBLISH_INTERVAL = 15
+
+
+def snapshot() -> dict[str, t.Any]:
+    return {
+        "updated_at": time.time(),
+        "statements": catalog.stats,
+        "pool": pool_budget.stats,
+        "replicas": replicas.stats,
+        "slow_queries": slow_queries.top(),
+        "query_budgets": query_budgets.stats
+    }
+
+
+async def publish(redis: t.Any) -> None:
+    while True:
+        await asyncio.sleep(PUBLISH_INTERVAL)
+        try:
+            pipe = redis.pipeline(transaction=False)
+            pipe.hset(
+                STATS_KEY, f"{server_id}:{get_proc_identity()}",
+                orjson.dumps(snapshot())
+            )
+            pipe.expire(STATS_KEY, STATS_TTL)
+            await pipe.execute()
+        except RedisError as e:
+            _logger.warning(f"Publishing database metrics failed: {e}")
+
+
+async def get_stats(redis: t.Any) -> dict[str, t.Any]:
+    """Database metrics of all workers that reported recently"""
+    raw = await await_if_cor(redis.hgetall(STATS_KEY))
+    now = time.time()
+
+    workers = {}
+    for worker, value in raw.items():
+        metrics = orjson.loads(value)
+        if now - metrics["updated_at"] > STATS_TTL:
+            continue
+        name = worker.decode() if isinstance(worker, bytes) else worker
+        workers[name] = metrics
+
+    return workers
@@ -0,0 +1,83 @@
+from array import array
+import random
+import xxhash
+
+
+class HotKeys:
+    """Finds frequently read keys with a sampled count-min sketch
+
+    Only every `sample_rate`-th read is counted. Counters are halved by
+    `decay`, so a key stays hot only while it keeps being read. At most
+    `max_hot` keys with the highest estimates are tracked as hot.
+    """
+
+    def __init__(
+        self, width: int = 4096,
+        depth: int = 4,
+        sample_rate: int = 8,
+        threshold: int = 16,
+        max_hot: int = 64
+    ) -> None:
+        self.width = width
+        self.depth = depth
+        self.sample_rate = sample_rate
+        self.threshold = threshold
+        self.max_hot = max_hot
+        self.rows = [array("I", [0]) * width for _ in range(depth)]
+        self.hot: dict[str, int] = {}
+
+    def _indexes(self, key: str) -> list[int]:
+        hashed = xxhash.xxh64_intdigest(key.encode())
+        low, high = hashed & 0xFFFFFFFF, hashed >> 32
+        return [(low + i * high) % self.width for i in range(self.depth)]
+
+    def estimate(self, key: str) -> int:
+        return min(
+            row[index]
+            for row, index in zip(self.rows, self._indexes(key))
+        )
+
+    def record(self, key: str) -> None:
+        if random.randrange(self.sample_rate):
+            return
+
+        # Conservative update: only the smallest counters grow
+        indexes = self._indexes(key)
+        estimate = min(
+            row[index] for row, index in zip(self.rows, indexes)
+        ) + 1
+        for row, index in zip(self.rows, indexes):
+            if row[index] < estimate:
+                row[index] = estimate
+
+        if estimate < self.threshold:
+            return
+        self.hot[key] = estimate
+        if len(self.hot) > self.max_hot:
+            coldest = min(self.hot, key=self.hot.__getitem__)
+            del self.hot[coldest]
+
+    def is_hot(self, key: str) -> bool:
+        return key in self.hot
+
+    def decay(self) -> list[str]:
+        """Halves all counters, returns keys that are no longer hot"""
+        self.rows = [array("I", (c >> 1 for c in row)) for row in self.rows]
+
+        demoted = []
+        for key in list(self.hot):
+            estimate = self.estimate(key)
+            if estimate < self.threshold:
+                del self.hot[key]
+                demoted.append(key)
+            else:
+                self.hot[key] = estimate
+        return demoted
+
+    def top(self) -> list[tuple[str, int]]:
+        """Hot keys with their estimated reads, most read first"""
+        return sorted(
+            ((key, count * self.sample_rate)
+             for key, count in self.hot.items()),
+            key=lambda item: item[1], reverse=True
+        )
@@ -0,0 +1,208 @@
+import asyncio
+import hashlib
+import os
+import re
+import time
+from dataclasses import dataclass
+import asyncpg
+from core import _logger
+
+MIGRATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INT PRIMARY KEY,
+    name TEXT NOT NULL,
+    checksum TEXT NOT NULL,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    duration_ms INT NOT NULL
+)
+"""
+# Serializes runners of all servers that boot at the same time
+LOCK_ID = 7_261_446_019
+# Seconds between attempts to take the lock
+LOCK_RETRY = 0.5
+
+# First line of files that have to run outside of a transaction,
+# e.g. for CREATE INDEX CONCURRENTLY
+NO_TRANSACTION = "-- migrate: no-transaction"
+
+_concurrent_index_re = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS"
+    r"\s+(\w+)",
+    re.IGNORECASE
+)
+_token_re = re.compile(
+    r"--[^\n]*|/\*.*?\*/|'(?:[^']|'')*'|\"[^\"]*\""
+    r"|(\$[A-Za-z_0-9]*\$).*?\1|;",
+    re.DOTALL
+)
+
+
+class MigrationError(Exception):
+    pass
+
+
+@dataclass(slots=True, frozen=True)
+class Migration:
+    version: int
+    name: str
+    sql: str
+    checksum: str
+
+    @property
+    def transactional(self) -> bool:
+        return not self.sql.startswith(NO_TRANSACTION)
+
+
+def split_statements(sql: str) -> list[str]:
+    """Splits on `;` outside of quotes, comments and $$ bodies"""
+    statements, start = [], 0
+    for match in _token_re.finditer(sql):
+        if match.group() != ";":
+            continue
+        statements.append(sql[start:match.start()])
+        start = match.end()
+    statements.append(sql[start:])
+    # Drops chunks that are only comments
+    return [
+        statement.strip() for statement in statements
+        if _token_re.sub("", statement).strip()
+    ]
+
+
+def load_migrations(sql_dir: str) -> list[Migration]:
+    migrations: dict[int, Migration] = {}
+    for name in sorted(os.listdir(sql_dir)):
+        match = re.match(r"(\d+)_.*\.pgsql$", name)
+        if match is None:
+            continue
+        version = int(match.group(1))
+        if version in migrations:
+            raise MigrationError(
+                f"{name} and {migrations[version].name} "
+                f"share version {version}"
+            )
+        with open(os.path.join(sql_dir, name), "rb") as f:
+            data = f.read()
+        migrations[version] = Migration(
+            version, name, data.decode(), hashlib.sha256(data).hexdigest()
+        )
+    return [migrations[version] for version in sorted(migrations)]
+
+
+async def get_pending(
+    db: asyncpg.Connection, migrations: list[Migration],
+    reapply_changed: bool = False
+) -> list[Migration]:
+    if await db.fetchval("SELECT to_regclass('schema_migrations')") is None:
+        return migrations
+    applied = {
+        row["version"]: row["checksum"]
+        for row in await db.fetch(
+            "SELECT version, checksum FROM schema_migrations"
+        )
+    }
+
+    pending = []
+    for migration in migrations:
+        checksum = applied.get(migration.version)
+        if checksum is None:
+            pending.append(migration)
+        elif checksum != migration.checksum:
+            if not reapply_changed:
+                raise MigrationError(
+                    f"{migration.name} was changed after it was applied, "
+                    "add a new migration instead"
+                )
+            pending.append(migration)
+    return pending
+
+
+async def apply_migration(
+    db: asyncpg.Connection, migration: Migration
+) -> None:
+    record = """
+        INSERT INTO schema_migrations (version, name, checksum, duration_ms)
+        VALUES ($1, $2, $3, $4)
+        ON CONFLICT (version) DO UPDATE
+        SET name = $2, checksum = $3, duration_ms = $4,
+            applied_at = CURRENT_TIMESTAMP
+    """
+    started = time.perf_counter()
+    if migration.transactional:
+        async with db.transaction():
+            await db.execute(migration.sql)
+            took = int((time.perf_counter() - started) * 1000)
+            await db.execute(
+                record, migration.version, migration.name,
+                migration.checksum, took
+            )
+        return
+
+    # Each statement commits on its own, a failed run is resumed by
+    # re-running the file, so these have to be idempotent
+    for statement in split_statements(migration.sql):
+        await run_statement(db, statement)
+    took = int((time.perf_counter() - started) * 1000)
+    await db.execute(
+        record, migration.version, migration.name,
+        migration.checksum, took
+    )
+
+
+async def index_valid(db: asyncpg.Connection, name: str) -> bool | None:
+    """None if the index doesn't exist"""
+    return await db.fetchval(
+        """
+        SELECT i.indisvalid FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = $1
+        """, name
+    )
+
+
+async def run_statement(db: asyncpg.Connection, statement: str) -> None:
+    match = _concurrent_index_re.search(statement)
+    if match is None:
+        await db.execute(statement)
+        return
+
+    name = match.group(1)
+    if await index_valid(db, name) is False:
+        # Leftover of an interrupted concurrent build, IF NOT EXISTS
+        # would keep it
+        await db.execute(f"DROP INDEX CONCURRENTLY {name}")
+    await db.execute(statement)
+    if not await index_valid(db, name):
+        raise MigrationError(f"Index {name} was not built")
+
+
+async def lock(db: asyncpg.Connection) -> None:
+    # Waiting inside pg_advisory_lock() holds a snapshot, which the
+    # holder's CREATE INDEX CONCURRENTLY would wait for in turn
+    while not await db.fetchval("SELECT pg_try_advisory_lock($1)", LOCK_ID):
+        await asyncio.sleep(LOCK_RETRY)
+
+
+async def migrate(
+    db: asyncpg.Connection, sql_dir: str = "./sql/",
+    debug: bool = False, reapply_changed: bool = False
+) -> int:
+    """Applies pending migrations, returns how many were applied"""
+    log = _logger.info if debug else _logger.debug
+    migrations = load_migrations(sql_dir)
+
+    # Up to date databases only read schema_migrations
+    if not await get_pending(db, migrations, reapply_changed):
+        log("Database schema is up to date")
+        return 0
+
+    await lock(db)
+    try:
+        await db.execute(MIGRATIONS_TABLE)
+        pending = await get_pending(db, migrations, reapply_changed)
+        for migration in pending:
+            log(f"Applying {migration.name}...")
+            await apply_migration(db, migration)
+    finally:
+        await db.execute("SELECT pg_advisory_unlock($1)", LOCK_ID)
+    return len(pending)
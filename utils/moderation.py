@@ -1,5 +1,5 @@
-import orjson
 from utils.database import AutoConnection
+from utils.codecs import unix_time
 from core import FunctionError
 from utils.generation import generate_id
 from quart import request
@@ -34,8 +34,7 @@ async def create_log(
             $3, $4, $5, $6, $7, $8, $9
         )
         """, new_id, user_id, towards_to,
-        orjson.dumps(metadata).decode(),
-        orjson.dumps(old_content).decode(),
+        metadata, old_content,
         target_type, target_id, action_type, reason
     )
 
@@ -74,10 +73,7 @@ async def get_audit_data(
     )
 
     row_dict: dict[str, t.Any] = dict(row)  # pyright: ignore
-    for key in ["old_content", "metadata"]:
-        if key in row_dict.keys():
-            row_dict[key] = orjson.loads(row_dict[key])
-    row_dict["created_at"] = row_dict["created_at"].timestamp()
+    row_dict["created_at"] = unix_time(row_dict["created_at"])
 
     return row_dict
 
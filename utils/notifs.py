@@ -1,7 +1,7 @@
-import orjson
 from utils.generation import snowflake
 from core import FunctionError
 from utils.database import AutoConnection
+from utils.queries import catalog
 import typing as t
 from schemas import NotificationType, NotificationList, Notification
 from utils.generation import generate_id
@@ -54,13 +54,7 @@ async def create_notification(
     return notification
 
 
-async def get_notifications(
-    user_id: str,
-    conn: AutoConnection,
-    cursor: str | None = None,
-    limit: int = 20
-) -> NotificationList:
-    db = await conn.create_conn()
+def notifications_query(has_cursor: bool) -> str:
     query = """
         SELECT n.id,
             n.type,
@@ -90,15 +84,39 @@ async def get_notifications(
             OR  (n.linked_type NOT IN ('post', 'comment'))
         )
     """
-    params: list[t.Any] = [user_id]
+    if has_cursor:
+        query += " AND n.id_num < $2"
+    return query + (
+        f" ORDER BY n.id_num DESC LIMIT ${3 if has_cursor else 2}"
+    )
+
+
+NOTIFICATIONS = {
+    has_cursor: catalog.add(
+        f"notifs.list{":cursor" if has_cursor else ""}",
+        notifications_query(has_cursor),
+        hot=not has_cursor
+    )
+    for has_cursor in (False, True)
+}
 
-    if cursor:
-        query += " AND n.id < $2"
-        params.append(cursor)
 
-    query += f" ORDER BY n.id::bigint DESC LIMIT {limit + 1}"
+async def get_notifications(
+    user_id: str,
+    conn: AutoConnection,
+    cursor: str | None = None,
+    limit: int = 20
+) -> NotificationList:
+    db = await conn.create_conn()
+    params: list[t.Any] = [user_id]
+    if cursor:
+        try:
+            params.append(int(cursor))
+        except ValueError:
+            raise FunctionError("INVALID_CURSOR", 400, None)
+    params.append(limit + 1)
 
-    rows = await db.fetch(query, *params)
+    rows = await catalog.fetch(db, NOTIFICATIONS[bool(cursor)], *params)
     if not rows:
         raise FunctionError("NO_MORE_NOTIFS", 200, None)
 
@@ -199,7 +217,7 @@ async def subscribe(
         user_id,
         session_id,
         subscription.get("expirationTime"),
-        orjson.dumps(subscription).decode()
+        subscription
     )
 
 
@@ -0,0 +1,158 @@
+import asyncio
+import time
+import typing as t
+import orjson
+from redis.exceptions import RedisError
+from core import get_proc_identity, server_id, worker_count, _logger
+
+# Redis hash with the connection demand of every worker of a server,
+# the budget is per server
+DEMAND_KEY = "db_pool_demand:{}"
+DEMAND_TTL = 30
+BALANCE_INTERVAL = 5
+
+
+class PoolBudget:
+    """Per-worker share of the global Postgres connection budget
+
+    Every request takes a slot before acquiring a pool connection, so
+    the limit can be changed at runtime without recreating the pool.
+    Workers report their peak demand (connections in use plus waiters)
+    to Redis and split the budget proportionally, each keeping at
+    least `min_size` slots. Without Redis the static equal share is
+    used. Idle connections of `pool` above the share are closed, the
+    pool itself may grow up to the whole budget.
+    """
+
+    def __init__(self) -> None:
+        self.budget = 1
+        self.min_size = 1
+        self.limit = 1
+        self.in_use = 0
+        self.waiting = 0
+        self.peak = 0
+        self.acquired = 0
+        self.waited = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.pool: t.Any = None
+        self._condition = asyncio.Condition()
+
+    def configure(self, budget: int, min_size: int, limit: int) -> None:
+        self.budget = max(budget, 1)
+        self.min_size = max(min(min_size, limit), 1)
+        self.limit = max(limit, self.min_size)
+
+    async def acquire(self) -> None:
+        started = time.perf_counter()
+        async with self._condition:
+            if self.in_use >= self.limit:
+                self.waiting += 1
+                self.peak = max(self.peak, self.in_use + self.waiting)
+                try:
+                    await self._condition.wait_for(
+                        lambda: self.in_use < self.limit
+                    )
+                finally:
+                    self.waiting -= 1
+                self.waited += 1
+            self.in_use += 1
+            self.peak = max(self.peak, self.in_use + self.waiting)
+
+        wait = time.perf_counter() - started
+        self.acquired += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+
+    async def release(self) -> None:
+        async with self._condition:
+            self.in_use -= 1
+            self._condition.notify()
+
+    async def set_limit(self, limit: int) -> None:
+        limit = max(limit, self.min_size)
+        if limit == self.limit:
+            return
+        async with self._condition:
+            grew = limit > self.limit
+            self.limit = limit
+            if grew:
+                self._condition.notify(self.waiting)
+
+    async def trim(self) -> None:
+        """Closes idle connections of the pool above the share"""
+        pool = self.pool
+        if pool is None or pool.is_closing():
+            return
+        # Same as asyncpg's own idle timeout: an idle holder's connection
+        # is terminated in place and the holder reconnects on its next
+        # acquire. Holders are internals of the pinned asyncpg, without
+        # them the pool's idle lifetime still closes the connections.
+        excess = pool.get_size() - self.limit
+        for holder in getattr(pool, "_holders", ()):
+            if excess <= 0:
+                break
+            if holder.is_connected() and holder.is_idle():
+                holder.terminate()
+                excess -= 1
+
+    def allocate(self, demands: dict[str, int], name: str) -> int:
+        """Share of the budget for worker `name` given all demands"""
+        # Local workers that haven't reported yet keep their minimum
+        workers = max(len(demands), worker_count)
+        spare = self.budget - self.min_size * workers
+        total = sum(demands.values())
+        if spare <= 0 or total <= 0:
+            return self.min_size
+        return self.min_size + spare * demands[name] // total
+
+    async def balance(self, redis: t.Any) -> None:
+        name = str(get_proc_identity())
+        key = DEMAND_KEY.format(server_id)
+        while True:
+            await asyncio.sleep(BALANCE_INTERVAL)
+            demand = max(self.peak, self.in_use + self.waiting, 1)
+            self.peak = 0
+            now = time.time()
+            try:
+                pipe = redis.pipeline(transaction=False)
+                pipe.hset(key, name, orjson.dumps(
+                    {"demand": demand, "updated_at": now}
+                ))
+                pipe.expire(key, DEMAND_TTL)
+                pipe.hgetall(key)
+                *_, reported = await pipe.execute()
+            except RedisError as e:
+                _logger.warning(f"Pool budget balancing failed: {e}")
+                continue
+
+            demands: dict[str, int] = {}
+            for field, value in reported.items():
+                value = orjson.loads(value)
+                if isinstance(field, bytes):
+                    field = field.decode()
+                if now - value["updated_at"] <= DEMAND_TTL:
+                    demands[field] = value["demand"]
+            demands[name] = demand
+            await self.set_limit(self.allocate(demands, name))
+            await self.trim()
+
+    @property
+    def stats(self) -> dict[str, t.Any]:
+        return {
+            "budget": self.budget,
+            "min_size": self.min_size,
+            "limit": self.limit,
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "utilisation": self.in_use / self.limit,
+            "acquired": self.acquired,
+            "waited": self.waited,
+            "wait_avg": (
+                self.wait_total / self.acquired if self.acquired else None
+            ),
+            "wait_max": self.wait_max
+        }
+
+
+pool_budget = PoolBudget()
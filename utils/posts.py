@@ -5,13 +5,15 @@ import unicodedata
 from core import FunctionError
 from utils.generation import generate_id
 import typing as t
-from utils.database import AutoConnection, condition
+from utils.database import AutoConnection, condition, pending_count
+from utils.queries import catalog
 from schemas import ListsDefault
 from utils.storage import build_get_link
+from utils.records import Record
 
 
-@dataclass
-class Post:
+@dataclass(slots=True, frozen=True)
+class Post(Record):
     post_id: str
     user_id: str
     content: str
@@ -39,9 +41,8 @@ class Post:
             return self.updated_at
         return self.updated_at.timestamp()
 
-    @property
-    def dict(self) -> dict:
-        post_dict = asdict(self)
+    def _build_dict(self) -> dict:
+        post_dict = self.to_dict()
         post_dict['created_at'] = int(self.created_at_unix)
         post_dict['updated_at'] = int(self.updated_at_unix)
         return post_dict
@@ -82,22 +83,22 @@ def post_query(
 ) -> str:
     query = f"""
         SELECT p.post_id, p.user_id, p.content, p.created_at, p.updated_at,
-               p.likes_count, p.comments_count,
-               p.dislikes_count, p.tags, m.objects as media,
+               {pending_count("p.likes_count", "post", "p.post_id")},
+               {pending_count("p.comments_count", "post", "p.post_id")},
+               {pending_count("p.dislikes_count", "post", "p.post_id")},
+               p.tags, m.objects as media,
                m.type as media_type
                {", p.popularity_score" if popularity_score else ""}
                {", p.status, p.is_deleted" if more_info else ""},
-               COALESCE(
-                   array_agg(t.name)
-                   FILTER (WHERE t.tag_id IS NOT NULL),
-                   '{{}}'
+               ARRAY(
+                   SELECT t.name
+                   FROM post_tags pt
+                   JOIN tags t ON t.tag_id = pt.tag_id
+                   WHERE pt.post_id = p.post_id
                ) AS ctags
         FROM posts p
-        LEFT JOIN post_tags pt ON pt.post_id = p.post_id
-        LEFT JOIN tags t ON t.tag_id = pt.tag_id
         LEFT JOIN files m ON m.context_id = p.file_context_id
         {where}
-        GROUP BY p.post_id, m.objects, m.type
     """
     return query
 
@@ -113,17 +114,56 @@ def build_post_media(media: list) -> list:
     return new_media
 
 
+USER_POSTS_ORDER = {
+    "popular": "ORDER BY p.popularity_score DESC, p.post_id_num DESC",
+    "new": "ORDER BY p.post_id_num DESC",
+    "old": "ORDER BY p.post_id_num ASC"
+}
+USER_POSTS_CURSOR = {
+    "popular": " AND (p.popularity_score, p.post_id_num) < ($2, $3)",
+    "new": " AND p.post_id_num < $2",
+    "old": " AND p.post_id_num > $2"
+}
+
+POST_BY_ID = {
+    more_info: catalog.add(
+        f"posts.by_id{":more" if more_info else ""}",
+        post_query(
+            where="WHERE p.post_id = $1 AND p.is_deleted = FALSE",
+            more_info=more_info
+        ),
+        hot=not more_info
+    )
+    for more_info in (False, True)
+}
+POPULAR_POSTS = catalog.add(
+    "posts.popular",
+    post_query(where="WHERE p.is_deleted = FALSE")
+    + "ORDER BY p.popularity_score DESC LIMIT $1"
+)
+USER_POSTS = {
+    (sort, has_cursor): catalog.add(
+        f"posts.by_user:{sort}{":cursor" if has_cursor else ""}",
+        post_query(
+            where=(
+                "WHERE p.user_id = $1 AND p.is_deleted = FALSE"
+                + (USER_POSTS_CURSOR[sort] if has_cursor else "")
+            ),
+            popularity_score=True
+        ) + f"{USER_POSTS_ORDER[sort]} LIMIT 21"
+    )
+    for sort in USER_POSTS_ORDER
+    for has_cursor in (False, True)
+}
+
+
 async def get_post(
     post_id: str,
     conn: AutoConnection,
     more_info: bool = False
 ) -> Post:
     db = await conn.create_conn()
-    query = post_query(
-        where="WHERE p.post_id = $1 AND p.is_deleted = FALSE",
-        more_info=more_info
-    )
-    row = await db.fetchrow(query, post_id)
+    row = await catalog.fetchrow(db, POST_BY_ID[more_info], post_id)
 
     if row is None:
         raise FunctionError("POST_DOES_NOT_EXIST", 404, None)
@@ -133,6 +173,21 @@ async def get_post(
     return Post.from_dict(data)
 
 
+async def get_popular_posts(
+    limit: int,
+    conn: AutoConnection
+) -> list[Post]:
+    db = await conn.create_conn()
+    rows = await catalog.fetch(db, POPULAR_POSTS, limit)
+
+    posts = []
+    for row in rows:
+        data = dict(row)
+        data["media"] = build_post_media(data["media"])
+        posts.append(Post.from_dict(data))
+    return posts
+
+
 def normalize_tag(tag: str) -> str:
     tag = tag.strip().lower()
     tag = unicodedata.normalize("NFKD", tag)
@@ -318,44 +373,24 @@ async def get_user_posts(
 ) -> PostList:
     sort = sort or "new"
     db = await conn.create_conn()
-    query = post_query(
-        where="WHERE p.user_id = $1 AND p.is_deleted = FALSE",
-        popularity_score=True
-    )
     params: list[t.Any] = [user_id]
 
     if cursor:
         try:
-            _popularity_score, post_id = cursor.split(",")
+            _popularity_score, _post_id = cursor.split(",")
             popularity_score = int(_popularity_score)
+            post_id = int(_post_id)
         except ValueError:
             raise FunctionError("INVALID_CURSOR", 400, None)
 
         if sort == "popular":
-            query += """
-                AND (
-                    (p.popularity_score) < $2 OR
-                    ((p.popularity_score) = $2 AND p.post_id < $3)
-                )
-            """
             params.extend([popularity_score, post_id])
-        elif sort == "new":
-            query += " AND p.post_id < $2"
-            params.append(post_id)
-        elif sort == "old":
-            query += " AND p.post_id > $2"
+        else:
             params.append(post_id)
 
-    if sort == "popular":
-        query += " ORDER BY p.popularity_score DESC, p.post_id::bigint DESC"
-    elif sort == "new":
-        query += " ORDER BY p.post_id::bigint DESC"
-    elif sort == "old":
-        query += " ORDER BY p.post_id::bigint ASC"
-
-    query += " LIMIT 21"
-
-    rows = await db.fetch(query, *params)
+    rows = await catalog.fetch(
+        db, USER_POSTS[(sort, bool(cursor))], *params
+    )
     if not rows:
         raise FunctionError("NO_MORE_POSTS", 200, None)
 
@@ -366,16 +401,11 @@ async def get_user_posts(
     next_cursor = (
         f"{last_row['popularity_score']},{last_row['post_id']}"
     )
-    posts = [
-        Post(
-            **{k: v for k, v in row.items()
-               if k != 'popularity_score'}
-        )
-        for row in rows
-    ]
-
-    for post in posts:
-        post.media = build_post_media(post.media)
+    posts = []
+    for row in rows:
+        data = {k: v for k, v in row.items() if k != 'popularity_score'}
+        data["media"] = build_post_media(data["media"])
+        posts.append(Post(**data))
 
     return {"posts": posts, "next_cursor": next_cursor, "has_more": has_more}
 
@@ -417,8 +447,9 @@ async def get_tag(
 ) -> Tag:
     db = await conn.create_conn()
     row = await db.fetchrow(
-        """
-        SELECT tag_id, name, created_at, posts_count
+        f"""
+        SELECT tag_id, name, created_at,
+               {pending_count("posts_count", "tag", "tag_id")}
         FROM tags
         WHERE name = $1
         """, tag_name
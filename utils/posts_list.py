@@ -1,8 +1,124 @@
+import os
 from core import FunctionError
 from utils.database import AutoConnection
+from utils.queries import catalog
 from schemas import PostsList
 import typing as t
 
+# Views older than this are dropped with their weekly partition, see
+# sql/09_partition_post_views.pgsql
+views_retention_days = int(os.getenv("VIEWS_RETENTION_DAYS", "90"))
+
+# The timestamp bound prunes partitions past the horizon at executor
+# start, so feeds never probe partitions that are about to be dropped
+NOT_VIEWED = f"""
+    AND NOT EXISTS (
+        SELECT 1
+        FROM user_post_views
+        WHERE user_post_views.user_id = $2
+        AND user_post_views.post_id = posts.post_id
+        AND user_post_views.timestamp
+            > NOW() - INTERVAL '{views_retention_days} days'
+    )
+"""
+
+# Feeds without viewed posts are the default and don't page by cursor
+FEED_PAGES = ("unviewed", "first", "cursor")
+
+
+def feed_query(select: str, page: str, cursor: str, order: str) -> str:
+    query = select
+    if page == "unviewed":
+        query += NOT_VIEWED
+    elif page == "cursor":
+        query += cursor
+    return query + f"""
+        {order}
+        LIMIT $1
+    """
+
+
+POPULAR_FEED = {
+    page: catalog.add(
+        f"posts_list.popular:{page}",
+        feed_query(
+            """
+        SELECT post_id, popularity_score
+        FROM posts
+        WHERE is_deleted = FALSE AND user_id != $2
+    """,
+            page,
+            " AND (popularity_score, post_id_num) < ($3, $4)",
+            "ORDER BY popularity_score DESC, post_id_num DESC"
+        ),
+        hot=page == "unviewed"
+    )
+    for page in FEED_PAGES
+}
+NEW_FEED = {
+    page: catalog.add(
+        f"posts_list.new:{page}",
+        feed_query(
+            """
+        SELECT post_id
+        FROM posts
+        WHERE is_deleted = FALSE AND user_id != $2
+    """,
+            page,
+            " AND post_id_num < $3",
+            "ORDER BY post_id_num DESC"
+        ),
+        hot=page == "unviewed"
+    )
+    for page in FEED_PAGES
+}
+FOLLOWING_FEED = {
+    page: catalog.add(
+        f"posts_list.following:{page}",
+        feed_query(
+            """
+        SELECT post_id
+        FROM posts
+        WHERE is_deleted = FALSE AND EXISTS (
+            SELECT 1
+            FROM followed
+            WHERE followed.user_id = $2
+            AND followed.followed_to = posts.user_id
+        )
+    """,
+            page,
+            " AND post_id_num < $3",
+            "ORDER BY post_id_num DESC"
+        ),
+        hot=page == "unviewed"
+    )
+    for page in FEED_PAGES
+}
+TAG_FEED = {
+    has_cursor: catalog.add(
+        f"posts_list.tag{":cursor" if has_cursor else ""}",
+        feed_query(
+            """
+        SELECT pt.post_id, p.popularity_score
+        FROM post_tags pt
+        LEFT JOIN posts p ON p.post_id = pt.post_id
+        WHERE pt.tag_id = $2
+    """,
+            "cursor" if has_cursor else "first",
+            " AND (p.popularity_score, p.post_id_num) < ($3, $4)",
+            """GROUP BY pt.post_id, p.post_id, p.popularity_score
+        ORDER BY p.popularity_score DESC, p.post_id_num DESC"""
+        )
+    )
+    for has_cursor in (False, True)
+}
+
+
+def feed_page(hide_viewed: bool, cursor: str | None) -> str:
+    if hide_viewed:
+        return "unviewed"
+    return "cursor" if cursor else "first"
+
 
 async def get_popular_posts(
     user_id: str,
@@ -18,42 +134,16 @@ async def get_popular_posts(
         user_id = "0"
 
     parameters: list = [limit, user_id]
+    page = feed_page(hide_viewed, cursor)
 
-    query = """
-        SELECT post_id, popularity_score
-        FROM posts
-        WHERE is_deleted = FALSE AND user_id != $2
-    """
-
-    if hide_viewed:
-        query += """
-            AND NOT EXISTS (
-                SELECT 1
-                FROM user_post_views
-                WHERE user_post_views.user_id = $2
-                AND user_post_views.post_id = posts.post_id
-            )
-        """
-    elif cursor:
-        query += """
-            AND (
-                (popularity_score) < $3 OR
-                ((popularity_score) = $3 AND post_id::bigint < $4)
-            )
-        """
-
-        _popularity_score, _post_id = cursor.split(",")
+    if page == "cursor":
+        _popularity_score, _post_id = t.cast(str, cursor).split(",")
         popularity_score = int(_popularity_score)
         post_id = int(_post_id)
 
         parameters.extend([popularity_score, post_id])
 
-    query += """
-        ORDER BY popularity_score DESC, post_id::bigint DESC
-        LIMIT $1
-    """
-
-    rows = await db.fetch(query, *parameters)
+    rows = await catalog.fetch(db, POPULAR_FEED[page], *parameters)
 
     if not rows:
         raise FunctionError("NO_MORE_POSTS", 400, None)
@@ -82,32 +172,12 @@ async def get_new_posts(
     if not hide_viewed:
         user_id = "0"
     parameters: list = [limit, user_id]
+    page = feed_page(hide_viewed, cursor)
 
-    query = """
-        SELECT post_id
-        FROM posts
-        WHERE is_deleted = FALSE AND user_id != $2
-    """
-
-    if hide_viewed:
-        query += """
-            AND NOT EXISTS (
-                SELECT 1
-                FROM user_post_views
-                WHERE user_post_views.user_id = $2
-                AND user_post_views.post_id = posts.post_id
-            )
-        """
-    elif cursor:
-        query += " AND post_id::bigint < $3"
-        parameters.append(int(cursor))
+    if page == "cursor":
+        parameters.append(int(t.cast(str, cursor)))
 
-    query += """
-        ORDER BY post_id::bigint DESC
-        LIMIT $1
-    """
-
-    rows = await db.fetch(query, *parameters)
+    rows = await catalog.fetch(db, NEW_FEED[page], *parameters)
 
     if not rows:
         raise FunctionError("NO_MORE_POSTS", 400, None)
@@ -131,37 +201,12 @@ async def get_posts_by_following(
     hide_viewed = True if hide_viewed is None else hide_viewed
 
     parameters: list = [limit, user_id]
+    page = feed_page(hide_viewed, cursor)
 
-    query = """
-        SELECT post_id
-        FROM posts
-        WHERE is_deleted = FALSE AND EXISTS (
-            SELECT 1
-            FROM followed
-            WHERE followed.user_id = $2
-            AND followed.followed_to = posts.user_id
-        )
-    """
+    if page == "cursor":
+        parameters.append(int(t.cast(str, cursor)))
 
-    if hide_viewed:
-        query += """
-            AND NOT EXISTS (
-                SELECT 1
-                FROM user_post_views
-                WHERE user_post_views.user_id = $2
-                AND user_post_views.post_id = posts.post_id
-            )
-        """
-    elif cursor:
-        query += " AND post_id::bigint < $3"
-        parameters.append(int(cursor))
-
-    query += """
-        ORDER BY post_id::bigint DESC
-        LIMIT $1
-    """
-
-    rows = await db.fetch(query, *parameters)
+    rows = await catalog.fetch(db, FOLLOWING_FEED[page], *parameters)
 
     if not rows:
         raise FunctionError("NO_MORE_POSTS", 400, None)
@@ -183,7 +228,7 @@ async def mark_post_as_viewed(
     query = """
         INSERT INTO user_post_views (user_id, post_id)
         VALUES ($1, $2)
-        ON CONFLICT (user_id, post_id) DO NOTHING
+        ON CONFLICT DO NOTHING
     """
     await db.execute(query, user_id, str(post_id))
 
@@ -192,16 +237,35 @@ async def mark_posts_as_viewed(
     user_id: str, post_ids: list[str],
     conn: AutoConnection
 ) -> None:
-    db = await conn.create_conn()
+    await insert_post_views([user_id] * len(post_ids), post_ids, conn)
 
-    query = """
-        INSERT INTO user_post_views (user_id, post_id)
-        VALUES ($1, $2)
-        ON CONFLICT (user_id, post_id) DO NOTHING
+
+async def insert_post_views(
+    user_ids: list[str], post_ids: list[str],
+    conn: AutoConnection
+) -> int:
+    """Inserts (user_ids[i], post_ids[i]) views in one statement
+
+    Views of posts or users that no longer exist are skipped instead
+    of failing the whole batch on the foreign keys. Duplicates are
+    only skipped within the current week's partition. Rows are
+    inserted in key order, concurrent batches that overlap wait on
+    each other instead of deadlocking on the unique index.
     """
+    db = await conn.create_conn()
     await conn.start_transaction()
-    for post_id in post_ids:
-        await db.execute(query, user_id, str(post_id))
+    status = await db.execute(
+        """
+        INSERT INTO user_post_views (user_id, post_id)
+        SELECT v.user_id, v.post_id
+        FROM unnest($1::text[], $2::text[]) AS v (user_id, post_id)
+        JOIN posts p ON p.post_id = v.post_id
+        JOIN users u ON u.user_id = v.user_id
+        ORDER BY v.user_id, v.post_id
+        ON CONFLICT DO NOTHING
+        """, user_ids, [str(post_id) for post_id in post_ids]
+    )
+    return int(status.split()[-1])
 
 
 async def get_tag_posts(
@@ -211,32 +275,14 @@ async def get_tag_posts(
     cursor: str | None = None
 ) -> dict[str, t.Any]:
     db = await conn.create_conn()
-    query = """
-        SELECT pt.post_id, p.popularity_score
-        FROM post_tags pt
-        LEFT JOIN posts p ON p.post_id = pt.post_id
-        WHERE pt.tag_id = $2
-    """
     parameters: list = [limit + 1, tag_id]
 
     if cursor:
         _popularity_score, post_id = cursor.split(",")
         popularity_score = int(_popularity_score)
-        query += """
-            AND (
-                (p.popularity_score) < $3 OR
-                ((p.popularity_score) = $3 AND p.post_id::bigint < $4)
-            )
-        """
         parameters.extend([popularity_score, int(post_id)])
 
-    query += """
-        GROUP BY pt.post_id, p.post_id, p.popularity_score
-        ORDER BY p.popularity_score DESC, p.post_id::bigint DESC
-        LIMIT $1
-    """
-
-    rows = await db.fetch(query, *parameters)
+    rows = await catalog.fetch(db, TAG_FEED[bool(cursor)], *parameters)
 
     if not rows:
         raise FunctionError("NO_MORE_POSTS", 200, None)
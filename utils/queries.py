@@ -0,0 +1,147 @@
+import inspect
+import time
+import typing as t
+import asyncpg
+from asyncpg.prepared_stmt import PreparedStatement
+from utils.slow_queries import slow_queries
+from utils.query_budget import BudgetedConnection, query_budgets
+from utils.query_budget import raw_connection
+
+# `statement` builds statement objects from asyncpg internals, which
+# requirements.txt pins to the release this was checked against. With
+# other internals the catalog sends the query text as is and only
+# asyncpg's own statement cache prepares it.
+REUSES_STATEMENTS = (
+    list(inspect.signature(PreparedStatement).parameters)
+    == ["connection", "query", "state"]
+    and "_state" in PreparedStatement.__slots__
+)
+
+
+class QueryCatalog:
+    """Named SQL statements, prepared once per connection
+
+    Modules register every variant of their queries at import, so the
+    set of statement texts is fixed. Hot statements are prepared when
+    the pool hands out a connection that doesn't have them yet, the
+    rest on first use. Statements are kept per connection behind the
+    pool's proxies and outlive every checkout.
+
+    Behind a transaction pooler (PgBouncer) `prepare_statements` is
+    off and the query text is sent as is.
+    """
+
+    def __init__(self) -> None:
+        self.queries: dict[str, str] = {}
+        self.hot: list[str] = []
+        self.prepared: dict[
+            asyncpg.Connection, dict[str, PreparedStatement]
+        ] = {}
+        self.hits = 0
+        self.misses = 0
+        self.prepare_statements = REUSES_STATEMENTS
+
+    def add(self, name: str, query: str, hot: bool = False) -> str:
+        if self.queries.get(name, query) != query:
+            raise ValueError(f"Query {name} is already registered")
+        self.queries[name] = query
+        if hot and name not in self.hot:
+            self.hot.append(name)
+        return name
+
+    def connection_statements(
+        self, conn: t.Any
+    ) -> dict[str, PreparedStatement]:
+        # Backend pids repeat across servers, the key is the connection.
+        # Its statements reference it, so it is dropped on close rather
+        # than by a weak reference.
+        raw = raw_connection(conn)
+        statements = self.prepared.get(raw)
+        if statements is None:
+            statements = self.prepared[raw] = {}
+            raw.add_termination_listener(
+                lambda _: self.prepared.pop(raw, None)
+            )
+        return statements
+
+    async def setup(self, conn: asyncpg.Connection) -> None:
+        """Pool `setup` callback, prepares missing hot statements"""
+        if not self.prepare_statements:
+            return
+        statements = self.connection_statements(conn)
+        for name in self.hot:
+            if name not in statements:
+                statements[name] = await conn.prepare(self.queries[name])
+
+    async def statement(self, db: t.Any, name: str) -> PreparedStatement:
+        statements = self.connection_statements(db)
+        prepared = statements.get(name)
+        if prepared is None:
+            self.misses += 1
+            prepared = await db.prepare(self.queries[name])
+            statements[name] = prepared
+        else:
+            self.hits += 1
+        # asyncpg refuses statement objects of an earlier checkout, the
+        # server-side statement is still there. The kept object holds it
+        # open, a new one for this checkout runs it.
+        return PreparedStatement(
+            raw_connection(db), self.queries[name], prepared._state
+        )
+
+    async def run(
+        self, db: t.Any, name: str, method: str, *args: t.Any
+    ) -> t.Any:
+        query = self.queries[name]
+
+        async def call(conn: t.Any) -> t.Any:
+            if not self.prepare_statements:
+                return await getattr(conn, method)(query, *args)
+            statement = await self.statement(conn, name)
+            timeout = (
+                conn.statement_timeout(query)
+                if isinstance(conn, BudgetedConnection) else None
+            )
+            # Prepared statements bypass asyncpg's query loggers and
+            # the connection's budget checks
+            started = time.perf_counter()
+            with query_budgets.guard():
+                result = await getattr(statement, method)(
+                    *args, timeout=timeout
+                )
+            slow_queries.observe(
+                query, args, time.perf_counter() - started
+            )
+            return result
+
+        # Connections routed between primary and replicas pick the
+        # actual connection by the query text
+        route = getattr(db, "run", None)
+        if route is None:
+            return await call(db)
+        return await route(query, call)
+
+    async def fetch(self, db: t.Any, name: str, *args: t.Any) -> list:
+        return await self.run(db, name, "fetch", *args)
+
+    async def fetchrow(self, db: t.Any, name: str, *args: t.Any) -> t.Any:
+        return await self.run(db, name, "fetchrow", *args)
+
+    async def fetchval(self, db: t.Any, name: str, *args: t.Any) -> t.Any:
+        return await self.run(db, name, "fetchval", *args)
+
+    @property
+    def stats(self) -> dict[str, t.Any]:
+        total = self.hits + self.misses
+        return {
+            "statements": len(self.queries),
+            "prepared": self.prepare_statements,
+            "hot": len(self.hot),
+            "connections": len(self.prepared),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else None
+        }
+
+
+catalog = QueryCatalog()
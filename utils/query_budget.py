@@ -0,0 +1,173 @@
+import os
+import typing as t
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+import asyncpg
+from quart import g, request, has_request_context
+from core import FunctionError, _logger
+
+# Defaults of every endpoint, seconds, 0 disables the limit
+default_statement_timeout = float(os.getenv("DB_STATEMENT_TIMEOUT", "10"))
+default_lock_timeout = float(os.getenv("DB_LOCK_TIMEOUT", "0"))
+default_max_queries = int(os.getenv("DB_MAX_QUERIES", "0"))
+
+# Transaction control isn't counted against `max_queries`
+CONTROL_STATEMENTS = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE")
+
+
+@dataclass(slots=True, frozen=True)
+class QueryBudget:
+    statement_timeout: float | None
+    lock_timeout: float | None
+    max_queries: int | None
+
+
+class QueryBudgets:
+    """Database limits of each endpoint, from config/endpoints.json5
+
+    An endpoint may set `statement_timeout` and `lock_timeout` (in
+    milliseconds) and `max_queries`. Statements over the timeout are
+    cancelled (504), lock waits over `lock_timeout` and requests over
+    `max_queries` fail with 503.
+    """
+
+    def __init__(self) -> None:
+        self.default = QueryBudget(
+            default_statement_timeout or None,
+            default_lock_timeout or None,
+            default_max_queries or None
+        )
+        self.endpoints: dict[str, QueryBudget] = {}
+        self.violations: defaultdict[str, int] = defaultdict(int)
+
+    def configure(self, endpoints: dict[str, dict[str, t.Any]]) -> None:
+        for name, data in endpoints.items():
+            if not isinstance(data, dict):
+                continue
+            statement_timeout = data.get("statement_timeout")
+            lock_timeout = data.get("lock_timeout")
+            max_queries = data.get("max_queries")
+            if (statement_timeout, lock_timeout, max_queries) \
+                    == (None, None, None):
+                continue
+            self.endpoints[name] = QueryBudget(
+                statement_timeout / 1000
+                if statement_timeout is not None
+                else self.default.statement_timeout,
+                lock_timeout / 1000
+                if lock_timeout is not None
+                else self.default.lock_timeout,
+                max_queries
+                if max_queries is not None
+                else self.default.max_queries
+            )
+
+    def current(self) -> QueryBudget | None:
+        if not has_request_context():
+            return None
+        return self.endpoints.get(request.endpoint or "", self.default)
+
+    def count(self, query: str) -> float | None:
+        """Counts a statement of the request, returns its timeout"""
+        budget = self.current()
+        if budget is None:
+            return None
+        if budget.max_queries and not query.lstrip().upper().startswith(
+            CONTROL_STATEMENTS
+        ):
+            g.db_queries = g.get("db_queries", 0) + 1
+            if g.db_queries > budget.max_queries:
+                self.violation("max_queries")
+                raise FunctionError("QUERY_BUDGET_EXCEEDED", 503, None)
+        return budget.statement_timeout
+
+    def violation(self, kind: str) -> None:
+        endpoint = request.endpoint if has_request_context() else None
+        self.violations[f"{endpoint}:{kind}"] += 1
+        _logger.warning(f"Query budget {kind} exceeded at {endpoint}")
+
+    @contextmanager
+    def guard(self) -> t.Iterator[None]:
+        """Turns timeouts of a request into clean 503/504 errors"""
+        try:
+            yield
+        except (TimeoutError, asyncpg.QueryCanceledError) as e:
+            # Background jobs handle the driver's errors themselves
+            if not has_request_context():
+                raise
+            self.violation("statement_timeout")
+            raise FunctionError("DATABASE_TIMEOUT", 504, None) from e
+        except asyncpg.LockNotAvailableError as e:
+            if not has_request_context():
+                raise
+            self.violation("lock_timeout")
+            raise FunctionError("DATABASE_BUSY", 503, None) from e
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return dict(self.violations)
+
+
+query_budgets = QueryBudgets()
+
+
+def raw_connection(conn: t.Any) -> asyncpg.Connection:
+    """Connection behind the slotted proxy `pool.acquire()` hands out"""
+    return getattr(conn, "_con", None) or conn
+
+
+def set_budgeted(conn: t.Any, budgeted: bool) -> None:
+    raw_connection(conn).budgeted = budgeted
+
+
+class BudgetedConnection(asyncpg.Connection):
+    """Pool connection class applying the request's query budget
+
+    Only while `budgeted` is set, i.e. while an AutoConnection holds
+    it, so background tasks on the same pool aren't limited.
+    """
+
+    budgeted = False
+
+    def statement_timeout(self, query: str) -> float | None:
+        return query_budgets.count(query) if self.budgeted else None
+
+    async def apply_lock_timeout(self) -> None:
+        budget = query_budgets.current()
+        if budget is not None and budget.lock_timeout:
+            # Session level, RESET ALL on release puts it back
+            await super().execute(
+                f"SET lock_timeout = {int(budget.lock_timeout * 1000)}"
+            )
+
+    async def execute(self, query: str, *args, timeout=None) -> str:
+        timeout = timeout or self.statement_timeout(query)
+        with query_budgets.guard():
+            return await super().execute(query, *args, timeout=timeout)
+
+    async def executemany(self, command: str, args, *, timeout=None):
+        timeout = timeout or self.statement_timeout(command)
+        with query_budgets.guard():
+            return await super().executemany(command, args, timeout=timeout)
+
+    async def fetch(self, query, *args, timeout=None, **kwargs) -> list:
+        timeout = timeout or self.statement_timeout(query)
+        with query_budgets.guard():
+            return await super().fetch(
+                query, *args, timeout=timeout, **kwargs
+            )
+
+    async def fetchval(self, query, *args, timeout=None, **kwargs):
+        timeout = timeout or self.statement_timeout(query)
+        with query_budgets.guard():
+            return await super().fetchval(
+                query, *args, timeout=timeout, **kwargs
+            )
+
+    async def fetchrow(self, query, *args, timeout=None, **kwargs):
+        timeout = timeout or self.statement_timeout(query)
+        with query_budgets.guard():
+            return await super().fetchrow(
+                query, *args, timeout=timeout, **kwargs
+            )
@@ -74,13 +74,14 @@ def rate_limit(
             keys: list[str] = []
             argv: list[str] = [str(now)]
 
-            user_key = f"user:{user_id}:{f.__name__}:{user_window}"
+            # Both keys go to one script call, so they share a hash tag
+            user_key = f"user:{{{user_id}}}:{f.__name__}:{user_window}"
             keys.append(user_key)
             argv.extend([str(user_limit), str(user_window), str(uuid.uuid4())])
 
             if session_limit is not None and session_window is not None:
                 session_key = (
-                    f"session:{session_id}:{f.__name__}:"
+                    f"session:{{{user_id}}}:{session_id}:{f.__name__}:"
                     f"{session_window}"
                 )
                 keys.append(session_key)
@@ -0,0 +1,45 @@
+from abc import ABC, abstractmethod
+import hashlib
+import typing as t
+
+
+class Record(ABC):
+    """Base of slotted, frozen dataclasses kept in the cache
+
+    Subclasses are declared with `@dataclass(slots=True, frozen=True)`
+    and implement `_build_dict`. Its result is memoized in a slot that
+    is not a dataclass field, so it is neither pickled nor compared.
+
+    Records are pickled into Redis, which only works while the class
+    has the fields it had when the entry was written. `version` changes
+    with them, keys of cached records include it, so a deploy that adds
+    or removes a field doesn't read entries of the old layout.
+    """
+    __slots__ = ("_dict",)
+    version: t.ClassVar[str]
+
+    def __init_subclass__(cls, **kwargs: t.Any) -> None:
+        super().__init_subclass__(**kwargs)
+        fields = ",".join(
+            f"{name}:{annotation}"
+            for name, annotation in cls.__annotations__.items()
+        )
+        cls.version = hashlib.sha1(fields.encode()).hexdigest()[:8]
+
+    @abstractmethod
+    def _build_dict(self) -> dict[str, t.Any]:
+        ...
+
+    def to_dict(self) -> dict[str, t.Any]:
+        """Field values without `asdict()`'s recursive deep copy"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @property
+    def dict(self) -> dict[str, t.Any]:
+        try:
+            cached = self._dict
+        except AttributeError:
+            cached = self._build_dict()
+            object.__setattr__(self, "_dict", cached)
+        # Callers add keys to the result, the memoized one stays intact
+        return cached.copy()
@@ -0,0 +1,277 @@
+import asyncio
+from bisect import bisect
+import os
+import typing as t
+from redis.asyncio import Redis
+from redis.asyncio.cluster import ClusterNode, RedisCluster
+from redis.exceptions import RedisError
+import xxhash
+
+# "single", "sharded" (client-side consistent hashing) or "cluster"
+topology = os.getenv("REDIS_TOPOLOGY", "single")
+
+# Virtual points of every node on the hash ring
+RING_POINTS = 160
+
+
+def parse_nodes(value: str) -> list[tuple[str, int]]:
+    nodes = []
+    for node in value.split(","):
+        host, port = node.strip().rsplit(":", 1)
+        nodes.append((host, int(port)))
+    return nodes
+
+
+def hash_tag(key: str | bytes) -> bytes:
+    """Part of the key used for hashing, same rules as Redis Cluster
+
+    Keys that have to be used together (by a Lua script or a MULTI)
+    share a `{...}` tag, e.g. `user_profile:{123}:min`.
+    """
+    if isinstance(key, str):
+        key = key.encode()
+    start = key.find(b"{")
+    if start != -1:
+        end = key.find(b"}", start + 1)
+        if end > start + 1:
+            return key[start + 1:end]
+    return key
+
+
+def as_keys(value: t.Any) -> list[t.Any]:
+    """Keys of an argument that is a key, a list of keys or a mapping"""
+    if isinstance(value, (str, bytes)):
+        return [value]
+    return list(value)
+
+
+# Keys of commands that take more than one, by command. Without an
+# entry the first argument is the only key.
+MULTI_KEY_COMMANDS: dict[str, t.Callable[[tuple], list[t.Any]]] = {
+    **dict.fromkeys(
+        ("delete", "unlink", "exists", "touch", "pfcount", "pfmerge",
+         "watch"),
+        lambda args: list(args)
+    ),
+    **dict.fromkeys(
+        ("mget", "sinter", "sunion", "sdiff"),
+        lambda args: [*as_keys(args[0]), *args[1:]]
+    ),
+    **dict.fromkeys(
+        ("mset", "msetnx", "blpop", "brpop", "bzpopmin", "bzpopmax",
+         "zunion", "zinter", "zdiff"),
+        lambda args: as_keys(args[0])
+    ),
+    **dict.fromkeys(
+        ("rename", "renamenx", "copy", "smove", "rpoplpush", "lmove",
+         "blmove"),
+        lambda args: list(args[:2])
+    ),
+    **dict.fromkeys(
+        ("sinterstore", "sunionstore", "sdiffstore"),
+        lambda args: [args[0], *as_keys(args[1]), *args[2:]]
+    ),
+    **dict.fromkeys(
+        ("zunionstore", "zinterstore", "zdiffstore"),
+        lambda args: [args[0], *as_keys(args[1])]
+    ),
+}
+
+
+class ShardedPipeline:
+    """Pipeline that sends every command to the node owning its key"""
+
+    def __init__(self, client: "ShardedRedis", transaction: bool) -> None:
+        self.client = client
+        self.transaction = transaction
+        self.commands: list[tuple[int, str, tuple, dict]] = []
+
+    def __getattr__(self, name: str) -> t.Callable[..., "ShardedPipeline"]:
+        def command(*args: t.Any, **kwargs: t.Any) -> "ShardedPipeline":
+            node = self.client.command_node(name, args)
+            self.commands.append((node, name, args, kwargs))
+            return self
+        return command
+
+    async def execute(self) -> list[t.Any]:
+        positions: dict[int, list[int]] = {}
+        for position, (node, *_) in enumerate(self.commands):
+            positions.setdefault(node, []).append(position)
+
+        if self.transaction and len(positions) > 1:
+            raise RedisError("Transaction keys belong to different nodes")
+
+        pipes = {}
+        for node, indexes in positions.items():
+            pipe = self.client.nodes[node].pipeline(self.transaction)
+            for position in indexes:
+                _, name, args, kwargs = self.commands[position]
+                getattr(pipe, name)(*args, **kwargs)
+            pipes[node] = pipe
+
+        self.commands = []
+        results: list[t.Any] = [None] * sum(map(len, positions.values()))
+        node_results = await asyncio.gather(
+            *(pipe.execute() for pipe in pipes.values())
+        )
+        for node, values in zip(pipes, node_results):
+            for position, value in zip(positions[node], values):
+                results[position] = value
+        return results
+
+    async def __aenter__(self) -> "ShardedPipeline":
+        return self
+
+    async def __aexit__(self, *args: t.Any) -> None:
+        self.commands = []
+
+
+class ShardedRedis:
+    """Client-side sharding over independent Redis nodes
+
+    Single-key commands are routed with a consistent hash ring over the
+    key's hash tag, so adding a node moves only ~1/N of the keys.
+    DEL, UNLINK, EXISTS, TOUCH, MGET and MSET are split by node, other
+    multi-key commands (and all of them in pipelines) raise RedisError
+    unless their keys are on one node, e.g. by sharing a hash tag.
+    Pub/sub always uses the first node.
+    """
+
+    def __init__(self, nodes: list[tuple[str, int]]) -> None:
+        self.nodes = [Redis(host=host, port=port) for host, port in nodes]
+        ring = sorted(
+            (xxhash.xxh64_intdigest(f"{host}:{port}:{point}".encode()), index)
+            for index, (host, port) in enumerate(nodes)
+            for point in range(RING_POINTS)
+        )
+        self.ring_hashes = [hashed for hashed, _ in ring]
+        self.ring_nodes = [index for _, index in ring]
+
+    def node_index(self, key: str | bytes) -> int:
+        hashed = xxhash.xxh64_intdigest(hash_tag(key))
+        position = bisect(self.ring_hashes, hashed) % len(self.ring_hashes)
+        return self.ring_nodes[position]
+
+    def node(self, key: str | bytes) -> Redis:
+        return self.nodes[self.node_index(key)]
+
+    def command_node(self, name: str, args: tuple) -> int:
+        """Node of a command, all keys of multi-key ones have to be on it"""
+        keys = (
+            MULTI_KEY_COMMANDS[name](args) if name in MULTI_KEY_COMMANDS
+            else args[:1]
+        )
+        nodes = {self.node_index(key) for key in keys}
+        if len(nodes) > 1:
+            raise RedisError(
+                f"{name.upper()} keys belong to different nodes"
+            )
+        return nodes.pop()
+
+    def __getattr__(self, name: str) -> t.Callable[..., t.Any]:
+        def command(*args: t.Any, **kwargs: t.Any) -> t.Any:
+            node = self.nodes[self.command_node(name, args)]
+            return getattr(node, name)(*args, **kwargs)
+        return command
+
+    def pipeline(self, transaction: bool = True) -> ShardedPipeline:
+        return ShardedPipeline(self, transaction)
+
+    def by_node(self, keys: t.Iterable[t.Any]) -> dict[int, list[t.Any]]:
+        grouped: dict[int, list[t.Any]] = {}
+        for key in keys:
+            grouped.setdefault(self.node_index(key), []).append(key)
+        return grouped
+
+    async def count_keys(self, name: str, keys: tuple) -> int:
+        counts = await asyncio.gather(*(
+            getattr(self.nodes[node], name)(*node_keys)
+            for node, node_keys in self.by_node(keys).items()
+        ))
+        return sum(counts)
+
+    async def delete(self, *keys: str | bytes) -> int:
+        return await self.count_keys("delete", keys)
+
+    async def unlink(self, *keys: str | bytes) -> int:
+        return await self.count_keys("unlink", keys)
+
+    async def exists(self, *keys: str | bytes) -> int:
+        return await self.count_keys("exists", keys)
+
+    async def touch(self, *keys: str | bytes) -> int:
+        return await self.count_keys("touch", keys)
+
+    async def mget(self, keys: t.Any, *args: t.Any) -> list[t.Any]:
+        keys = [*as_keys(keys), *args]
+        grouped = self.by_node(keys)
+        results = await asyncio.gather(*(
+            self.nodes[node].mget(node_keys)
+            for node, node_keys in grouped.items()
+        ))
+        values = {}
+        for node_keys, node_values in zip(grouped.values(), results):
+            values.update(zip(node_keys, node_values))
+        return [values[key] for key in keys]
+
+    async def mset(self, mapping: t.Mapping[t.Any, t.Any]) -> bool:
+        results = await asyncio.gather(*(
+            self.nodes[node].mset({key: mapping[key] for key in node_keys})
+            for node, node_keys in self.by_node(mapping).items()
+        ))
+        return all(results)
+
+    async def evalsha(
+        self, sha: str, numkeys: int, *keys_and_args: t.Any
+    ) -> t.Any:
+        keys = keys_and_args[:numkeys]
+        nodes = {self.node_index(key) for key in keys}
+        if len(nodes) > 1:
+            raise RedisError("Script keys belong to different nodes")
+        node = self.nodes[nodes.pop() if nodes else 0]
+        return await node.evalsha(sha, numkeys, *keys_and_args)
+
+    async def script_load(self, script: str) -> str:
+        shas = await asyncio.gather(
+            *(node.script_load(script) for node in self.nodes)
+        )
+        return shas[0]
+
+    async def xreadgroup(
+        self, groupname: str, consumername: str,
+        streams: dict, **kwargs: t.Any
+    ) -> t.Any:
+        node = self.node(next(iter(streams)))
+        return await node.xreadgroup(
+            groupname, consumername, streams, **kwargs
+        )
+
+    async def publish(self, channel: str, message: t.Any) -> int:
+        return await self.nodes[0].publish(channel, message)
+
+    def pubsub(self, **kwargs: t.Any) -> t.Any:
+        return self.nodes[0].pubsub(**kwargs)
+
+    async def aclose(self) -> None:
+        await asyncio.gather(*(node.aclose() for node in self.nodes))
+
+
+type RedisClient = Redis | RedisCluster | ShardedRedis
+
+
+def create_redis() -> RedisClient:
+    nodes = parse_nodes(os.getenv("REDIS_NODES") or (
+        f"{os.environ["REDIS_HOST"]}:{os.environ["REDIS_PORT"]}"
+    ))
+
+    if topology == "sharded":
+        return ShardedRedis(nodes)
+    elif topology == "cluster":
+        return RedisCluster(startup_nodes=[
+            ClusterNode(host, port) for host, port in nodes
+        ])
+    elif topology == "single":
+        host, port = nodes[0]
+        return Redis(host=host, port=port)
+
+    raise ValueError(f"Unknown REDIS_TOPOLOGY: {topology}")
@@ -0,0 +1,176 @@
+import asyncio
+import itertools
+import os
+import re
+import time
+import typing as t
+import asyncpg
+from redis.exceptions import RedisError
+from core import _logger
+import state
+
+# Replicas lagging more than this (seconds) are skipped
+replica_max_lag = float(os.getenv("DB_REPLICA_MAX_LAG", "1"))
+# How long reads of a user stay on the primary after their write,
+# has to be longer than the allowed lag
+replica_sticky = int(os.getenv("DB_REPLICA_STICKY", "5"))
+REPLICA_CHECK_INTERVAL = 1
+
+# Writes of every worker are announced here, each worker keeps the
+# users that wrote within `replica_sticky` seconds
+STICKY_CHANNEL = "db_primary"
+
+# Zero while the replica has replayed everything it received, so an
+# idle primary doesn't look like lag
+LAG_QUERY = """
+SELECT CASE
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END
+"""
+
+# Errors after which a read is retried on the primary
+REPLICA_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.InterfaceError,
+    asyncpg.ReadOnlySQLTransactionError
+)
+
+_read_re = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+_write_re = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|MERGE|FOR\s+(NO\s+KEY\s+)?UPDATE"
+    r"|FOR\s+(KEY\s+)?SHARE|NEXTVAL|SETVAL)\b",
+    re.IGNORECASE
+)
+
+
+def is_read_only(query: str) -> bool:
+    return (
+        _read_re.match(query) is not None
+        and _write_re.search(query) is None
+    )
+
+
+class Replicas:
+    """Read replica pools with their replication lag
+
+    Lag is polled by `monitor`. A replica that fails the check or
+    lags more than `replica_max_lag` isn't picked until it recovers,
+    so reads fall back to the primary.
+
+    Users that just wrote are tracked in memory from STICKY_CHANNEL,
+    so checking a read costs no Redis round trip. While the channel
+    isn't followed, and for `replica_sticky` seconds after joining it
+    again, every user counts as sticky.
+    """
+
+    def __init__(self) -> None:
+        self.pools: list[asyncpg.Pool] = []
+        self.lag: list[float | None] = []
+        self.fallbacks = 0
+        self.sticky: dict[str, float] = {}
+        self._listening_since: float | None = None
+        self._next = itertools.count()
+
+    def add(self, pool: asyncpg.Pool) -> None:
+        self.pools.append(pool)
+        self.lag.append(None)
+
+    def pick(self) -> asyncpg.Pool | None:
+        healthy = [
+            pool for pool, lag in zip(self.pools, self.lag)
+            if lag is not None and lag <= replica_max_lag
+        ]
+        if not healthy:
+            return None
+        return healthy[next(self._next) % len(healthy)]
+
+    def mark_failed(self, pool: asyncpg.Pool) -> None:
+        self.fallbacks += 1
+        if pool in self.pools:
+            self.lag[self.pools.index(pool)] = None
+
+    async def check(self, index: int) -> None:
+        try:
+            lag = await self.pools[index].fetchval(
+                LAG_QUERY, timeout=REPLICA_CHECK_INTERVAL
+            )
+            self.lag[index] = float(lag or 0)
+        except REPLICA_ERRORS as e:
+            if self.lag[index] is not None:
+                _logger.warning(f"Replica {index} is unavailable: {e}")
+            self.lag[index] = None
+
+    async def monitor(self) -> None:
+        if self.pools:
+            asyncio.create_task(self.sticky_listener())
+        while self.pools:
+            await asyncio.gather(
+                *(self.check(i) for i in range(len(self.pools)))
+            )
+            now = time.monotonic()
+            for user_id, until in list(self.sticky.items()):
+                if until <= now:
+                    del self.sticky[user_id]
+            await asyncio.sleep(REPLICA_CHECK_INTERVAL)
+
+    async def sticky_listener(self) -> None:
+        while True:
+            pubsub = state.redis.pubsub()
+            try:
+                await pubsub.subscribe(STICKY_CHANNEL)
+                self._listening_since = time.monotonic()
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.mark_sticky(message["data"].decode())
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                if isinstance(e, (RedisError, OSError)):
+                    _logger.warning(f"Replica sticky listener failed: {e}")
+                else:
+                    _logger.exception(e)
+            finally:
+                self._listening_since = None
+                await pubsub.aclose()
+            await asyncio.sleep(5)
+
+    def mark_sticky(self, user_id: str) -> None:
+        self.sticky[user_id] = time.monotonic() + replica_sticky
+
+    def is_sticky(self, user_id: str | None) -> bool:
+        if user_id is None:
+            return False
+        now = time.monotonic()
+        # Writes announced before joining the channel were missed
+        if (
+            self._listening_since is None
+            or now - self._listening_since < replica_sticky
+        ):
+            return True
+        return self.sticky.get(user_id, 0) > now
+
+    async def stick(self, user_id: str | None) -> None:
+        if user_id is None:
+            return
+        self.mark_sticky(user_id)
+        try:
+            await state.redis.publish(STICKY_CHANNEL, user_id)
+        except RedisError:
+            pass
+
+    async def close(self) -> None:
+        await asyncio.gather(*(pool.close() for pool in self.pools))
+
+    @property
+    def stats(self) -> dict[str, t.Any]:
+        return {
+            "replicas": len(self.pools),
+            "lag": self.lag,
+            "fallbacks": self.fallbacks
+        }
+
+
+replicas = Replicas()
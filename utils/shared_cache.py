@@ -0,0 +1,169 @@
+import fcntl
+import mmap
+import os
+import pickle
+import struct
+import time
+import typing as t
+import xxhash
+
+# Bumped when the slot layout or payload format changes
+VERSION = 1
+
+# Slot header: sequence, key hash, expire time, payload length
+SLOT_HEADER = struct.Struct("<QQdI")
+SLOT_HEADER_SIZE = 32
+
+# Slots checked for every key (one bucket)
+WAYS = 4
+READ_RETRIES = 3
+
+
+def key_hash(key: str) -> int:
+    # 0 marks an empty slot
+    return xxhash.xxh64_intdigest(key.encode()) or 1
+
+
+class SharedCache:
+    """Host-local cache shared between workers through a mmap'ed file
+
+    The file is a hash table of fixed-size slots grouped in buckets of
+    `WAYS`. Every slot is guarded by a seqlock: writers take a `lockf`
+    lock on the slot and bump the sequence before and after writing,
+    readers never lock and retry if the sequence was odd or changed
+    while they copied the slot.
+    """
+
+    def __init__(
+        self, path: str,
+        slots: int = 16384,
+        slot_size: int = 4096
+    ) -> None:
+        self.slots = slots - slots % WAYS
+        self.slot_size = slot_size
+        self.buckets = self.slots // WAYS
+        self.max_payload = slot_size - SLOT_HEADER_SIZE
+        self.too_large = 0
+
+        # Workers with other settings never share (and resize) a file
+        self.path = f"{path}.v{VERSION}.{self.slots}x{slot_size}"
+        size = self.slots * self.slot_size
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+
+        fcntl.lockf(self.fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self.fd).st_size != size:
+                os.ftruncate(self.fd, size)
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN)
+
+        self.mm = mmap.mmap(self.fd, size, mmap.MAP_SHARED)
+
+    def _offset(self, slot: int) -> int:
+        return slot * self.slot_size
+
+    def _bucket(self, hashed: int) -> range:
+        first = (hashed % self.buckets) * WAYS
+        return range(first, first + WAYS)
+
+    def _read_slot(
+        self, slot: int
+    ) -> tuple[int, float, bytes] | None:
+        offset = self._offset(slot)
+        for _ in range(READ_RETRIES):
+            seq, hashed, expire, length = SLOT_HEADER.unpack_from(
+                self.mm, offset
+            )
+            if seq & 1:
+                continue
+            payload = self.mm[
+                offset + SLOT_HEADER_SIZE:
+                offset + SLOT_HEADER_SIZE + min(length, self.max_payload)
+            ]
+            if SLOT_HEADER.unpack_from(self.mm, offset)[0] == seq:
+                return hashed, expire, payload
+        return None
+
+    def _write_slot(
+        self, slot: int, hashed: int,
+        expire: float, payload: bytes
+    ) -> None:
+        offset = self._offset(slot)
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, self.slot_size, offset)
+        try:
+            seq = SLOT_HEADER.unpack_from(self.mm, offset)[0]
+            SLOT_HEADER.pack_into(self.mm, offset, seq + 1, 0, 0.0, 0)
+            self.mm[
+                offset + SLOT_HEADER_SIZE:
+                offset + SLOT_HEADER_SIZE + len(payload)
+            ] = payload
+            SLOT_HEADER.pack_into(
+                self.mm, offset, seq + 2, hashed, expire, len(payload)
+            )
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, self.slot_size, offset)
+
+    def get(self, key: str) -> t.Any | None:
+        hashed = key_hash(key)
+        now = time.time()
+        for slot in self._bucket(hashed):
+            result = self._read_slot(slot)
+            if result is None or result[0] != hashed:
+                continue
+            _, expire, payload = result
+            if now >= expire:
+                return None
+            stored_key, value = pickle.loads(payload)
+            if stored_key == key:
+                return value
+        return None
+
+    def set(self, key: str, value: t.Any, timeout: float) -> None:
+        payload = pickle.dumps((key, value), pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.max_payload:
+            self.too_large += 1
+            return
+
+        hashed = key_hash(key)
+        now = time.time()
+        target: int | None = None
+        soonest = float("inf")
+        for slot in self._bucket(hashed):
+            offset = self._offset(slot)
+            _, slot_hash, expire, _ = SLOT_HEADER.unpack_from(
+                self.mm, offset
+            )
+            if slot_hash == hashed or slot_hash == 0 or expire <= now:
+                target = slot
+                break
+            if expire < soonest:
+                target, soonest = slot, expire
+
+        if target is not None:
+            self._write_slot(target, hashed, now + timeout, payload)
+
+    def delete(self, key: str) -> None:
+        hashed = key_hash(key)
+        for slot in self._bucket(hashed):
+            offset = self._offset(slot)
+            if SLOT_HEADER.unpack_from(self.mm, offset)[1] == hashed:
+                self._write_slot(slot, 0, 0.0, b"")
+
+    def usage(self) -> dict[str, int]:
+        now = time.time()
+        used = 0
+        for slot in range(self.slots):
+            _, hashed, expire, _ = SLOT_HEADER.unpack_from(
+                self.mm, self._offset(slot)
+            )
+            if hashed and expire > now:
+                used += 1
+        return {
+            "slots": self.slots,
+            "used": used,
+            "too_large": self.too_large
+        }
+
+    def close(self) -> None:
+        self.mm.close()
+        os.close(self.fd)
@@ -0,0 +1,160 @@
+import asyncio
+import os
+import random
+import re
+import time
+import typing as t
+import asyncpg
+import orjson
+import xxhash
+from quart import request, has_request_context
+from core import _logger
+from utils.pool_budget import pool_budget
+from utils.replicas import is_read_only
+import state
+
+# Statements slower than this (milliseconds) are logged
+slow_query_ms = float(os.getenv("SLOW_QUERY_MS", "200"))
+# Share of slow read-only statements that get an EXPLAIN ANALYZE,
+# at most one per fingerprint every SLOW_QUERY_EXPLAIN_INTERVAL seconds
+explain_sample = float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE", "0.1"))
+explain_interval = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "300"))
+EXPLAIN_TIMEOUT = "10s"
+MAX_FINGERPRINTS = 256
+
+_literal_re = re.compile(
+    r"'(?:[^']|'')*'|(?<![$\w])\d+(?:\.\d+)?\b|\bTRUE\b|\bFALSE\b",
+    re.IGNORECASE
+)
+_space_re = re.compile(r"\s+")
+
+
+def normalize(query: str) -> str:
+    """Query text with literals replaced, same for every call site"""
+    return _space_re.sub(" ", _literal_re.sub("?", query)).strip()
+
+
+def redact(args: t.Iterable[t.Any]) -> list[str]:
+    redacted = []
+    for arg in args:
+        if arg is None or isinstance(arg, bool):
+            redacted.append(repr(arg))
+        elif isinstance(arg, (str, bytes, list, tuple)):
+            redacted.append(f"<{type(arg).__name__}:{len(arg)}>")
+        else:
+            redacted.append(f"<{type(arg).__name__}>")
+    return redacted
+
+
+class SlowQueryLog:
+    """Logs statements above `slow_query_ms` by fingerprint
+
+    Text statements are reported by the asyncpg query logger added to
+    every pool connection, prepared ones by the query catalog. Plans
+    are captured in background on a separate connection, inside a
+    read-only transaction, so they never change data.
+    """
+
+    def __init__(self) -> None:
+        self.fingerprints: dict[str, dict[str, t.Any]] = {}
+        self._explained: dict[str, float] = {}
+
+    async def attach(self, conn: asyncpg.Connection) -> None:
+        """Pool `init` callback"""
+        conn.add_query_logger(self.on_query)
+
+    def on_query(self, record: t.Any) -> None:
+        if record.exception is None:
+            self.observe(record.query, record.args, record.elapsed)
+
+    def observe(
+        self, query: str, args: t.Sequence[t.Any], elapsed: float
+    ) -> None:
+        took = elapsed * 1000
+        if took < slow_query_ms or query.startswith("EXPLAIN"):
+            return
+
+        normalized = normalize(query)
+        fingerprint = xxhash.xxh64(normalized.encode()).hexdigest()
+        endpoint = request.endpoint if has_request_context() else None
+
+        stats = self.fingerprints.get(fingerprint)
+        if stats is None:
+            if len(self.fingerprints) >= MAX_FINGERPRINTS:
+                fastest = min(
+                    self.fingerprints,
+                    key=lambda k: self.fingerprints[k]["max_ms"]
+                )
+                del self.fingerprints[fastest]
+            stats = self.fingerprints[fingerprint] = {
+                "query": normalized[:500],
+                "count": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "endpoints": []
+            }
+        stats["count"] += 1
+        stats["total_ms"] += took
+        stats["max_ms"] = max(stats["max_ms"], took)
+        if endpoint and endpoint not in stats["endpoints"]:
+            stats["endpoints"].append(endpoint)
+
+        _logger.warning(
+            f"Slow query {fingerprint} took {took:.0f}ms at {endpoint}: "
+            f"{normalized[:500]} args={redact(args)}"
+        )
+
+        if self.should_explain(fingerprint, query):
+            asyncio.create_task(self.explain(fingerprint, query, args))
+
+    def should_explain(self, fingerprint: str, query: str) -> bool:
+        if random.random() >= explain_sample or not is_read_only(query):
+            return False
+        now = time.monotonic()
+        if now - self._explained.get(fingerprint, -explain_interval) \
+                < explain_interval:
+            return False
+        self._explained[fingerprint] = now
+        return True
+
+    async def explain(
+        self, fingerprint: str, query: str, args: t.Sequence[t.Any]
+    ) -> None:
+        await pool_budget.acquire()
+        try:
+            async with state.pool.acquire() as db:
+                transaction = db.transaction(readonly=True)
+                await transaction.start()
+                try:
+                    await db.execute(
+                        f"SET LOCAL statement_timeout = '{EXPLAIN_TIMEOUT}'"
+                    )
+                    plan = await db.fetchval(
+                        "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query,
+                        *args
+                    )
+                finally:
+                    await transaction.rollback()
+        except (asyncpg.PostgresError, OSError) as e:
+            _logger.warning(f"EXPLAIN of {fingerprint} failed: {e}")
+            return
+        finally:
+            await pool_budget.release()
+
+        # EXPLAIN's JSON output is decoded by the pool's json codec
+        plan = plan[0]
+        stats = self.fingerprints.get(fingerprint)
+        if stats is not None:
+            stats["last_plan_ms"] = plan.get("Execution Time")
+        _logger.warning(
+            f"Plan of slow query {fingerprint}: {orjson.dumps(plan).decode()}"
+        )
+
+    def top(self, count: int = 10) -> list[dict[str, t.Any]]:
+        return sorted(
+            ({"fingerprint": k, **v} for k, v in self.fingerprints.items()),
+            key=lambda v: v["total_ms"], reverse=True
+        )[:count]
+
+
+slow_queries = SlowQueryLog()
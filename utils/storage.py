@@ -7,6 +7,7 @@ import orjson
 import os
 import typing as t
 from utils.database import AutoConnection
+from utils.codecs import unix_time
 from core import FunctionError
 from utils.generation import generate_id
 import aiohttp
@@ -210,7 +211,7 @@ async def get_context(
     return {
         "user_id": row["user_id"],
         "objects": row["objects"],
-        "created_at": int(row["created_at"].timestamp()),
+        "created_at": unix_time(row["created_at"]),
         "type": row["type"]
     }
 
@@ -1,17 +1,19 @@
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 from datetime import datetime
 from utils.generation import parse_id
 from core import FunctionError
-from utils.database import AutoConnection
+from utils.database import AutoConnection, pending_count
+from utils.queries import catalog
 import typing as t
 from schemas import FollowedList, FavoriteList, ReactionList
 from schemas import FollowedItem, FavoriteItem, ReactionItem
 import utils.storage as storage
+from utils.records import Record
 from enum import IntFlag, auto
 
 
-@dataclass
-class User:
+@dataclass(slots=True, frozen=True)
+class User(Record):
     user_id: str
     username: str
     role_id: int = 0
@@ -25,16 +27,11 @@ class User:
     languages: list[str] | None = None
 
     @property
-    def created_at(self):
-        try:
-            return self._created_at
-        except AttributeError:
-            self._created_at = int(parse_id(self.user_id)[0])
-            return self._created_at
+    def created_at(self) -> int:
+        return int(parse_id(self.user_id)[0])
 
-    @property
-    def dict(self) -> dict[str, t.Any]:
-        _dict = asdict(self)
+    def _build_dict(self) -> dict[str, t.Any]:
+        _dict = self.to_dict()
         _dict["created_at"] = self.created_at
         return {key: value for key, value in _dict.items()
                 if value is not None}
@@ -89,29 +86,34 @@ def permissions_to_list(perms: Permission) -> list[str]:
     ]
 
 
-async def get_user(
-    user_id: str, conn: AutoConnection,
+ROLE_PERMISSIONS = {
+    role_id: permissions_to_list(perms)
+    for role_id, perms in ROLES.items()
+}
+
+
+def user_query(
+    where: str = "",
     minimize_info: bool = False
-) -> User:
-    db = await conn.create_conn()
+) -> str:
     query = f"""
         SELECT u.user_id, u.username, p.display_name, u.role_id,
                ac.objects[1] as avatar_url
                {", bc.objects[1] as banner_url, p.bio, p.badges, p.languages"
-                ", u.following_count, u.followers_count"
+                f", {pending_count('u.following_count', 'user', 'u.user_id')}"
+                f", {pending_count('u.followers_count', 'user', 'u.user_id')}"
                 if not minimize_info else ""}
         FROM users u
         LEFT JOIN user_profiles p ON u.user_id = p.user_id
         LEFT JOIN files ac ON ac.context_id = p.avatar_context_id
         {"LEFT JOIN files bc ON bc.context_id = p.banner_context_id"
          if not minimize_info else ""}
-        WHERE u.user_id = $1;
+        {where}
     """
-    row = await db.fetchrow(query, user_id)
+    return query
 
-    if row is None:
-        raise FunctionError("USER_DOES_NOT_EXIST", 404, None)
 
+def build_user(row: t.Mapping) -> User:
     _dict = dict(row)
     for name in ("avatar_url", "banner_url"):
         if _dict.get(name) and "://" not in str(_dict[name]):
@@ -120,19 +122,57 @@ async def get_user(
     return User.from_dict(_dict)
 
 
+USER_BY_ID = {
+    minimize_info: catalog.add(
+        f"users.by_id{":min" if minimize_info else ""}",
+        user_query("WHERE u.user_id = $1", minimize_info),
+        hot=True
+    )
+    for minimize_info in (False, True)
+}
+USERS_BY_IDS = {
+    minimize_info: catalog.add(
+        f"users.by_ids{":min" if minimize_info else ""}",
+        user_query("WHERE u.user_id = ANY($1::text[])", minimize_info)
+    )
+    for minimize_info in (False, True)
+}
+USER_ROLE = catalog.add("users.role", """
+    SELECT role_id
+    FROM users
+    WHERE user_id = $1
+""", hot=True)
+
+
+async def get_user(
+    user_id: str, conn: AutoConnection,
+    minimize_info: bool = False
+) -> User:
+    db = await conn.create_conn()
+    row = await catalog.fetchrow(db, USER_BY_ID[minimize_info], user_id)
+
+    if row is None:
+        raise FunctionError("USER_DOES_NOT_EXIST", 404, None)
+
+    return build_user(row)
+
+
+async def get_users(
+    user_ids: list[str], conn: AutoConnection,
+    minimize_info: bool = False
+) -> list[User]:
+    db = await conn.create_conn()
+    rows = await catalog.fetch(db, USERS_BY_IDS[minimize_info], user_ids)
+    return [build_user(row) for row in rows]
+
+
 async def check_permission(
     user_id: str,
     perm: Permission,
     conn: AutoConnection
 ) -> bool:
     db = await conn.create_conn()
-    value = await db.fetchval(
-        """
-        SELECT role_id
-        FROM users
-        WHERE user_id = $1
-        """, user_id
-    )
+    value = await catalog.fetchval(db, USER_ROLE, user_id)
 
     if value not in ROLES:
         return False
@@ -336,26 +376,32 @@ async def is_followed(
     return row is not None
 
 
+# Keyset cursors need the full precision of created_at, whether or not
+# timestamps are decoded to unix seconds (utils/codecs.py)
+CURSOR_AT = """
+    to_char(created_at AT TIME ZONE 'UTC',
+            'YYYY-MM-DD"T"HH24:MI:SS.US"+00:00"') AS cursor_at
+"""
+
+
 async def get_followed(
     user_id: str, conn: AutoConnection,
     cursor: str | None = None
 ) -> FollowedList:
     db = await conn.create_conn()
-    query = """
-        SELECT followed_to, created_at
+    query = f"""
+        SELECT followed_to, created_at, {CURSOR_AT}
         FROM followed WHERE user_id = $1
     """
     params: list[t.Any] = [user_id]
 
     if cursor:
-        query += (
-            " AND (created_at < $2 OR (created_at = $2 and followed_to < $3))"
-        )
+        query += " AND (created_at, followed_to) < ($2, $3)"
         post_id, _date = cursor.split("_")
         date = datetime.fromisoformat(_date.replace('Z', '+00:00'))
         params.extend([date, post_id])
 
-    query += " ORDER BY created_at DESC LIMIT 21"
+    query += " ORDER BY created_at DESC, followed_to DESC LIMIT 21"
 
     rows = await db.fetch(query, *params)
     if not rows:
@@ -375,7 +421,7 @@ async def get_followed(
     last_row = rows[-1]
 
     next_cursor = (
-        f"{last_row["followed_to"]}_{last_row["created_at"].isoformat()}"
+        f"{last_row["followed_to"]}_{last_row["cursor_at"]}"
         if rows else None
     )
 
@@ -392,14 +438,14 @@ async def get_favorites(
     type: t.Literal["posts", "comments"] | None = None
 ) -> FavoriteList:
     db = await conn.create_conn()
-    query = """
-        SELECT post_id, comment_id, created_at
+    query = f"""
+        SELECT post_id, comment_id, {CURSOR_AT}
         FROM favorites WHERE user_id = $1
     """
     params: list[t.Any] = [user_id]
 
     if cursor:
-        query += " AND (created_at < $2 OR (created_at = $2 AND post_id < $3))"
+        query += " AND (created_at, post_id) < ($2, $3)"
         post_id, _date = cursor.split("_")
         date = datetime.fromisoformat(_date.replace('Z', '+00:00'))
         params.extend([date, post_id])
@@ -409,7 +455,7 @@ async def get_favorites(
     elif type == "comments":
         query += " AND comment_id IS NOT NULL"
 
-    query += " ORDER BY created_at DESC LIMIT 21"
+    query += " ORDER BY created_at DESC, post_id DESC LIMIT 21"
 
     rows = await db.fetch(query, *params)
     if not rows:
@@ -422,7 +468,7 @@ async def get_favorites(
         FavoriteItem({
             "post_id": row["post_id"],
             "comment_id": row["comment_id"],
-            "created_at": row["created_at"].isoformat(),
+            "created_at": row["cursor_at"],
         })
         for row in rows
     ]
@@ -430,7 +476,7 @@ async def get_favorites(
     last_row = rows[-1]
 
     next_cursor = (
-        f"{last_row["post_id"]}_{last_row["created_at"].isoformat()}"
+        f"{last_row["post_id"]}_{last_row["cursor_at"]}"
         if rows else None
     )
 
@@ -448,14 +494,14 @@ async def get_reactions(
     is_like: bool | None = None
 ) -> ReactionList:
     db = await conn.create_conn()
-    query = """
-        SELECT post_id, comment_id, created_at, is_like
+    query = f"""
+        SELECT post_id, comment_id, is_like, {CURSOR_AT}
         FROM reactions WHERE user_id = $1
     """
     params: list[t.Any] = [user_id]
 
     if cursor:
-        query += " AND (created_at < $2 OR (created_at = $2 AND post_id < $3))"
+        query += " AND (created_at, post_id) < ($2, $3)"
         post_id, _date = cursor.split("_")
         date = datetime.fromisoformat(_date.replace('Z', '+00:00'))
         params.extend([date, post_id])
@@ -469,7 +515,7 @@ async def get_reactions(
         query += f" AND is_like = ${len(params) + 1}"
         params.append(is_like)
 
-    query += " ORDER BY created_at DESC LIMIT 21"
+    query += " ORDER BY created_at DESC, post_id DESC LIMIT 21"
 
     rows = await db.fetch(query, *params)
     if not rows:
@@ -482,7 +528,7 @@ async def get_reactions(
         ReactionItem({
             "post_id": row["post_id"],
             "comment_id": row["comment_id"],
-            "created_at": row["created_at"].isoformat(),
+            "created_at": row["cursor_at"],
             "is_like": row["is_like"]
         })
         for row in rows
@@ -491,7 +537,7 @@ async def get_reactions(
     last_row = rows[-1]
 
     next_cursor = (
-        f"{last_row["post_id"]}_{last_row["created_at"].isoformat()}"
+        f"{last_row["post_id"]}_{last_row["cursor_at"]}"
         if rows else None
     )
 
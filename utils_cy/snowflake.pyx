@@ -1,4 +1,4 @@
-from libc.time cimport time
+from posix.time cimport clock_gettime, timespec, CLOCK_REALTIME
 cdef extern from "pthread.h":
     ctypedef struct pthread_mutex_t:
         pass
@@ -9,7 +9,9 @@ cdef extern from "pthread.h":
 from typing import Tuple, Union
 
 cdef long get_current_time_ms() nogil:
-    return <long>(time(NULL) * 1000)
+    cdef timespec now
+    clock_gettime(CLOCK_REALTIME, &now)
+    return <long>now.tv_sec * 1000 + now.tv_nsec // 1000000
 
 from core import get_proc_identity
 
@@ -63,7 +65,9 @@ cdef class SnowflakeGeneration:
         cdef long ts = <long>(get_current_time_ms()) - self.epoch
 
         if ts == self.last_timestamp:
-            if self.counter.increment() == (1 << cb):
+            # The counter has 1 << cb values, the next one waits for
+            # the next millisecond
+            if self.counter.increment() == (1 << cb) - 1:
                 self.counter = AtomicLong()
                 with nogil:
                     while ts <= self.last_timestamp: